@@ -0,0 +1,296 @@
+"""
+Local stand-in for Google News and the publishers behind it.
+
+/rss/search answers every query with a synthetic Google News feed. Entry ids
+use the legacy base64 format, so the fetcher decodes them to article URLs on
+the same machine. The articles are spread over several loopback addresses
+(127.0.0.1, 127.0.0.2, ...), so politeness treats them as separate publishers.
+Latency, server errors and 429 responses can be injected to see how the
+pipeline copes.
+
+    python -m benchmarks.fake_news_server --articles 500 --latency 0.05
+"""
+import argparse
+import base64
+import email.utils
+import hashlib
+import http.server
+import json
+import random
+import threading
+import time
+import urllib.parse
+from xml.sax.saxutils import escape
+
+WORDS = (
+    "market shares investors growth quarter report company government minister "
+    "election policy court ruling city council officials statement according "
+    "analysts economy inflation prices energy climate research university study "
+    "health hospital patients technology software security data network service "
+    "workers union agreement talks ceasefire region border police investigation "
+    "weather storm season league match team coach players record season final"
+).split()
+ENTRIES_PER_FEED = 40
+ARTICLE_COUNT = 1000
+ARTICLE_HOSTS = 20
+PARAGRAPHS_PER_ARTICLE = 8
+# Share of articles repeating the title and text of an earlier one under
+# another publisher, like the syndicated copies real feeds carry
+SYNDICATED_SHARE = 0.1
+
+
+def encode_article_id(url):
+    """
+    Args:
+        url: article URL
+
+    Returns:
+        entry id in the legacy Google News format embedding url
+    """
+    payload = b"\x08\x13\x22" + bytes([len(url) % 256]) + url.encode()
+    payload += b"\xd2\x01\x00"
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def sentence(rng, words=12):
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+class FakeNewsServer:
+    """
+    Serves feeds from the first loopback address and articles from
+    article_hosts addresses, each on its own port. Content is generated from
+    seed, so every run sees the same feeds and articles.
+    """
+
+    def __init__(
+        self,
+        articles=ARTICLE_COUNT,
+        article_hosts=ARTICLE_HOSTS,
+        entries_per_feed=ENTRIES_PER_FEED,
+        latency=0.0,
+        error_rate=0.0,
+        throttle_rate=0.0,
+        seed=0,
+    ) -> None:
+        """
+        Args:
+            articles: size of the article corpus
+            article_hosts: loopback addresses the articles are spread over
+            entries_per_feed: entries in every feed response
+            latency: seconds added to every response
+            error_rate: share of requests answered with a 500
+            throttle_rate: share of requests answered with a 429
+            seed: seed of the generated content and injected failures
+        """
+        self.articles = articles
+        self.article_hosts = article_hosts
+        self.entries_per_feed = entries_per_feed
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.servers = []
+        self.requests_served = 0
+
+    @property
+    def rss_base_url(self):
+        host, port = self.servers[0].server_address[:2]
+        return f"http://{host}:{port}/rss"
+
+    def article_url(self, index):
+        host, port = self.servers[index % len(self.servers)].server_address[:2]
+        return f"http://{host}:{port}/article/{index}"
+
+    def article_urls(self):
+        return [self.article_url(i) for i in range(self.articles)]
+
+    def start(self):
+        handler = self.make_handler()
+        for i in range(self.article_hosts):
+            address = (f"127.0.0.{i + 1}", 0)
+            server = http.server.ThreadingHTTPServer(address, handler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            self.servers.append(server)
+        return self
+
+    def stop(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        self.servers = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+        return False
+
+    def injected_failure(self):
+        """
+        Returns:
+            status to answer with instead of the content, None for none
+        """
+        with self.rng_lock:
+            self.requests_served += 1
+            draw = self.rng.random()
+        if draw < self.error_rate:
+            return 500
+        if draw < self.error_rate + self.throttle_rate:
+            return 429
+        return None
+
+    def story_of(self, index):
+        """
+        Args:
+            index: article index
+
+        Returns:
+            index of the article whose title and text the article carries;
+            syndicated copies point at an earlier article
+        """
+        rng = random.Random(f"{self.seed}-story-{index}")
+        while index > 0 and rng.random() < SYNDICATED_SHARE:
+            index = rng.randrange(index)
+        return index
+
+    def article_title(self, index):
+        rng = random.Random(f"{self.seed}-title-{self.story_of(index)}")
+        return sentence(rng, words=8)[:-1]
+
+    def feed(self, query):
+        digest = hashlib.sha256(f"{self.seed}-{query}".encode()).digest()
+        rng = random.Random(digest)
+        count = min(self.entries_per_feed, self.articles)
+        items = []
+        for index in rng.sample(range(self.articles), count):
+            url = self.article_url(index)
+            entry_id = encode_article_id(url)
+            publisher = f"Publisher {index % self.article_hosts}"
+            published = email.utils.formatdate(
+                time.time() - rng.randrange(30 * 86400), usegmt=True
+            )
+            items.append(
+                "<item>"
+                f"<title>{escape(self.article_title(index))} - {publisher}</title>"
+                f"<link>{self.rss_base_url}/articles/{entry_id}?oc=5</link>"
+                f'<guid isPermaLink="false">{entry_id}</guid>'
+                f"<pubDate>{published}</pubDate>"
+                f'<source url="{self.article_url(index)}">{publisher}</source>'
+                "</item>"
+            )
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<rss version="2.0"><channel>'
+            f"<title>{escape(query)} - Google News</title>"
+            + "".join(items)
+            + "</channel></rss>"
+        )
+
+    def article(self, index):
+        rng = random.Random(f"{self.seed}-article-{self.story_of(index)}")
+        title = self.article_title(index)
+        paragraphs = "".join(
+            f"<p>{' '.join(sentence(rng) for _ in range(5))}</p>"
+            for _ in range(PARAGRAPHS_PER_ARTICLE)
+        )
+        published = time.strftime(
+            "%Y-%m-%dT%H:%M:%SZ",
+            time.gmtime(time.time() - rng.randrange(30 * 86400)),
+        )
+        return (
+            "<!DOCTYPE html><html><head>"
+            f"<title>{escape(title)}</title>"
+            f'<meta name="description" content="{escape(sentence(rng))}">'
+            f'<meta property="article:published_time" content="{published}">'
+            "</head><body><nav><a href='/'>Home</a></nav>"
+            f"<article><h1>{escape(title)}</h1>{paragraphs}</article>"
+            "<footer>Copyright</footer></body></html>"
+        )
+
+    def make_handler(self):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if server.latency:
+                    time.sleep(server.latency)
+                parsed = urllib.parse.urlsplit(self.path)
+                if parsed.path == "/corpus.json":
+                    body = json.dumps(server.article_urls())
+                    self.reply(200, body, "application/json")
+                    return
+                status = server.injected_failure()
+                if status == 429:
+                    self.reply(429, "slow down", "text/plain", {"Retry-After": "1"})
+                elif status is not None:
+                    self.reply(status, "server error", "text/plain")
+                elif parsed.path == "/rss/search":
+                    query = urllib.parse.parse_qs(parsed.query).get("q", [""])[0]
+                    self.reply(200, server.feed(query), "application/rss+xml")
+                elif parsed.path.startswith("/article/"):
+                    try:
+                        index = int(parsed.path.rsplit("/", 1)[1])
+                    except ValueError:
+                        index = -1
+                    if 0 <= index < server.articles:
+                        self.reply(200, server.article(index), "text/html")
+                    else:
+                        self.reply(404, "not found", "text/plain")
+                else:
+                    self.reply(404, "not found", "text/plain")
+
+            def reply(self, status, body, content_type, extra_headers=None):
+                body = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (extra_headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--articles", type=int, default=ARTICLE_COUNT)
+    parser.add_argument("--hosts", type=int, default=ARTICLE_HOSTS)
+    parser.add_argument("--entries-per-feed", type=int, default=ENTRIES_PER_FEED)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = FakeNewsServer(
+        articles=args.articles,
+        article_hosts=args.hosts,
+        entries_per_feed=args.entries_per_feed,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        seed=args.seed,
+    ).start()
+    print(f"feeds: {server.rss_base_url}/search?q=...")
+    print(f"articles: {server.article_url(0)} ... ({args.articles})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Import-time benchmark for the entry points of the fetcher.
+
+Every module is imported in a fresh interpreter several times and the
+median wall time is reported. With --max-seconds the script exits with an
+error when an entry point is slower, so it can guard startup time in CI.
+
+    python -m benchmarks.import_time --max-seconds 1.0
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ENTRY_POINTS = ["url_fetcher", "data_fetcher", "main"]
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def time_import(module, runs=5):
+    """
+    Args:
+        module: module to import
+        runs: fresh interpreters to start
+
+    Returns:
+        median seconds to start the interpreter and import module
+    """
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-c", f"import {module}"],
+            cwd=REPO_ROOT,
+            check=True,
+        )
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=None)
+    parser.add_argument("modules", nargs="*", default=ENTRY_POINTS)
+    args = parser.parse_args()
+
+    baseline = time_import("sys", runs=args.runs)
+    print(f"interpreter startup: {baseline:.3f}s")
+    too_slow = []
+    for module in args.modules:
+        seconds = time_import(module, runs=args.runs)
+        print(f"import {module}: {seconds:.3f}s (+{seconds - baseline:.3f}s)")
+        if args.max_seconds is not None and seconds > args.max_seconds:
+            too_slow.append(module)
+
+    if too_slow:
+        print(f"slower than {args.max_seconds}s: {', '.join(too_slow)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
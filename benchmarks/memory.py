@@ -0,0 +1,284 @@
+"""
+Peak-memory benchmark of discovery and extraction.
+
+The discovery scenarios push synthetic articles through
+URL_FETCHER.add_articles the way decoded feeds are, once keeping every record
+(main, "retained") and once keeping only the links of emitted records
+(iter_articles, "streaming"). Links are kept for dedup either way, so even
+streaming discovery grows by one link per unique article; its budget covers
+that link and not the record.
+
+The extraction scenarios run DataFetcher.main in async and multithreaded
+mode on a generator of article URLs served by a FakeNewsServer. Both modes
+only pull articles as workers free up, so past the fixed cost of a run
+(pools, sessions, write batches) memory must not grow with the articles.
+
+Every scenario runs in a fresh interpreter at a quarter of the records and
+at all of them, and reports the growth of its peak RSS per extra record
+between the two, which leaves the fixed costs out. With --check the script
+exits with an error when a scenario goes over its budget; tests/test_memory.py
+runs the same check.
+
+    python -m benchmarks.memory --check
+    python -m benchmarks.memory extraction_async --records 20000
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.run_benchmarks import rss_bytes, serve
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FEED_SIZE = 100
+KEYWORD_COUNT = 20
+PUBLISHER_COUNT = 500
+ARTICLE_HOSTS = 20
+DISCOVERY = ["retained", "streaming"]
+EXTRACTION = ["extraction_async", "extraction_threaded"]
+SCENARIOS = DISCOVERY + EXTRACTION
+RECORD_COUNTS = {
+    "retained": 200_000,
+    "streaming": 200_000,
+    "extraction_async": 4000,
+    "extraction_threaded": 4000,
+}
+# Bytes of peak RSS per record; plain dict records took about 740 when kept.
+# Extraction keeps nothing per article, the budget is measurement noise
+BUDGETS = {
+    "retained": 600,
+    "streaming": 250,
+    "extraction_async": 1024,
+    "extraction_threaded": 1024,
+}
+
+
+def peak_rss():
+    return rss_bytes(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def synthetic_feeds(count, feed_size=FEED_SIZE):
+    """
+    Yields lists of DiscoveredArticle the size of a decoded feed. Keywords
+    and publishers are built per record, like the strings of parsed feeds.
+    """
+    from records import DiscoveredArticle
+
+    feed = []
+    for i in range(count):
+        publisher = i % PUBLISHER_COUNT
+        feed.append(
+            DiscoveredArticle(
+                f"https://news{publisher}.example.com/2024/05/story-{i}.html",
+                f"keyword {i % KEYWORD_COUNT}",
+                title=f"Story {i} on the markets - Publisher {publisher}",
+                source=f"Publisher {publisher}",
+                published="Mon, 06 May 2024 08:00:00 GMT",
+            )
+        )
+        if len(feed) == feed_size:
+            yield feed
+            feed = []
+    if feed:
+        yield feed
+
+
+def run_discovery(scenario, count):
+    from url_fetcher import URL_FETCHER
+
+    url_fetcher = URL_FETCHER()
+    emitted = 0
+
+    def on_article(article):
+        nonlocal emitted
+        emitted += 1
+
+    url_fetcher.on_article = on_article
+    url_fetcher.retain_articles = scenario == "retained"
+    for feed in synthetic_feeds(count):
+        url_fetcher.add_articles(feed)
+    if scenario == "retained":
+        url_fetcher.keep_only_unique_links()
+    assert emitted == count
+
+
+def run_extraction(scenario, count, server_info):
+    from data_fetcher import DataFetcher
+    from politeness import DomainScheduler
+    from records import DiscoveredArticle
+
+    hosts = server_info["article_hosts"]
+
+    def article_urls():
+        # Built on demand, like the articles of a streamed discovery
+        for i in range(count):
+            yield DiscoveredArticle(f"{hosts[i % len(hosts)]}/article/{i}", "memory")
+
+    data_fetcher = DataFetcher(
+        number_of_threads=16,
+        scheduler=DomainScheduler(requests_per_domain=8, rate=1000.0, burst=100),
+    )
+    with tempfile.TemporaryDirectory() as workdir:
+        data_fetcher.main(
+            article_urls=article_urls(),
+            save_path=workdir,
+            save_csv=False,
+            multithreaded=scenario == "extraction_threaded",
+        )
+        # Every article got an outcome, so none was left out of the peak
+        with open(f"{workdir}/progress.jsonl") as f:
+            assert sum(1 for _ in f) == count
+
+
+def run_scenario(scenario, count, server_info=None):
+    """
+    Returns:
+        {"records", "peak_bytes"}
+    """
+    if scenario in EXTRACTION:
+        run_extraction(scenario, count, server_info)
+    else:
+        run_discovery(scenario, count)
+    return {"records": count, "peak_bytes": peak_rss()}
+
+
+def measure(scenario, count, server_info_path=None):
+    # A fresh interpreter per run, so peaks do not carry over
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.memory",
+        "--run-scenario",
+        scenario,
+        "--records",
+        str(count),
+    ]
+    if server_info_path is not None:
+        command += ["--server-info", server_info_path]
+    output = subprocess.run(
+        command, cwd=REPO_ROOT, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def growth(scenario, count, server_info_path=None):
+    """
+    Returns:
+        {"records", "peak_mb", "bytes_per_record"}: peak RSS of the run over
+            count records, and its growth per record over a quarter of them
+    """
+    small = measure(scenario, count // 4, server_info_path)
+    large = measure(scenario, count, server_info_path)
+    return {
+        "records": count,
+        "peak_mb": large["peak_bytes"] / (1024 * 1024),
+        "bytes_per_record": (large["peak_bytes"] - small["peak_bytes"])
+        / (count - count // 4),
+    }
+
+
+@contextlib.contextmanager
+def article_server(articles):
+    """
+    Runs a FakeNewsServer in its own process, so that serving does not count
+    in the peaks measured.
+
+    Yields:
+        path of a JSON file with the base URL of every article host
+    """
+    parent_connection, child_connection = multiprocessing.Pipe()
+    server_config = {"articles": articles, "article_hosts": ARTICLE_HOSTS}
+    server_process = multiprocessing.get_context("spawn").Process(
+        target=serve, args=(server_config, child_connection), daemon=True
+    )
+    server_process.start()
+    try:
+        article_urls = parent_connection.recv()["article_urls"]
+        article_hosts = [
+            url.rsplit("/article/", 1)[0] for url in article_urls[:ARTICLE_HOSTS]
+        ]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            info_path = os.path.join(tmpdir, "server.json")
+            with open(info_path, "w") as f:
+                json.dump({"article_hosts": article_hosts}, f)
+            yield info_path
+    finally:
+        parent_connection.send("stop")
+        server_process.join(timeout=10)
+
+
+def run(scenarios, counts=None):
+    """
+    Args:
+        scenarios: names from SCENARIOS
+        counts: records per scenario; RECORD_COUNTS by default
+
+    Returns:
+        results: dict of scenario -> result of growth
+    """
+    counts = {**RECORD_COUNTS, **(counts or {})}
+    results = {}
+    with contextlib.ExitStack() as stack:
+        server_info_path = None
+        extraction = [scenario for scenario in scenarios if scenario in EXTRACTION]
+        if extraction:
+            articles = max(counts[scenario] for scenario in extraction)
+            server_info_path = stack.enter_context(article_server(articles))
+        for scenario in scenarios:
+            results[scenario] = growth(scenario, counts[scenario], server_info_path)
+    return results
+
+
+def over_budget(results):
+    return [
+        scenario
+        for scenario, result in results.items()
+        if result["bytes_per_record"] > BUDGETS[scenario]
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int)
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--run-scenario", choices=SCENARIOS)
+    parser.add_argument("--server-info", help=argparse.SUPPRESS)
+    parser.add_argument("scenarios", nargs="*", default=SCENARIOS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        server_info = None
+        if args.server_info:
+            with open(args.server_info) as f:
+                server_info = json.load(f)
+        count = args.records or RECORD_COUNTS[args.run_scenario]
+        print(json.dumps(run_scenario(args.run_scenario, count, server_info)))
+        return
+
+    unknown = [scenario for scenario in args.scenarios if scenario not in BUDGETS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    counts = None
+    if args.records:
+        counts = {scenario: args.records for scenario in args.scenarios}
+    results = run(args.scenarios, counts)
+    for scenario, result in results.items():
+        print(
+            f"{scenario}: {result['records']} records, peak "
+            f"{result['peak_mb']:.1f} MB, "
+            f"{result['bytes_per_record']:.0f} bytes per record"
+        )
+
+    failed = over_budget(results)
+    if args.check and failed:
+        print(f"over the memory budget: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,447 @@
+"""
+Offline benchmark suite for the fetcher.
+
+A FakeNewsServer is started in its own process and every stage runs in a
+fresh interpreter against it, so peak RSS and CPU time belong to that stage
+alone. Each stage reports throughput, p50/p99 latency per item, peak RSS and
+CPU time. Results can be stored as baselines and later runs compared against
+them:
+
+    python -m benchmarks.run_benchmarks --save-baseline
+    python -m benchmarks.run_benchmarks --compare --tolerance 0.2
+    python -m benchmarks.run_benchmarks normalize extraction_threaded
+
+Stages:
+    normalize            NormalizationEngine over a synthetic corpus
+    discovery            URL_FETCHER over the fake feeds
+    extraction_async     DataFetcher in async mode
+    extraction_threaded  DataFetcher in multithreaded mode
+    extraction_multiprocess  DataFetcher in multiprocess mode
+    pipeline             main.main end to end with default settings
+
+The extraction stages relax per-domain politeness so they measure the code
+rather than the rate limits; the pipeline stage keeps the defaults.
+"""
+import argparse
+import datetime
+import glob
+import inspect
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_news_server import FakeNewsServer, sentence
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINES_PATH = os.path.join(REPO_ROOT, "benchmarks", "baselines.json")
+STAGES = [
+    "normalize",
+    "discovery",
+    "extraction_async",
+    "extraction_threaded",
+    "extraction_multiprocess",
+    "pipeline",
+]
+KEYWORDS = ["General Electric", "Apple", "climate", "election"]
+NORMALIZE_TEXTS = 500
+TOLERANCE = 0.2
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def rss_bytes(maxrss):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    if sys.platform == "darwin":
+        return maxrss
+    return maxrss * 1024
+
+
+def rss_mb(maxrss):
+    return rss_bytes(maxrss) / (1024 * 1024)
+
+
+def timed(function, latencies):
+    """
+    Args:
+        function: function to time
+        latencies: list the seconds of every call are appended to
+
+    Returns:
+        wrapper of function, sync or async like function
+    """
+    if inspect.iscoroutinefunction(function):
+
+        async def async_wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                latencies.append(time.perf_counter() - started)
+
+        return async_wrapper
+
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    return wrapper
+
+
+def bench_normalize(server_info, workdir):
+    from text_normalizer import get_normalizer
+
+    rng = random.Random(0)
+    texts = [
+        " ".join(sentence(rng) for _ in range(40)) for _ in range(NORMALIZE_TEXTS)
+    ]
+    latencies = []
+    normalize = timed(get_normalizer().normalize, latencies)
+    for text in texts:
+        normalize(text)
+    return len(texts), latencies, 0
+
+
+def bench_discovery(server_info, workdir):
+    from url_fetcher import URL_FETCHER
+
+    latencies = []
+    url_fetcher = URL_FETCHER(rss_base_url=server_info["rss_base_url"])
+    url_fetcher.make_request_basic = timed(url_fetcher.make_request_basic, latencies)
+    now = datetime.datetime.now()
+    url_fetcher.main(
+        keywords=KEYWORDS,
+        start_date=now,
+        end_date=now - datetime.timedelta(days=30),
+        timedelta=3,
+        save_path=workdir,
+    )
+    return len(latencies), latencies, 0
+
+
+def bench_extraction(server_info, workdir, multithreaded=False, multiprocess=False):
+    from data_fetcher import DataFetcher
+    from politeness import DomainScheduler
+
+    latencies = []
+    data_fetcher = DataFetcher(
+        number_of_threads=16,
+        scheduler=DomainScheduler(requests_per_domain=8, rate=1000.0, burst=100),
+    )
+    if multiprocess:
+        # Items finish in the worker processes, so they are timed from being
+        # queued to their result coming back, queueing included
+        queued_at = {}
+        put = data_fetcher.scheduler.put
+
+        def timed_put(item):
+            if item is not None:
+                queued_at[item[0]] = time.perf_counter()
+            put(item)
+
+        def finished(handle):
+            def wrapper(url, *args, **kwargs):
+                latencies.append(time.perf_counter() - queued_at.pop(url))
+                return handle(url, *args, **kwargs)
+
+            return wrapper
+
+        data_fetcher.scheduler.put = timed_put
+        data_fetcher.handle_extracted = finished(data_fetcher.handle_extracted)
+        data_fetcher.handle_rejected = finished(data_fetcher.handle_rejected)
+    elif multithreaded:
+        data_fetcher.make_request_threaded = timed(
+            data_fetcher.make_request_threaded, latencies
+        )
+    else:
+        data_fetcher.make_request = timed(data_fetcher.make_request, latencies)
+    article_urls = [
+        {"link": url, "keyword": "benchmark"} for url in server_info["article_urls"]
+    ]
+    data_fetcher.main(
+        article_urls=article_urls,
+        save_path=workdir,
+        multithreaded=multithreaded,
+        multiprocess=multiprocess,
+    )
+    return len(latencies), latencies, len(data_fetcher.rejected_urls)
+
+
+def bench_extraction_async(server_info, workdir):
+    return bench_extraction(server_info, workdir, multithreaded=False)
+
+
+def bench_extraction_threaded(server_info, workdir):
+    return bench_extraction(server_info, workdir, multithreaded=True)
+
+
+def bench_extraction_multiprocess(server_info, workdir):
+    return bench_extraction(server_info, workdir, multiprocess=True)
+
+
+def bench_pipeline(server_info, workdir):
+    import main
+
+    # main.main writes its run directory under ./data
+    os.chdir(workdir)
+    main.main(
+        keywords=KEYWORDS[:2],
+        timedelta=3,
+        rss_base_url=server_info["rss_base_url"],
+    )
+    processed = 0
+    rejected = 0
+    journals = glob.glob(os.path.join(workdir, "data", "run_*", "progress.jsonl"))
+    for journal in journals:
+        with open(journal) as f:
+            for line in f:
+                processed += 1
+                rejected += json.loads(line)["status"] == "rejected"
+    return processed, [], rejected
+
+
+# Every stage returns (items processed, seconds per item, failed items)
+STAGE_FUNCTIONS = {
+    "normalize": bench_normalize,
+    "discovery": bench_discovery,
+    "extraction_async": bench_extraction_async,
+    "extraction_threaded": bench_extraction_threaded,
+    "extraction_multiprocess": bench_extraction_multiprocess,
+    "pipeline": bench_pipeline,
+}
+
+
+def run_stage(stage, server_info, workdir):
+    """
+    Runs one stage in the current process; meant for a fresh interpreter.
+
+    Returns:
+        result: dict of the measurements of the stage
+    """
+    before_self = resource.getrusage(resource.RUSAGE_SELF)
+    before_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started = time.perf_counter()
+    items, latencies, errors = STAGE_FUNCTIONS[stage](server_info, workdir)
+    seconds = time.perf_counter() - started
+    after_self = resource.getrusage(resource.RUSAGE_SELF)
+    after_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu_seconds = sum(
+        getattr(after, field) - getattr(before, field)
+        for before, after in (
+            (before_self, after_self),
+            (before_children, after_children),
+        )
+        for field in ("ru_utime", "ru_stime")
+    )
+    return {
+        "stage": stage,
+        "items": items,
+        "errors": errors,
+        "seconds": seconds,
+        "throughput": items / seconds if seconds > 0 else 0.0,
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99),
+        "cpu_seconds": cpu_seconds,
+        "peak_rss_mb": rss_mb(after_self.ru_maxrss),
+        "children_peak_rss_mb": rss_mb(after_children.ru_maxrss),
+    }
+
+
+def serve(server_config, connection):
+    """
+    Runs a FakeNewsServer in a child process and sends its rss_base_url and
+    article_urls to the parent over connection.
+
+    Args:
+        server_config: keyword arguments of FakeNewsServer
+        connection: child end of a multiprocessing.Pipe
+    """
+    server = FakeNewsServer(**server_config).start()
+    connection.send(
+        {"rss_base_url": server.rss_base_url, "article_urls": server.article_urls()}
+    )
+    # Serve until the parent asks to stop
+    connection.recv()
+    server.stop()
+
+
+def run_suite(stages, server_config, verbose=False):
+    """
+    Starts the fake server and runs every stage in its own interpreter.
+
+    Returns:
+        results: dict of stage -> result
+    """
+    parent_connection, child_connection = multiprocessing.Pipe()
+    server_process = multiprocessing.Process(
+        target=serve, args=(server_config, child_connection), daemon=True
+    )
+    server_process.start()
+    results = {}
+    try:
+        server_info = parent_connection.recv()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            info_path = os.path.join(tmpdir, "server.json")
+            with open(info_path, "w") as f:
+                json.dump(server_info, f)
+            for stage in stages:
+                workdir = os.path.join(tmpdir, stage)
+                os.makedirs(workdir)
+                result_path = os.path.join(tmpdir, f"{stage}.result.json")
+                completed = subprocess.run(
+                    [
+                        sys.executable,
+                        "-m",
+                        "benchmarks.run_benchmarks",
+                        "--run-stage",
+                        stage,
+                        "--server-info",
+                        info_path,
+                        "--workdir",
+                        workdir,
+                        "--result",
+                        result_path,
+                    ],
+                    cwd=REPO_ROOT,
+                    stdout=None if verbose else subprocess.DEVNULL,
+                    stderr=None if verbose else subprocess.DEVNULL,
+                )
+                if completed.returncode != 0 or not os.path.exists(result_path):
+                    print(f"ERROR stage {stage} failed (exit {completed.returncode})")
+                    continue
+                with open(result_path) as f:
+                    results[stage] = json.load(f)
+                print(format_result(results[stage]))
+    finally:
+        parent_connection.send("stop")
+        server_process.join(timeout=10)
+    return results
+
+
+def format_result(result):
+    def ms(value):
+        return "-" if value is None else f"{value * 1000:.1f}ms"
+
+    return (
+        f"{result['stage']:<20} {result['items']:>6} items "
+        f"({result['errors']} failed) "
+        f"{result['throughput']:>9.1f}/s  p50 {ms(result['p50']):>9} "
+        f"p99 {ms(result['p99']):>9}  cpu {result['cpu_seconds']:.1f}s  "
+        f"rss {result['peak_rss_mb']:.0f}MB"
+    )
+
+
+def compare(results, baselines, tolerance=TOLERANCE):
+    """
+    Args:
+        results: dict of stage -> result of this run
+        baselines: dict of stage -> stored result
+        tolerance: allowed relative change before a stage counts as regressed
+
+    Returns:
+        regressions: list of human readable regressions
+    """
+    regressions = []
+    for stage, result in results.items():
+        baseline = baselines.get(stage)
+        if baseline is None:
+            continue
+        if result["throughput"] < baseline["throughput"] * (1 - tolerance):
+            regressions.append(
+                f"{stage}: throughput {result['throughput']:.1f}/s, "
+                f"baseline {baseline['throughput']:.1f}/s"
+            )
+        for metric in ("p99", "peak_rss_mb"):
+            if result.get(metric) is None or baseline.get(metric) is None:
+                continue
+            if result[metric] > baseline[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{stage}: {metric} {result[metric]:.3f}, "
+                    f"baseline {baseline[metric]:.3f}"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("stages", nargs="*", default=STAGES)
+    parser.add_argument("--articles", type=int, default=500)
+    parser.add_argument("--hosts", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--baselines", default=BASELINES_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--verbose", action="store_true")
+    # Used internally to run one stage in a fresh interpreter
+    parser.add_argument("--run-stage", help=argparse.SUPPRESS)
+    parser.add_argument("--server-info", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_stage:
+        with open(args.server_info) as f:
+            server_info = json.load(f)
+        result = run_stage(args.run_stage, server_info, args.workdir)
+        with open(args.result, "w") as f:
+            json.dump(result, f)
+        return
+
+    unknown = [stage for stage in args.stages if stage not in STAGE_FUNCTIONS]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)}")
+    server_config = {
+        "articles": args.articles,
+        "article_hosts": args.hosts,
+        "latency": args.latency,
+        "error_rate": args.error_rate,
+        "throttle_rate": args.throttle_rate,
+    }
+    results = run_suite(args.stages, server_config, verbose=args.verbose)
+
+    if args.save_baseline:
+        baselines = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "server": server_config,
+            "stages": results,
+        }
+        with open(args.baselines, "w") as f:
+            json.dump(baselines, f, indent=4)
+        print(f"Baselines saved to {args.baselines}")
+
+    if args.compare:
+        with open(args.baselines) as f:
+            baselines = json.load(f)
+        if baselines.get("server") != server_config:
+            print("[INFO] Server settings differ from the baselines")
+        regressions = compare(results, baselines["stages"], args.tolerance)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baselines")
+
+    if len(results) < len(args.stages):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
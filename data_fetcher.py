@@ -1,35 +1,209 @@
 import asyncio
+import itertools
 import json
-from goose3 import Goose
-from goose3.configuration import Configuration
 import datetime
-import datetime
-import pytz
-import nltk
-import re
-import requests
-import pandas as pd
+import multiprocessing
 import os
+import queue
 import traceback
+from concurrent.futures import ProcessPoolExecutor
 from multiprocessing import Semaphore, Process
 import threading
+import time
+from worker_pool import WorkerPool
+from text_normalizer import get_normalizer
+from politeness import DomainScheduler, ReservedSlots, parse_retry_after
+from sinks import create_sinks, export_excel, jsonl_path
+from writer import BackgroundWriter, WriterError
+from progress_journal import ProgressJournal, EMPTY, REJECTED, DUPLICATE, SKIPPED
+from metrics import domain_of, get_metrics, reset_metrics, trace_config
+from records import RejectedURL, to_dict
+from html_content import (
+    CHUNK_SIZE,
+    MAX_BODY_BYTES,
+    decode_body,
+    header_skip_reason,
+    url_skip_reason,
+)
+from retry import (
+    RETRY_LIMIT,
+    PARSE,
+    PERMANENT,
+    TRANSIENT,
+    ParseError,
+    RetryQueue,
+    Skipped,
+    backoff_delay,
+    classify,
+    rejection_report,
+    retry_after_of,
+    status_of,
+)
 
 
+# goose3, requests and aiohttp are imported on first use so that importing
+# this module (e.g. in every worker process) stays fast.
 requests_timeout = 10
-goose_config = Configuration()
-goose_config.strict = True
-goose_object = Goose()
 headers = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
 }
 
-RETRY_LIMIT = 3
+DOWNLOAD_CONCURRENCY = 100
+DOWNLOADS_PER_HOST = 8
+# Articles in flight in async mode per download slot; the others wait for
+# their domain or their retry backoff without a slot
+ASYNC_TASKS_PER_DOWNLOAD = 4
+
+_local = threading.local()
+
+
+def get_goose():
+    """
+    Returns:
+        the Goose instance of the calling thread, created on first use. Each
+        worker thread and process gets its own instance.
+    """
+    goose = getattr(_local, "goose", None)
+    if goose is None:
+        from goose3 import Goose
+
+        goose = Goose()
+        _local.goose = goose
+    return goose
+
+
+def get_session():
+    """
+    Returns:
+        the requests.Session of the calling thread, created on first use, so
+        every worker thread and process keeps its own connection pool
+    """
+    session = getattr(_local, "session", None)
+    if session is None:
+        import requests
+
+        session = requests.Session()
+        _local.session = session
+    return session
+
+
+def parse_article(raw_html: str, url: str, keyword: str) -> dict:
+    """
+    Parses downloaded HTML into an article dict. Lives at module level so it
+    can be sent to the parse process pool.
+
+    Args:
+        raw_html: downloaded HTML of the article
+        url: article URL
+        keyword: keyword the article was found with
+
+    Returns:
+        article_dict: extracted article, empty if nothing could be extracted
+    """
+    with get_metrics().timer("goose_parse_seconds"):
+        article = get_goose().extract(raw_html=raw_html)
+    return DataFetcher.get_article_content(article, url, keyword)
+
+
+def parse_article_with_metrics(raw_html: str, url: str, keyword: str):
+    """
+    parse_article for the parse process pool; the parse and normalization
+    timings recorded in the worker process are returned along with the
+    article so the main process can add them to its registry.
+
+    Returns:
+        (article_dict, metrics_state)
+    """
+    article_dict = parse_article(raw_html, url, keyword)
+    return article_dict, get_metrics().collect()
+
+
+def extraction_worker(
+    task_queue,
+    result_queue,
+    holding,
+    index,
+    cache_config=None,
+    max_body_bytes=MAX_BODY_BYTES,
+):
+    """
+    Main loop of an extraction worker process. Pulls (task_id, url, keyword)
+    items from the shared task queue until it gets None, and sends every
+    outcome back to the main process, which owns the writer, journal and
+    politeness.
+
+    Args:
+        task_queue: multiprocessing queue of (task_id, url, keyword) items
+        result_queue: multiprocessing queue the results are put on; None is
+            put once the worker stops
+        holding: shared array of the task id each worker last started, so
+            the main process knows what a crashed worker took with it
+        index: position of this worker in holding
+        cache_config: (cache_dir, ttl, max_size) of the HTTP cache, if any
+        max_body_bytes: largest page worth downloading
+    """
+    from http_cache import HTTPCache
+
+    slots = ReservedSlots()
+    cache = HTTPCache(*cache_config) if cache_config is not None else None
+    data_fetcher = DataFetcher(
+        cache=cache, scheduler=slots, max_body_bytes=max_body_bytes
+    )
+    try:
+        while True:
+            item = task_queue.get()
+            if item is None:
+                return
+            task_id, url, keyword = item
+            # Shared memory is written at once, unlike the result queue
+            holding[index] = task_id
+            goose_extracted_content = {}
+            error = None
+            reason = None
+            try:
+                goose_extracted_content = data_fetcher.extract_article(url, keyword)
+            except Exception as e:
+                # Exceptions do not always pickle; the message and the
+                # failure class are enough
+                error = f"{type(e).__name__}: {e}"
+                reason = classify(e)
+            result_queue.put(
+                (
+                    task_id,
+                    url,
+                    keyword,
+                    goose_extracted_content,
+                    error,
+                    reason,
+                    slots.pop_response(url),
+                    get_metrics().collect(),
+                )
+            )
+    finally:
+        if cache is not None:
+            cache.close()
+        result_queue.put(None)
 
 
 class DataFetcher:
-    def __init__(self, number_of_threads=5, max_batch_size=500) -> None:
+    def __init__(
+        self,
+        number_of_threads=5,
+        max_batch_size=500,
+        download_concurrency=DOWNLOAD_CONCURRENCY,
+        parse_concurrency=None,
+        seen_index=None,
+        cache=None,
+        scheduler=None,
+        near_duplicates=None,
+        duplicate_mode="link",
+        metrics=None,
+        extraction_processes=None,
+        on_progress=None,
+        retry_limit=RETRY_LIMIT,
+        max_body_bytes=MAX_BODY_BYTES,
+    ) -> None:
         self.successful_requests = 0
-        self.article_data = []
         self.rejected_urls = []
         self.number_of_processes = number_of_threads
         self.semaphore = Semaphore(self.number_of_processes)
@@ -38,7 +212,35 @@ class DataFetcher:
         self.save_path = ""
         self.save_json = True
         self.save_csv = True
+        self.writer = None
+        self.lock = threading.Lock()
         self.total_successful_extracted = 0
+        self.download_concurrency = download_concurrency
+        self.parse_concurrency = parse_concurrency or os.cpu_count() or 1
+        self.session = None
+        self.parse_pool = None
+        self.download_semaphore = None
+        self.parse_semaphore = None
+        self.seen_index = seen_index
+        self.cache = cache
+        self.journal = None
+        # Per-domain politeness for every article download
+        self.scheduler = scheduler or DomainScheduler()
+        # Syndicated copies are either dropped or stored as a link to the
+        # first copy without their content ("drop" or "link")
+        self.near_duplicates = near_duplicates
+        self.duplicate_mode = duplicate_mode
+        self.total_duplicates = 0
+        self.metrics = metrics or get_metrics()
+        # Worker processes of the multiprocess mode
+        self.extraction_processes = extraction_processes or os.cpu_count() or 1
+        # Called with (urls, status, reason) once outcomes are journaled
+        self.on_progress = on_progress
+        # Failed downloads wait here for their backoff instead of a worker
+        self.retries = RetryQueue(retry_limit)
+        # Larger pages are dropped while downloading, before any parsing
+        self.max_body_bytes = max_body_bytes
+        self.total_skipped = 0
 
     @staticmethod
     def add_punctuation_whitespace(text: str) -> str:
@@ -51,25 +253,8 @@ class DataFetcher:
         Returns:
             text: processed text
         """
-        sentences = nltk.sent_tokenize(text)
-        for i in range(len(sentences)):
-            if sentences[i][-1] not in ".!?":
-                sentences[i] += "."
-        text = " ".join(sentences)
-        pattern = (
-            r"(?<=[^\s\d])("
-            + "|".join(re.escape(x) for x in ".!?,;:")
-            + r")(?=[^\s\d])"
-        )
-        text = re.sub(pattern, r"\1 ", text)
-        # Fix edge case with numbers and currency.
-        text = re.sub(r"(\d) (?=\d{3}([^\d]|$))", r"\1,", text)
-        # Fix edge case with hyphenated words.
-        text = re.sub(r"(\w) - (?=\w)", r"\1-", text)
-        # Add whitespace after numbers followed by punctuation marks
-        pattern = r"(?<=\d)(\.(?=\D)|\-(?=\D)|/(?=\D))(?!\d)"
-        text = re.sub(pattern, r"\1 ", text)
-        return text
+        with get_metrics().timer("normalize_seconds"):
+            return get_normalizer().normalize(text)
 
     @staticmethod
     def is_valid_datetime(article_datetime: datetime.datetime) -> bool:
@@ -113,7 +298,8 @@ class DataFetcher:
 
         return is_valid
 
-    def get_article_content(self, article: object, url: str, keyword: str) -> dict:
+    @classmethod
+    def get_article_content(cls, article: object, url: str, keyword: str) -> dict:
         """_summary_
 
         Args:
@@ -128,7 +314,7 @@ class DataFetcher:
         article_content = article.cleaned_text
         if article_content is None or article_content.strip() == "":
             article_content = article.meta_description
-        article_content = self.add_punctuation_whitespace(article_content)
+        article_content = cls.add_punctuation_whitespace(article_content)
         article_title = article.title
         if article_content and article_title:
             # article_title, article_content, multilingual_response = Translator.get_translated_article(
@@ -143,9 +329,9 @@ class DataFetcher:
             # article_content['multilingual_response'] = multilingual_response
 
             article_publish = article.publish_datetime_utc
-            if article_publish is not None and self.is_valid_datetime(article_publish):
+            if article_publish is not None and cls.is_valid_datetime(article_publish):
                 try:
-                    article_publish = article_publish.astimezone(pytz.UTC)
+                    article_publish = article_publish.astimezone(datetime.timezone.utc)
                     if article_publish > datetime.datetime.now(datetime.timezone.utc):
                         article_publish = datetime.datetime.now(datetime.timezone.utc)
                     article_dict["Time"] = datetime.datetime.strftime(
@@ -163,132 +349,672 @@ class DataFetcher:
         return article_dict
 
     async def make_request(self, url: str, keyword: str) -> None:
-        """Fetches data from a given URL
+        """Fetches data from a given URL. The download runs on the shared
+        aiohttp session and parsing is handed to the parse process pool, so
+        downloads of other articles continue while one is being parsed.
+        Retryable failures are tried again after their backoff.
 
         Args:
-            url (_type_): _description_
+            url (str): article URL
+            keyword (str): keyword the article was found with
         """
-        try:
-            article = goose_object.extract(url=url)
-            goose_extracted_content = self.get_article_content(article, url, keyword)
-            self.article_data.append(goose_extracted_content)
-
-        except Exception:
+        # Outcomes go to SQLite and the fsynced journal, off the event loop
+        loop = asyncio.get_running_loop()
+        while True:
             try:
-                print("goose extractor error. Retrying!", url, keyword)
-                response = requests.get(
-                    url,
-                    headers=headers,
-                    timeout=requests_timeout,
-                )
-                # Extract news data from the HTML content
-                article = goose_object.extract(raw_html=response.text)
-                goose_extracted_content = self.get_article_content(
-                    article, url, keyword
+                raw_html = await self.download_html_async(url)
+                async with self.parse_semaphore:
+                    try:
+                        goose_extracted_content, metrics_state = (
+                            await loop.run_in_executor(
+                                self.parse_pool,
+                                parse_article_with_metrics,
+                                raw_html,
+                                url,
+                                keyword,
+                            )
+                        )
+                    except Exception as e:
+                        raise ParseError(f"{type(e).__name__}: {e}") from e
+                self.metrics.merge(metrics_state)
+                await loop.run_in_executor(
+                    None, self.handle_extracted, url, keyword, goose_extracted_content
                 )
-                with Semaphore(1):
-                    self.total_successful_extracted += 1
-                self.article_data.append(goose_extracted_content)
-                if not goose_extracted_content:
-                    print("goose extractor ~ EmptyExtractedContentError", url, keyword)
+                return
+            except WriterError:
+                raise
             except Exception as e:
-                traceback.print_exc()
-                print("ERROR", f"error in fetching data. Error: {e}", url)
-                self.rejected_urls.append({"url": url, "keyword": keyword})
-        finally:
-            with Semaphore(1):
-                if len(self.article_data) >= self.max_batch_size:
-                    self.save(self.save_path, self.save_json, self.save_csv)
+                delay = await loop.run_in_executor(
+                    None, self.handle_failure, url, keyword, e
+                )
+                if delay is None:
+                    return
+                # Sleeps without a download slot, so other articles go ahead
+                await asyncio.sleep(delay)
 
-    def make_request_threaded(self, url: str, keyword: str) -> None:
-        """Fetches data from a given URL
+    async def download_html_async(self, url: str) -> str:
+        """Downloads an article on the shared aiohttp session, going through
+        the HTTP cache when one is set. The body is only read when the
+        headers announce a page, and reading stops at max_body_bytes.
 
         Args:
-            url (_type_): _description_
+            url (str): article URL
+
+        Returns:
+            str: HTML of the article
+
+        Raises:
+            Skipped: for URLs and responses that are no article page
         """
+        self.check_url(url)
+        cached = None
+        if self.cache is not None:
+            cached = await self.cache.get_async(url)
+        if cached is not None and cached.is_fresh(self.cache.ttl):
+            self.metrics.inc("cache_hits_total", stage="article", result="fresh")
+            return cached.text()
+
+        request_headers = dict(headers)
+        if cached is not None:
+            request_headers.update(cached.conditional_headers())
+        # Wait for the domain before taking a global download slot
+        await self.scheduler.acquire_async(url)
+        status = None
+        retry_after = None
         try:
-            article = goose_object.extract(url=url)
-            # print(article.)
-            goose_extracted_content = self.get_article_content(article, url, keyword)
-            self.article_data.append(goose_extracted_content)
+            async with self.download_semaphore:
+                async with self.session.get(url, headers=request_headers) as response:
+                    status = response.status
+                    retry_after = response.headers.get("Retry-After")
+                    if response.status == 304 and cached is not None:
+                        self.metrics.inc(
+                            "cache_hits_total", stage="article", result="revalidated"
+                        )
+                        await self.cache.revalidated_async(url)
+                        return cached.text()
+                    response.raise_for_status()
+                    self.check_headers(response.headers)
+                    started = time.perf_counter()
+                    body = bytearray()
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        body += chunk
+                        self.check_body_size(body)
+                    body = bytes(body)
+                    self.metrics.observe(
+                        "http_phase_seconds",
+                        time.perf_counter() - started,
+                        stage="article",
+                        phase="download",
+                    )
+                    if response.status == 200 and self.cache is not None:
+                        await self.cache.store_async(url, body, response.headers)
+                    return decode_body(body, response.headers.get("Content-Type"))
+        finally:
+            self.count_request(url, status)
+            self.scheduler.release(url, status, retry_after)
 
-        except Exception:
-            try:
-                print("goose extractor error. Retrying!", url, keyword)
-                response = requests.get(
-                    url,
-                    headers=headers,
-                    timeout=requests_timeout,
+    def download_html(self, url: str) -> str:
+        """Downloads an article on the pooled session of the thread, going
+        through the HTTP cache when one is set. The response is streamed: the
+        body is only read when the headers announce a page, and reading stops
+        at max_body_bytes.
+
+        Args:
+            url (str): article URL
+
+        Returns:
+            str: HTML of the article
+
+        Raises:
+            Skipped: for URLs and responses that are no article page
+        """
+        self.check_url(url)
+        cached = self.cache.get(url) if self.cache is not None else None
+        if cached is not None and cached.is_fresh(self.cache.ttl):
+            self.metrics.inc("cache_hits_total", stage="article", result="fresh")
+            return cached.text()
+
+        request_headers = dict(headers)
+        if cached is not None:
+            request_headers.update(cached.conditional_headers())
+        status = None
+        retry_after = None
+        try:
+            self.scheduler.acquire(url)
+            started = time.perf_counter()
+            response = get_session().get(
+                url,
+                headers=request_headers,
+                timeout=requests_timeout,
+                stream=True,
+            )
+            # Closing hands the connection back to the pool, or drops it when
+            # the body was left unread
+            with response:
+                # elapsed runs until the headers are parsed, the rest is the body
+                ttfb = response.elapsed.total_seconds()
+                self.metrics.observe(
+                    "http_phase_seconds", ttfb, stage="article", phase="ttfb"
                 )
-                # Extract news data from the HTML content
-                article = goose_object.extract(raw_html=response.text)
-                goose_extracted_content = self.get_article_content(
-                    article, url, keyword
+                status = response.status_code
+                retry_after = response.headers.get("Retry-After")
+                if response.status_code == 304 and cached is not None:
+                    self.metrics.inc(
+                        "cache_hits_total", stage="article", result="revalidated"
+                    )
+                    self.cache.revalidated(url)
+                    return cached.text()
+                response.raise_for_status()
+                self.check_headers(response.headers)
+                body = bytearray()
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    body += chunk
+                    self.check_body_size(body)
+                body = bytes(body)
+                self.metrics.observe(
+                    "http_phase_seconds",
+                    max(time.perf_counter() - started - ttfb, 0.0),
+                    stage="article",
+                    phase="download",
                 )
-                with Semaphore(1):
-                    self.total_successful_extracted += 1
-                self.article_data.append(goose_extracted_content)
-                if not goose_extracted_content:
-                    print("goose extractor ~ EmptyExtractedContentError", url, keyword)
-            except Exception as e:
-                traceback.print_exc()
-                print("ERROR", f"error in fetching data. Error: {e}", url)
-                self.rejected_urls.append({"url": url, "keyword": keyword})
         finally:
-            with Semaphore(1):
-                if len(self.article_data) >= self.max_batch_size:
-                    self.save(self.save_path, self.save_json, self.save_csv)
+            self.count_request(url, status)
+            self.scheduler.release(url, status, retry_after)
+        if response.status_code == 200 and self.cache is not None:
+            self.cache.store(url, body, response.headers)
+        return decode_body(body, response.headers.get("Content-Type"))
 
-    def save(self, file_path, save_json, save_csv):
-        data = self.article_data
+    @staticmethod
+    def check_url(url):
+        reason = url_skip_reason(url)
+        if reason is not None:
+            raise Skipped(reason)
+
+    def check_headers(self, response_headers):
+        reason = header_skip_reason(response_headers, self.max_body_bytes)
+        if reason is not None:
+            raise Skipped(reason)
+
+    def check_body_size(self, body):
+        # Content-Length is missing or wrong on chunked and compressed bodies
+        if len(body) > self.max_body_bytes:
+            raise Skipped(f"body over {self.max_body_bytes} bytes")
+
+    def count_request(self, url, status):
+        # status is None when the request failed before a response came back
+        self.metrics.inc(
+            "requests_total",
+            stage="article",
+            domain=domain_of(url),
+            status=status if status is not None else "error",
+        )
 
-        if save_json:
-            os.makedirs(file_path + "/json", exist_ok=True)
-            self.save_json_file(
-                data, file_path + "/json/" + str(self.current_save_batch) + ".json"
+    def make_request_threaded(self, url: str, keyword: str) -> bool:
+        """Fetches data from a given URL. The page is downloaded once (or
+        read from the HTTP cache) and parsed from the raw HTML. Retryable
+        failures go to the retry queue.
+
+        Args:
+            url (str): article URL
+            keyword (str): keyword the article was found with
+
+        Returns:
+            bool: True if content was extracted
+        """
+        goose_extracted_content = {}
+        try:
+            goose_extracted_content = self.extract_article(url, keyword)
+            self.handle_extracted(url, keyword, goose_extracted_content)
+        except WriterError:
+            raise
+        except Exception as e:
+            delay = self.handle_failure(url, keyword, e)
+            if delay is not None:
+                self.retries.push((url, keyword), delay)
+        finally:
+            self.retries.task_done()
+        return bool(goose_extracted_content)
+
+    def extract_article(self, url: str, keyword: str) -> dict:
+        """Downloads an article (or reads it from the HTTP cache) and parses
+        it. Touches no shared state of the run, so it also runs in the
+        extraction worker processes.
+
+        Args:
+            url (str): article URL
+            keyword (str): keyword the article was found with
+
+        Returns:
+            dict: extracted article, empty if nothing could be extracted
+        """
+        raw_html = self.download_html(url)
+        # Extract news data from the HTML content
+        try:
+            return parse_article(raw_html, url, keyword)
+        except Exception as e:
+            raise ParseError(f"{type(e).__name__}: {e}") from e
+
+    def handle_extracted(self, url, keyword, goose_extracted_content):
+        """Hands an extracted article to the writer. Safe to call from any
+        worker thread.
+
+        Args:
+            url (str): article URL
+            keyword (str): keyword the article was found with
+            goose_extracted_content (dict): extracted article, may be empty
+        """
+        self.retries.succeeded(url)
+        if goose_extracted_content and self.near_duplicates is not None:
+            canonical = self.near_duplicates.check_and_add(
+                url, goose_extracted_content["Content"]
             )
-        if save_csv:
-            os.makedirs(file_path + "/csv", exist_ok=True)
-            self.save_csv_file(
-                data, file_path + "/csv/" + str(self.current_save_batch) + ".xlsx"
+            if canonical is not None:
+                self.handle_duplicate(url, keyword, goose_extracted_content, canonical)
+                return
+        if goose_extracted_content:
+            with self.lock:
+                self.total_successful_extracted += 1
+            self.count_article(url, "extracted")
+            self.writer.put(goose_extracted_content)
+        else:
+            print("goose extractor ~ EmptyExtractedContentError", url, keyword)
+            self.count_article(url, EMPTY)
+            self.record_progress(url, EMPTY, keyword)
+
+    def handle_duplicate(self, url, keyword, goose_extracted_content, canonical):
+        print("near duplicate of", canonical, url, keyword)
+        with self.lock:
+            self.total_duplicates += 1
+        self.count_article(url, DUPLICATE)
+        if self.duplicate_mode == "drop":
+            self.record_progress(url, DUPLICATE, keyword)
+            if self.seen_index is not None:
+                self.seen_index.add(url)
+            return
+        linked = {
+            key: value
+            for key, value in goose_extracted_content.items()
+            if key != "Content"
+        }
+        linked["duplicate_of"] = canonical
+        self.writer.put(linked)
+
+    def handle_failure(
+        self, url, keyword, error, reason=None, status=None, retry_after=None
+    ):
+        """Classifies a failed attempt and either leaves the URL for another
+        attempt or rejects it.
+
+        Args:
+            url (str): article URL
+            keyword (str): keyword the article was found with
+            error: exception of the attempt, or its message
+            reason (str, optional): failure class when error is a message
+            status (int, optional): HTTP status when error is a message
+            retry_after (str, optional): Retry-After header when error is a
+                message
+
+        Returns:
+            float: seconds to wait before the next attempt, None if the URL
+                was rejected
+        """
+        if status is None:
+            status = status_of(error)
+        if reason is None:
+            reason = classify(error, status)
+        if reason == SKIPPED:
+            self.handle_skipped(url, keyword, error)
+            return None
+        delay = parse_retry_after(retry_after)
+        if delay is None:
+            delay = retry_after_of(error)
+        retry, attempts = self.retries.failed(url, reason, delay)
+        if not retry:
+            unexpected = reason in (PERMANENT, PARSE) and status is None
+            if unexpected and isinstance(error, Exception):
+                traceback.print_exception(type(error), error, error.__traceback__)
+            self.handle_rejected(
+                url, keyword, error, reason=reason, status=status, attempts=attempts
             )
-        self.current_save_batch += 1
-        self.article_data = []
+            return None
+        delay = backoff_delay(attempts - 1, delay)
+        print(
+            "INFO",
+            f"attempt {attempts} failed ({reason}: {error}). "
+            f"Retrying in {delay:.1f}s.",
+            url,
+        )
+        self.count_article(url, "retried")
+        return delay
 
-    def save_json_file(self, data, filename):
-        with open(filename, "w") as f:
-            json.dump(data, f, indent=4)
+    def handle_skipped(self, url, keyword, reason):
+        print("INFO", f"skipped before parsing: {reason}", url)
+        with self.lock:
+            self.total_skipped += 1
+        self.count_article(url, SKIPPED)
+        self.record_progress(url, SKIPPED, keyword)
+        if self.seen_index is not None:
+            # Not worth downloading again in later runs either
+            self.seen_index.add(url)
 
-    def save_csv_file(self, data, filename):
-        df = pd.DataFrame(data)
-        df.to_excel(filename, index=False)
+    def handle_rejected(
+        self, url, keyword, error, reason=None, status=None, attempts=None
+    ):
+        print("ERROR", f"error in fetching data. Error: {error}", url)
+        if reason is None:
+            reason = classify(error, status)
+        with self.lock:
+            self.rejected_urls.append(
+                RejectedURL(
+                    url,
+                    keyword,
+                    reason=reason,
+                    status=status,
+                    error=str(error),
+                    attempts=attempts,
+                )
+            )
+        self.count_article(url, REJECTED)
+        if self.journal is not None:
+            self.journal.record(url, REJECTED, keyword=keyword, reason=reason)
+
+    def count_article(self, url, outcome):
+        self.metrics.inc("articles_total", domain=domain_of(url), outcome=outcome)
+
+    def record_progress(self, url, status, keyword):
+        if self.journal is not None:
+            self.journal.record(url, status, keyword=keyword)
+
+    def restore_progress(self, journal_path):
+        """
+        Loads the journal of an interrupted run in the same directory so that
+        completed URLs are skipped, rejected URLs are kept and batch numbering
+        continues after the last saved batch.
+
+        Args:
+            journal_path: progress journal of the run
+
+        Returns:
+            completed: set of URLs that need no further work
+        """
+        entries = ProgressJournal.load(journal_path)
+        batches = [entry["batch"] for entry in entries.values() if "batch" in entry]
+        if batches:
+            self.current_save_batch = max(batches) + 1
+        self.rejected_urls.extend(
+            RejectedURL(entry["url"], entry.get("keyword"), reason=entry.get("reason"))
+            for entry in entries.values()
+            if entry["status"] == REJECTED
+        )
+        if entries:
+            print(
+                f"[INFO] Resuming: {len(entries)} URLs already done, "
+                f"continuing at batch {self.current_save_batch}."
+            )
+        return set(entries)
+
+    def save_json_file(self, data, filename):
+        # Write to a temporary file first so a crash never leaves half a file
+        tmp_filename = filename + ".tmp"
+        with open(tmp_filename, "w") as f:
+            json.dump(data, f, indent=4, default=to_dict)
+        os.replace(tmp_filename, filename)
 
     async def create_extract_requests(self, article_urls):
-        # Create couroutine for each URL
-        asyncio.Semaphore(100)
-        tasks = []
-        for url in article_urls:
-            tasks.append(self.make_request(url["link"], url["keyword"]))
+        # A fixed number of consumer coroutines drain a bounded queue, so
+        # article_urls can be a generator of any length; downloads and parses
+        # are limited separately so that network I/O and parsing overlap.
+        self.download_semaphore = asyncio.Semaphore(self.download_concurrency)
+        self.parse_semaphore = asyncio.Semaphore(self.parse_concurrency)
+        number_of_tasks = self.download_concurrency * ASYNC_TASKS_PER_DOWNLOAD
+        article_queue = asyncio.Queue(maxsize=number_of_tasks)
+        loop = asyncio.get_running_loop()
+        import aiohttp
 
-        return await asyncio.gather(*tasks)
+        async def produce():
+            items = iter(article_urls)
+            while True:
+                # A streamed generator may block until discovery finds more
+                article = await loop.run_in_executor(None, next, items, None)
+                if article is None:
+                    break
+                # Stop feeding once the writer failed
+                self.writer.check()
+                await article_queue.put(article)
+            for _ in range(number_of_tasks):
+                await article_queue.put(None)
+
+        async def consume():
+            while True:
+                article = await article_queue.get()
+                if article is None:
+                    return
+                await self.make_request(article["link"], article["keyword"])
+
+        connector = aiohttp.TCPConnector(
+            limit=self.download_concurrency,
+            limit_per_host=DOWNLOADS_PER_HOST,
+            ttl_dns_cache=300,
+        )
+        timeout = aiohttp.ClientTimeout(total=requests_timeout)
+        # Spawned, not forked: the writer, metrics server and cache threads
+        # are running by now, and a fork would copy their held locks
+        with ProcessPoolExecutor(
+            max_workers=self.parse_concurrency,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=reset_metrics,
+        ) as parse_pool:
+            async with aiohttp.ClientSession(
+                connector=connector,
+                timeout=timeout,
+                trace_configs=[trace_config(self.metrics, "article")],
+            ) as session:
+                self.session = session
+                self.parse_pool = parse_pool
+                tasks = [asyncio.create_task(produce())]
+                tasks += [
+                    asyncio.create_task(consume()) for _ in range(number_of_tasks)
+                ]
+                try:
+                    await asyncio.gather(*tasks)
+                finally:
+                    # A failed task (the writer) stops the others
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                    self.session = None
+                    self.parse_pool = None
 
     def create_requests_multithreaded(self, article_urls):
-        semaphore = threading.Semaphore(self.number_of_processes)
-        threads = []
+        # A fixed pool of workers drains a bounded queue, so article_urls can
+        # be arbitrarily long (or a generator) without one thread per URL.
+        pool = WorkerPool(
+            self.make_request_threaded,
+            number_of_workers=self.number_of_processes,
+            task_queue=self.scheduler,
+        )
+        items = ((urls["link"], urls["keyword"]) for urls in article_urls)
+        with pool:
+            for url, keyword in self.retries.feed(items):
+                # Stop feeding once the writer failed; the pool is cancelled
+                self.writer.check()
+                pool.submit(url, keyword)
+        pool.print_stats()
 
-        def thread_function(url, keyword):
-            with semaphore:
-                self.make_request_threaded(url, keyword)
+    def create_requests_multiprocess(self, article_urls):
+        """
+        Extracts articles in extraction_processes worker processes so that
+        parsing and normalization use every core. The processes pull from
+        one shared task queue, so an idle process always takes the next URL.
+        The main process keeps politeness, near-duplicate checks, the writer
+        and the journal:
 
-        for urls in article_urls:
-            t = threading.Thread(
-                target=thread_function, args=(urls["link"], urls["keyword"])
+        - this thread queues the URLs on the DomainScheduler
+        - a dispatcher thread moves URLs whose domain may be requested now
+          to the task queue
+        - a collector thread releases the domain slots and hands every
+          result to handle_extracted or handle_failure; retries come back
+          through the retry queue
+        """
+        # Fresh interpreters: no forked copies of locks, sessions or threads
+        context = multiprocessing.get_context("spawn")
+        task_queue = context.Queue(maxsize=2 * self.extraction_processes)
+        result_queue = context.Queue()
+        cache_config = None
+        if self.cache is not None:
+            cache_config = (self.cache.cache_dir, self.cache.ttl, self.cache.max_size)
+        # Task id each worker is on; 0 before its first task
+        holding = context.Array("q", self.extraction_processes, lock=False)
+        workers = [
+            context.Process(
+                target=extraction_worker,
+                args=(
+                    task_queue,
+                    result_queue,
+                    holding,
+                    index,
+                    cache_config,
+                    self.max_body_bytes,
+                ),
+                daemon=True,
             )
-            threads.append(t)
-            t.start()
+            for index in range(self.extraction_processes)
+        ]
+        for worker in workers:
+            worker.start()
+        self.metrics.register_gauge("queue_depth", task_queue.qsize, queue="tasks")
+
+        def workers_alive():
+            return any(worker.is_alive() for worker in workers)
+
+        def put_task(item):
+            # False once every worker is gone and nobody drains the queue
+            while workers_alive():
+                try:
+                    task_queue.put(item, timeout=1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        # task id -> item handed to the task queue and not collected yet
+        handed_out = {}
+        handed_out_lock = threading.Lock()
+
+        def not_extracted(item):
+            # Keep the scheduler moving so the feeding thread ends
+            self.scheduler.cancel(item[0])
+            self.handle_rejected(*item, "extraction workers exited", reason=TRANSIENT)
+            self.retries.task_done()
+
+        def dispatch():
+            for task_id in itertools.count(1):
+                item = self.scheduler.get()
+                if item is None:
+                    break
+                with handed_out_lock:
+                    handed_out[task_id] = item
+                if not put_task((task_id, *item)):
+                    with handed_out_lock:
+                        item = handed_out.pop(task_id, None)
+                    if item is not None:
+                        not_extracted(item)
+            for _ in workers:
+                if not put_task(None):
+                    break
+
+        crashed = set()
 
-        for t in threads:
-            t.join()
+        def count_crashed():
+            # A worker that died took at most the article it was working on
+            # with it; the article stays out of the journal for a resume
+            for index, worker in enumerate(workers):
+                if worker.exitcode in (None, 0) or worker.pid in crashed:
+                    continue
+                crashed.add(worker.pid)
+                print("ERROR", f"extraction process {worker.pid} crashed.")
+                with handed_out_lock:
+                    # None when its last result came in before the crash
+                    item = handed_out.pop(holding[index], None)
+                if item is not None:
+                    # The request may have gone out; count it as failed
+                    self.scheduler.release(item[0])
+                    self.retries.task_done()
+
+        def collect():
+            stopped = 0
+            while stopped < len(workers):
+                try:
+                    result = result_queue.get(timeout=1)
+                except queue.Empty:
+                    count_crashed()
+                    if workers_alive():
+                        continue
+                    break
+                if result is None:
+                    stopped += 1
+                    continue
+                task_id, url, keyword, content, error, reason, response, state = (
+                    result
+                )
+                with handed_out_lock:
+                    handed_out.pop(task_id, None)
+                if response is None:
+                    # Served from the cache or skipped before any request
+                    self.scheduler.cancel(url)
+                    status = retry_after = None
+                else:
+                    status, retry_after = response
+                    self.scheduler.release(url, status, retry_after)
+                self.metrics.merge(state)
+                try:
+                    if error is None:
+                        self.handle_extracted(url, keyword, content)
+                        continue
+                    delay = self.handle_failure(
+                        url,
+                        keyword,
+                        error,
+                        reason=reason,
+                        status=status,
+                        retry_after=retry_after,
+                    )
+                    if delay is not None:
+                        self.retries.push((url, keyword), delay)
+                except WriterError:
+                    # Keep draining results; the feeding thread stops the run
+                    continue
+                finally:
+                    self.retries.task_done()
+            count_crashed()
+            # Items left in the task queue when the last worker died
+            with handed_out_lock:
+                items = list(handed_out.values())
+                handed_out.clear()
+            for item in items:
+                not_extracted(item)
+
+        dispatcher = threading.Thread(target=dispatch, daemon=True)
+        collector = threading.Thread(target=collect, daemon=True)
+        dispatcher.start()
+        collector.start()
+        items = ((urls["link"], urls["keyword"]) for urls in article_urls)
+        try:
+            for item in self.retries.feed(items):
+                self.writer.check()
+                self.scheduler.put(item)
+        except BaseException:
+            # Skip what is still queued, like WorkerPool does
+            self.scheduler.clear()
+            raise
+        finally:
+            self.scheduler.put(None)
+            dispatcher.join()
+            collector.join()
+            for worker in workers:
+                worker.join()
+            self.metrics.unregister_gauge("queue_depth", queue="tasks")
+        print(f"[INFO] {len(workers)} extraction processes finished.")
 
     def main(
         self,
@@ -297,35 +1023,107 @@ class DataFetcher:
         save_json=True,
         save_csv=True,
         multithreaded=False,
+        save_parquet=False,
+        compression=None,
+        excel_export=False,
+        multiprocess=False,
     ):
         """_summary_
 
+        Articles are appended to the sinks of save_path (articles.jsonl,
+        articles.csv, parquet/part-<n>.parquet) batch by batch. Every URL
+        outcome is appended to progress.jsonl in save_path. Calling main again
+        on the same save_path resumes the run: URLs recorded there are skipped
+        and batch numbering continues.
+
         Args:
             keywords (_type_): _description_
+            save_json (bool, optional): write JSON lines. Defaults to True.
+            save_csv (bool, optional): write CSV. Defaults to True.
+            save_parquet (bool, optional): write Parquet. Defaults to False.
+            compression (str, optional): None, "gzip" or "zstd" for the JSON
+                lines. Defaults to None.
+            excel_export (bool, optional): convert the JSON lines to
+                articles.xlsx once the run is done. Defaults to False.
+            multiprocess (bool, optional): extract in extraction_processes
+                worker processes; takes precedence over multithreaded.
+                Defaults to False.
         """
         self.save_path = save_path
         self.save_json = save_json
         self.save_csv = save_csv
-        if multithreaded:
-            print("[INFO] Running in multithreaded mode.")
-            self.create_requests_multithreaded(article_urls)
-        else:
-            print("[INFO] Running in async mode.")
-            asyncio.run(self.create_extract_requests(article_urls))
+        journal_path = f"{save_path}/progress.jsonl"
+        completed = self.restore_progress(journal_path)
+        if completed:
+            article_urls = (
+                url for url in article_urls if url["link"] not in completed
+            )
+        self.journal = ProgressJournal(journal_path, on_record=self.on_progress)
+        sinks = create_sinks(
+            save_path,
+            save_json=save_json,
+            save_csv=save_csv,
+            save_parquet=save_parquet,
+            compression=compression,
+            part=self.current_save_batch,
+        )
+        self.writer = BackgroundWriter(
+            sinks,
+            journal=self.journal,
+            seen_index=self.seen_index,
+            max_batch_size=self.max_batch_size,
+            first_batch=self.current_save_batch,
+        )
+        self.writer.start()
+        self.metrics.register_gauge("queue_depth", self.writer.qsize, queue="writer")
+        self.metrics.register_gauge(
+            "queue_depth", lambda: self.scheduler.pending_count, queue="downloads"
+        )
+        try:
+            if multiprocess:
+                print(
+                    "[INFO] Running in multiprocess mode with "
+                    f"{self.extraction_processes} processes."
+                )
+                self.create_requests_multiprocess(article_urls)
+            elif multithreaded:
+                print("[INFO] Running in multithreaded mode.")
+                self.create_requests_multithreaded(article_urls)
+            else:
+                print("[INFO] Running in async mode.")
+                asyncio.run(self.create_extract_requests(article_urls))
+        finally:
+            # Also on a failed run: flushes what was written so far, closes
+            # the sinks and re-raises the error of a failed flush
+            self.metrics.unregister_gauge("queue_depth", queue="writer")
+            self.metrics.unregister_gauge("queue_depth", queue="downloads")
+            self.writer.close()
+        self.current_save_batch = self.writer.current_batch
+        self.writer = None
 
         # Rejected URLs
         print("Length of rejected URLs: ", len(self.rejected_urls))
         save_file_rejected = f"{save_path}/rejected_urls.json"
         self.save_json_file(self.rejected_urls, save_file_rejected)
+        report = rejection_report(self.rejected_urls)
+        if report["by_reason"]:
+            print(
+                "Rejected by reason: "
+                + ", ".join(f"{k}={v}" for k, v in report["by_reason"].items())
+            )
+        self.save_json_file(report, f"{save_path}/rejection_report.json")
 
         print("Length of article extracted: ", self.total_successful_extracted)
-        self.save(save_path, save_json, save_csv)
-        # save_path = f"{save_path}/scrapped_data"
-        # if save_json:
-        #     self.save_json(self.article_data, save_path + ".json")
+        if self.near_duplicates is not None:
+            print("Near duplicates found: ", self.total_duplicates)
+        print("Skipped before parsing: ", self.total_skipped)
+        self.journal.close()
+        self.journal = None
 
-        # if save_csv:
-        #     self.save_csv(self.article_data, save_path + ".csv")
+        if excel_export and save_json:
+            export_excel(
+                jsonl_path(save_path, compression), f"{save_path}/articles.xlsx"
+            )
 
         print("Data fetched successfully")
 
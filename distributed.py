@@ -0,0 +1,355 @@
+"""
+Distributed crawl over a shared SQLite job queue.
+
+The coordinator queues one feed job per query and date window and watches
+the queue until every job is done. Workers, on any number of hosts that
+can reach the queue file, lease feed jobs, queue the articles they discover
+as article jobs, and extract leased articles into their own run directory.
+
+    python distributed.py coordinator --queue jobs.sqlite3 --keywords "gaza war"
+    python distributed.py worker --queue jobs.sqlite3 --run-dir ./data/node1
+    python distributed.py status --queue jobs.sqlite3
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import socket
+import threading
+import time
+
+from job_queue import (
+    ARTICLE,
+    FEED,
+    HEARTBEAT_INTERVAL,
+    LEASE_SECONDS,
+    Heartbeat,
+    JobQueue,
+)
+from progress_journal import ProgressJournal, REJECTED
+from records import DiscoveredArticle
+
+FEED_BATCH = 10
+ARTICLE_BATCH = 50
+POLL_INTERVAL = 5
+
+
+def enqueue_feeds(
+    job_queue,
+    keywords,
+    start_date,
+    end_date,
+    timedelta=3,
+    langauges=["en"],
+    countries=["US"],
+):
+    """
+    Queues a feed job for every query and date window.
+
+    Returns:
+        number of new feed jobs
+    """
+    from url_fetcher import URL_FETCHER
+
+    url_fetcher = URL_FETCHER()
+    keyword_dicts = []
+    for langauge, country in zip(langauges, countries):
+        keyword_dicts.extend(
+            url_fetcher.generate_keyword_dicts(
+                keywords, language=langauge, country=country
+            )
+        )
+    urls = url_fetcher.transform_keywords_to_urls(
+        keyword_dicts, start_date, end_date, timedelta
+    )
+    jobs = []
+    for url, keyword in urls:
+        query = url_fetcher.url_queries[url]
+        jobs.append(
+            (
+                url,
+                {
+                    "url": url,
+                    "keyword": keyword,
+                    "language": query["language"],
+                    "country": query["country"],
+                    "after": query["after"].isoformat(),
+                    "before": query["before"].isoformat(),
+                },
+            )
+        )
+    return job_queue.put_many(FEED, jobs)
+
+
+def print_status(job_queue):
+    for kind in (FEED, ARTICLE):
+        counts = job_queue.counts(kind)
+        print(
+            f"[INFO] {kind} jobs: "
+            + ", ".join(f"{status}={count}" for status, count in counts.items())
+        )
+
+
+def coordinator(job_queue, interval=POLL_INTERVAL, **enqueue_kwargs):
+    """
+    Queues the feed jobs, then waits for them with wait_for_jobs.
+    """
+    added = enqueue_feeds(job_queue, **enqueue_kwargs)
+    print(f"[INFO] Queued {added} feed jobs.")
+    wait_for_jobs(job_queue, interval)
+
+
+def wait_for_jobs(job_queue, interval=POLL_INTERVAL):
+    """
+    Waits until feeds and articles are all done or failed, requeueing jobs
+    whose lease ran out.
+    """
+    while True:
+        job_queue.requeue_expired()
+        print_status(job_queue)
+        if not job_queue.outstanding(FEED) and not job_queue.outstanding(ARTICLE):
+            break
+        time.sleep(interval)
+    for kind in (FEED, ARTICLE):
+        failed = job_queue.failed_jobs(kind)
+        if failed:
+            print(f"[INFO] {len(failed)} {kind} jobs failed for good.")
+    print("Crawl finished")
+
+
+class Worker:
+    """
+    One crawl worker. Discovery runs in a background thread and extraction in
+    the calling thread, so articles are extracted while feeds are still being
+    read, like main.run_streaming but fed from the job queue.
+    """
+
+    def __init__(
+        self,
+        job_queue,
+        run_dir,
+        worker_id=None,
+        cache_dir=None,
+        feed_batch=FEED_BATCH,
+        article_batch=ARTICLE_BATCH,
+        heartbeat_interval=HEARTBEAT_INTERVAL,
+        poll_interval=POLL_INTERVAL,
+    ) -> None:
+        """
+        Args:
+            job_queue: JobQueue of the crawl
+            run_dir: directory of the articles this worker extracts
+            worker_id: name of the worker; host and pid by default
+            cache_dir: HTTP cache directory of this host
+            feed_batch: feed jobs leased at a time
+            article_batch: article jobs leased at a time; at most four
+                batches are held at once
+            heartbeat_interval: seconds between lease extensions
+            poll_interval: seconds to wait when the queue is empty
+        """
+        self.job_queue = job_queue
+        self.run_dir = run_dir
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.cache_dir = cache_dir
+        self.feed_batch = feed_batch
+        self.article_batch = article_batch
+        self.poll_interval = poll_interval
+        self.heartbeat = Heartbeat(job_queue, self.worker_id, heartbeat_interval)
+        self.article_jobs = {}
+        self.article_lock = threading.Lock()
+        self.discovery_done = threading.Event()
+
+    def discover(self, cache):
+        from gnews_decoder import GoogleNewsDecoder
+        from url_fetcher import URL_FETCHER
+
+        decoder = GoogleNewsDecoder()
+        while True:
+            jobs = self.job_queue.lease(FEED, self.worker_id, limit=self.feed_batch)
+            if not jobs:
+                if not self.job_queue.outstanding(FEED, self.worker_id):
+                    return
+                time.sleep(self.poll_interval)
+                continue
+            # A fetcher per batch: links deduped against an earlier batch
+            # would never be queued if that batch failed and was leased again
+            url_fetcher = URL_FETCHER(cache=cache, decoder=decoder)
+            found = []
+            url_fetcher.on_article = found.append
+            feed_jobs = {payload["url"]: job_id for job_id, payload in jobs}
+            self.heartbeat.hold(feed_jobs.values())
+            url_list = []
+            for _, payload in jobs:
+                url_fetcher.url_queries[payload["url"]] = {
+                    "keyword": payload["keyword"],
+                    "language": payload["language"],
+                    "country": payload["country"],
+                    "after": datetime.datetime.fromisoformat(payload["after"]),
+                    "before": datetime.datetime.fromisoformat(payload["before"]),
+                }
+                url_list.append((payload["url"], payload["keyword"]))
+            try:
+                asyncio.run(url_fetcher.create_requests(url_list))
+                # Articles of the windows that came back are queued even when
+                # another window of their job failed; keys are unique
+                self.job_queue.put_many(
+                    ARTICLE,
+                    [(article.link, article.to_dict()) for article in found],
+                )
+                # Feeds given up on are not raised but kept in rejected_feeds
+                errors = {}
+                for record in url_fetcher.rejected_feeds:
+                    query = url_fetcher.url_queries.get(record.url, {})
+                    errors.setdefault(query.get("window_url", record.url), record.error)
+                for url, error in errors.items():
+                    self.job_queue.fail([feed_jobs[url]], self.worker_id, error)
+                self.job_queue.complete(
+                    [job_id for url, job_id in feed_jobs.items() if url not in errors],
+                    self.worker_id,
+                )
+            except Exception as e:
+                print("ERROR", f"feed batch failed. Error: {e}")
+                self.job_queue.fail(feed_jobs.values(), self.worker_id, e)
+            finally:
+                self.heartbeat.drop(feed_jobs.values())
+
+    def leased_articles(self, completed):
+        """
+        Yields articles leased from the queue until discovery is over and
+        no article job is left for this worker.
+
+        Args:
+            completed: URLs already in the journal of run_dir
+        """
+        while True:
+            if len(self.heartbeat) >= 4 * self.article_batch:
+                # Wait for outcomes before leasing more
+                time.sleep(0.1)
+                continue
+            jobs = self.job_queue.lease(
+                ARTICLE, self.worker_id, limit=self.article_batch
+            )
+            if not jobs:
+                if self.discovery_done.is_set() and not self.job_queue.outstanding(
+                    ARTICLE, self.worker_id
+                ):
+                    return
+                time.sleep(self.poll_interval)
+                continue
+            for job_id, payload in jobs:
+                article = DiscoveredArticle.from_dict(payload)
+                if article.link in completed:
+                    # Extracted before a restart of this worker
+                    self.job_queue.complete([job_id], self.worker_id)
+                    continue
+                with self.article_lock:
+                    self.article_jobs[article.link] = job_id
+                self.heartbeat.hold([job_id])
+                yield article
+
+    def on_progress(self, urls, status, reason=None):
+        with self.article_lock:
+            job_ids = [
+                self.article_jobs.pop(url) for url in urls if url in self.article_jobs
+            ]
+        if not job_ids:
+            return
+        if status == REJECTED:
+            self.job_queue.fail(job_ids, self.worker_id, reason or "rejected")
+        else:
+            self.job_queue.complete(job_ids, self.worker_id)
+        self.heartbeat.drop(job_ids)
+
+    def run(self):
+        from data_fetcher import DataFetcher
+        from http_cache import HTTPCache
+
+        os.makedirs(self.run_dir, exist_ok=True)
+        cache = HTTPCache(self.cache_dir) if self.cache_dir else None
+        completed = set(ProgressJournal.load(f"{self.run_dir}/progress.jsonl"))
+        self.heartbeat.start()
+
+        def discovery():
+            try:
+                self.discover(cache)
+            finally:
+                self.discovery_done.set()
+
+        discovery_thread = threading.Thread(target=discovery)
+        discovery_thread.start()
+        data_fetcher = DataFetcher(
+            number_of_threads=5,
+            max_batch_size=self.article_batch,
+            cache=cache,
+            on_progress=self.on_progress,
+        )
+        try:
+            data_fetcher.main(
+                article_urls=self.leased_articles(completed),
+                save_path=self.run_dir,
+                multithreaded=True,
+            )
+        finally:
+            discovery_thread.join()
+            self.heartbeat.stop()
+            if cache is not None:
+                cache.close()
+        print(f"[INFO] Worker {self.worker_id} finished.")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("role", choices=["coordinator", "worker", "status"])
+    parser.add_argument("--queue", required=True, help="SQLite file of the queue")
+    parser.add_argument("--lease-seconds", type=int, default=LEASE_SECONDS)
+    # coordinator
+    parser.add_argument("--keywords", nargs="+")
+    parser.add_argument("--start-date", help="YYYY-MM-DD, the most recent day")
+    parser.add_argument("--end-date", help="YYYY-MM-DD, the oldest day")
+    parser.add_argument("--timedelta", type=int, default=3)
+    parser.add_argument("--languages", nargs="+", default=["en"])
+    parser.add_argument("--countries", nargs="+", default=["US"])
+    # worker
+    parser.add_argument("--run-dir")
+    parser.add_argument("--worker-id")
+    parser.add_argument("--cache-dir")
+    args = parser.parse_args()
+
+    job_queue = JobQueue(args.queue, lease_seconds=args.lease_seconds)
+    try:
+        if args.role == "status":
+            print_status(job_queue)
+        elif args.role == "coordinator":
+            if not args.keywords:
+                parser.error("the coordinator needs --keywords")
+            start_date = datetime.datetime.now()
+            end_date = start_date - datetime.timedelta(days=args.timedelta)
+            if args.start_date:
+                start_date = datetime.datetime.strptime(args.start_date, "%Y-%m-%d")
+            if args.end_date:
+                end_date = datetime.datetime.strptime(args.end_date, "%Y-%m-%d")
+            coordinator(
+                job_queue,
+                keywords=args.keywords,
+                start_date=start_date,
+                end_date=end_date,
+                timedelta=args.timedelta,
+                langauges=args.languages,
+                countries=args.countries,
+            )
+        else:
+            if not args.run_dir:
+                parser.error("a worker needs --run-dir")
+            Worker(
+                job_queue,
+                args.run_dir,
+                worker_id=args.worker_id,
+                cache_dir=args.cache_dir,
+                heartbeat_interval=min(HEARTBEAT_INTERVAL, args.lease_seconds / 3),
+            ).run()
+    finally:
+        job_queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import base64
+import binascii
+import collections
+import re
+import threading
+
+DECODER_CACHE_SIZE = 100000
+RESOLVER_CACHE_SIZE = 10000
+CONTROL_CHARACTERS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\xff]")
+# Article ids of the newer format carry an opaque token instead of the URL
+OPAQUE_ID_PREFIX = "AU_yqL"
+
+
+class LRUCache:
+    def __init__(self, maxsize) -> None:
+        self.maxsize = maxsize
+        self.data = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.data.get(key)
+            if value is not None:
+                self.data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            if len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def __len__(self):
+        return len(self.data)
+
+
+class GoogleNewsDecoder:
+    """
+    Turns the article ids of Google News feed entries into publisher URLs.
+
+    Older ids embed the URL in a base64 protobuf and are decoded locally.
+    Newer ids ("CBMi..." wrapping an "AU_yqL..." token) only carry an opaque
+    token, so they are handed to a pluggable resolver, e.g. one that calls
+    the Google News batchexecute endpoint. Without a resolver, or when it
+    fails, the Google News link is kept. Both decoded and resolved links are
+    memoized per entry id.
+    """
+
+    def __init__(
+        self,
+        cache_size=DECODER_CACHE_SIZE,
+        resolver=None,
+        resolver_cache_size=RESOLVER_CACHE_SIZE,
+    ) -> None:
+        """
+        Args:
+            cache_size: decoded links kept in memory
+            resolver: callable(entry_id, link) returning the publisher URL
+                of a new-format id, or None if it cannot be resolved
+            resolver_cache_size: resolved links kept in memory
+        """
+        self.cache = LRUCache(cache_size)
+        self.resolver = resolver
+        self.resolved = LRUCache(resolver_cache_size)
+
+    def decode(self, entry_id, link):
+        """
+        Args:
+            entry_id: base64 encoded article id of a feed entry
+            link: article redirecting link; starts with https://news.google.com
+
+        Returns:
+            the decoded link if decoding succeeds, else the input link
+        """
+        decoded = self.cache.get(entry_id)
+        if decoded is None:
+            decoded = self.decode_uncached(entry_id, link)
+            if decoded is None:
+                # Only successful resolutions are memoized, so failed ones
+                # go back to the resolver next time
+                return self.resolve(entry_id, link)
+            self.cache.put(entry_id, decoded)
+        return decoded
+
+    def decode_batch(self, entries):
+        """
+        Args:
+            entries: feed entries with "id" and "link"
+
+        Returns:
+            links: decoded link of every entry, in order
+        """
+        return [self.decode(entry["id"], entry["link"]) for entry in entries]
+
+    def decode_uncached(self, entry_id, link):
+        """
+        Returns:
+            the decoded link, the input link if decoding fails, None for a
+            new-format id that needs the resolver
+        """
+        padding_factor = (4 - len(entry_id) % 4) % 4
+        try:
+            decoded_url = base64.urlsafe_b64decode(
+                entry_id + "=" * padding_factor
+            ).decode("ISO-8859-1")
+        except (binascii.Error, ValueError):
+            return link
+
+        start = decoded_url.find("http")
+        if start == -1:
+            if OPAQUE_ID_PREFIX in decoded_url:
+                return None
+            return link
+        final_link = CONTROL_CHARACTERS.sub("", decoded_url[start:])
+        # AMP ids embed the URL twice; keep the second copy
+        tag = final_link.split(":")[0]
+        second = final_link.find(tag, len(tag)) if tag else -1
+        if second != -1:
+            final_link = final_link[second:]
+        if final_link == "":
+            return link
+        return final_link
+
+    def resolve(self, entry_id, link):
+        if self.resolver is None:
+            return link
+        resolved = self.resolved.get(entry_id)
+        if resolved is None:
+            try:
+                resolved = self.resolver(entry_id, link)
+            except Exception as e:
+                print("ERROR", f"error in resolving article id. Error: {e}", link)
+                resolved = None
+            if not resolved:
+                return link
+            self.resolved.put(entry_id, resolved)
+        return resolved
@@ -0,0 +1,151 @@
+import codecs
+import re
+import urllib.parse
+
+# Bodies beyond this are not articles worth parsing (or not articles at all)
+MAX_BODY_BYTES = 5 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+# Bodies of other types are never downloaded; a missing type is let through
+PAGE_CONTENT_TYPES = {
+    "text/html",
+    "application/xhtml+xml",
+    "text/plain",
+    "text/xml",
+    "application/xml",
+}
+SKIPPED_EXTENSIONS = {
+    ".pdf",
+    ".doc",
+    ".docx",
+    ".xls",
+    ".xlsx",
+    ".ppt",
+    ".pptx",
+    ".zip",
+    ".gz",
+    ".mp3",
+    ".mp4",
+    ".m4v",
+    ".m3u8",
+    ".mov",
+    ".avi",
+    ".webm",
+    ".jpg",
+    ".jpeg",
+    ".png",
+    ".gif",
+}
+VIDEO_HOSTS = {
+    "youtube.com",
+    "youtu.be",
+    "vimeo.com",
+    "dailymotion.com",
+    "tiktok.com",
+}
+# Video sections of news sites, e.g. /video/..., /videos/..., /watch/...
+VIDEO_PATH = re.compile(r"/(videos?|watch|live-?tv)(/|$)", re.IGNORECASE)
+# Where a page may declare its charset, per the HTML and XML specs
+CHARSET_SNIFF_BYTES = 4096
+META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([\w.:-]+)""", re.I)
+XML_ENCODING = re.compile(rb"""^<\?xml[^>]+encoding\s*=\s*["']([\w.:-]+)""")
+BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+
+def url_skip_reason(url):
+    """
+    Args:
+        url: article URL
+
+    Returns:
+        why the URL is not worth downloading, None if it is
+    """
+    parts = urllib.parse.urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if host.startswith("www.") or host.startswith("m."):
+        host = host.split(".", 1)[1]
+    if host in VIDEO_HOSTS:
+        return f"video host {host}"
+    path = parts.path.lower()
+    extension = path[path.rfind(".") :] if "." in path.rsplit("/", 1)[-1] else ""
+    if extension in SKIPPED_EXTENSIONS:
+        return f"{extension} file"
+    if VIDEO_PATH.search(path):
+        return "video page"
+    return None
+
+
+def media_type(content_type):
+    return (content_type or "").split(";", 1)[0].strip().lower()
+
+
+def header_skip_reason(headers, max_body_bytes=MAX_BODY_BYTES):
+    """
+    Args:
+        headers: response headers, looked up case-insensitively
+        max_body_bytes: largest body worth downloading
+
+    Returns:
+        why the body is not worth downloading, None if it is
+    """
+    content_type = media_type(headers.get("Content-Type"))
+    if content_type and content_type not in PAGE_CONTENT_TYPES:
+        return f"content type {content_type}"
+    try:
+        content_length = int(headers.get("Content-Length") or 0)
+    except ValueError:
+        content_length = 0
+    if content_length > max_body_bytes:
+        return f"body of {content_length} bytes"
+    return None
+
+
+def known_charset(name):
+    # Normalized codec name, None for labels Python does not know
+    try:
+        return codecs.lookup(name.strip("\"' ")).name
+    except (LookupError, AttributeError):
+        return None
+
+
+def detect_charset(body, content_type=None):
+    """
+    Picks the charset of a page the way browsers do: byte order mark, then
+    the Content-Type header, then a <meta> or <?xml?> declaration near the
+    top. Pages declaring nothing are UTF-8 if they decode as such and
+    Windows-1252 otherwise, which is what undeclared Latin pages mostly are.
+
+    Args:
+        body: raw page bytes
+        content_type: Content-Type header of the response
+
+    Returns:
+        charset name usable with bytes.decode
+    """
+    for bom, charset in BOMS:
+        if body.startswith(bom):
+            return charset
+    for part in (content_type or "").split(";")[1:]:
+        name, _, value = part.strip().partition("=")
+        if name.lower() == "charset" and known_charset(value):
+            return known_charset(value)
+    head = body[:CHARSET_SNIFF_BYTES]
+    match = XML_ENCODING.match(head) or META_CHARSET.search(head)
+    if match and known_charset(match.group(1).decode("ascii")):
+        return known_charset(match.group(1).decode("ascii"))
+    try:
+        body.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp1252"
+
+
+def decode_body(body, content_type=None):
+    """
+    Returns:
+        body decoded with detect_charset; undecodable bytes are replaced
+    """
+    return body.decode(detect_charset(body, content_type), errors="replace")
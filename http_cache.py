@@ -0,0 +1,214 @@
+import asyncio
+import gzip
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from html_content import decode_body
+
+DEFAULT_TTL = 30 * 24 * 3600
+DEFAULT_MAX_SIZE = 2 * 1024**3
+# Summing the index is not free, so the size limit is checked every N stores
+EVICTION_CHECK_INTERVAL = 100
+
+
+class CachedResponse:
+    def __init__(self, body, etag, last_modified, content_type, stored_at) -> None:
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_type = content_type
+        self.stored_at = stored_at
+
+    def is_fresh(self, ttl):
+        return time.time() - self.stored_at < ttl
+
+    def text(self):
+        """
+        Returns:
+            body decoded with the charset of the stored Content-Type, or the
+            one the body declares
+        """
+        return decode_body(self.body, self.content_type)
+
+    def conditional_headers(self):
+        """
+        Returns:
+            headers to revalidate the entry with a conditional request
+        """
+        conditional = {}
+        if self.etag:
+            conditional["If-None-Match"] = self.etag
+        if self.last_modified:
+            conditional["If-Modified-Since"] = self.last_modified
+        return conditional
+
+
+class HTTPCache:
+    """
+    Local cache of HTTP response bodies shared by the feed and article
+    downloads. Bodies are stored gzip compressed under the SHA-256 of their
+    content, so identical pages fetched under different URLs are stored once.
+    An SQLite index maps URLs to bodies and keeps the validators used for
+    conditional requests. Entries older than the TTL are revalidated, and the
+    least recently used entries are evicted once the cache outgrows max_size.
+    """
+
+    def __init__(self, cache_dir, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE) -> None:
+        """
+        Args:
+            cache_dir: directory of the cache; created if missing
+            ttl: seconds an entry is used without revalidation
+            max_size: max compressed bytes kept on disk
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.stores_since_eviction_check = 0
+        os.makedirs(os.path.join(cache_dir, "bodies"), exist_ok=True)
+        self.connection = sqlite3.connect(
+            os.path.join(cache_dir, "index.sqlite3"), check_same_thread=False
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "url TEXT PRIMARY KEY, body_hash TEXT NOT NULL, size INTEGER NOT NULL, "
+            "etag TEXT, last_modified TEXT, content_type TEXT, "
+            "stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS entries_body_hash ON entries (body_hash)"
+        )
+        self.connection.commit()
+
+    def body_path(self, body_hash):
+        return os.path.join(self.cache_dir, "bodies", body_hash[:2], body_hash + ".gz")
+
+    def get(self, url):
+        """
+        Args:
+            url: requested URL
+
+        Returns:
+            CachedResponse or None when the URL is not cached
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT body_hash, etag, last_modified, content_type, stored_at "
+                "FROM entries WHERE url = ?",
+                (url,),
+            ).fetchone()
+            if row is None:
+                return None
+            body_hash, etag, last_modified, content_type, stored_at = row
+            try:
+                with gzip.open(self.body_path(body_hash), "rb") as f:
+                    body = f.read()
+            except OSError:
+                # Body file vanished or is corrupt; forget the entry
+                self.connection.execute("DELETE FROM entries WHERE url = ?", (url,))
+                self.connection.commit()
+                return None
+            self.connection.execute(
+                "UPDATE entries SET accessed_at = ? WHERE url = ?", (time.time(), url)
+            )
+            self.connection.commit()
+        return CachedResponse(body, etag, last_modified, content_type, stored_at)
+
+    def store(self, url, body, headers):
+        """
+        Args:
+            url: requested URL
+            body: response body as bytes
+            headers: response headers
+        """
+        body_hash = hashlib.sha256(body).hexdigest()
+        path = self.body_path(body_hash)
+        with self.lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with gzip.open(tmp_path, "wb") as f:
+                    f.write(body)
+                os.replace(tmp_path, path)
+            now = time.time()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO entries (url, body_hash, size, etag, "
+                "last_modified, content_type, stored_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    url,
+                    body_hash,
+                    os.path.getsize(path),
+                    headers.get("ETag"),
+                    headers.get("Last-Modified"),
+                    headers.get("Content-Type"),
+                    now,
+                    now,
+                ),
+            )
+            self.connection.commit()
+            self.stores_since_eviction_check += 1
+            if self.stores_since_eviction_check >= EVICTION_CHECK_INTERVAL:
+                self.stores_since_eviction_check = 0
+                self.evict()
+
+    def revalidated(self, url):
+        # The server answered 304 Not Modified; the entry is fresh again
+        with self.lock:
+            self.connection.execute(
+                "UPDATE entries SET stored_at = ? WHERE url = ?", (time.time(), url)
+            )
+            self.connection.commit()
+
+    # Coroutine versions for the aiohttp paths: the SQLite queries and gzip
+    # file I/O run in the default executor instead of on the event loop
+
+    async def get_async(self, url):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.get, url)
+
+    async def store_async(self, url, body, headers):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.store, url, body, headers)
+
+    async def revalidated_async(self, url):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.revalidated, url)
+
+    def evict(self):
+        # Called with the lock held
+        (total_size,) = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM "
+            "(SELECT DISTINCT body_hash, size FROM entries)"
+        ).fetchone()
+        if total_size <= self.max_size:
+            return
+        rows = self.connection.execute(
+            "SELECT url, body_hash, size FROM entries ORDER BY accessed_at"
+        ).fetchall()
+        for url, body_hash, size in rows:
+            if total_size <= self.max_size:
+                break
+            self.connection.execute("DELETE FROM entries WHERE url = ?", (url,))
+            (references,) = self.connection.execute(
+                "SELECT COUNT(*) FROM entries WHERE body_hash = ?", (body_hash,)
+            ).fetchone()
+            if references == 0:
+                try:
+                    os.remove(self.body_path(body_hash))
+                except OSError:
+                    pass
+                total_size -= size
+        self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,308 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+FEED = "feed"
+ARTICLE = "article"
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+LEASE_SECONDS = 300
+HEARTBEAT_INTERVAL = 60
+MAX_ATTEMPTS = 3
+
+
+class JobQueue:
+    """
+    Durable job queue in an SQLite file, shared by the coordinator and the
+    workers of a distributed crawl. Every process opens its own JobQueue on
+    the same file. Workers lease jobs for lease_seconds and extend the lease
+    with heartbeats; a job whose lease runs out (the worker died or hung) is
+    handed to the next worker that asks, until it has been tried
+    max_attempts times.
+
+    Jobs are unique per (kind, key), so an article found by several feeds is
+    queued once across all workers.
+    """
+
+    def __init__(
+        self, path, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS
+    ) -> None:
+        """
+        Args:
+            path: SQLite file of the queue; created if missing
+            lease_seconds: seconds a lease lasts without a heartbeat
+            max_attempts: leases of a job before it is marked failed
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        # Transactions are managed explicitly; writers of other processes
+        # are waited for up to timeout seconds
+        self.connection = sqlite3.connect(
+            path, timeout=60, isolation_level=None, check_same_thread=False
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY, kind TEXT NOT NULL, key TEXT NOT NULL, "
+            "payload TEXT NOT NULL, status TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, "
+            "lease_expires REAL, updated_at REAL NOT NULL, error TEXT, "
+            "UNIQUE (kind, key))"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_kind_status ON jobs (kind, status)"
+        )
+
+    def transaction(self):
+        """
+        Returns:
+            context manager running its block in one write transaction
+        """
+        return _Transaction(self)
+
+    def put_many(self, kind, jobs):
+        """
+        Args:
+            kind: FEED or ARTICLE
+            jobs: iterable of (key, payload) with a JSON-serializable payload
+
+        Returns:
+            number of new jobs; keys already queued are ignored
+        """
+        now = time.time()
+        rows = [
+            (kind, key, json.dumps(payload), PENDING, now) for key, payload in jobs
+        ]
+        with self.transaction() as connection:
+            before = connection.total_changes
+            connection.executemany(
+                "INSERT OR IGNORE INTO jobs (kind, key, payload, status, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            return connection.total_changes - before
+
+    def lease(self, kind, worker_id, limit=1):
+        """
+        Leases pending jobs, after putting expired leases back in the queue.
+
+        Args:
+            kind: FEED or ARTICLE
+            worker_id: name of the leasing worker
+            limit: max jobs to lease
+
+        Returns:
+            jobs: list of (job_id, payload)
+        """
+        now = time.time()
+        with self.transaction() as connection:
+            self._requeue_expired(connection, now)
+            rows = connection.execute(
+                "SELECT id, payload FROM jobs WHERE kind = ? AND status = ? "
+                "ORDER BY id LIMIT ?",
+                (kind, PENDING, limit),
+            ).fetchall()
+            connection.executemany(
+                "UPDATE jobs SET status = ?, worker = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                [
+                    (LEASED, worker_id, now + self.lease_seconds, now, job_id)
+                    for job_id, _ in rows
+                ],
+            )
+        return [(job_id, json.loads(payload)) for job_id, payload in rows]
+
+    def heartbeat(self, job_ids, worker_id):
+        """
+        Extends the leases of jobs the worker still holds.
+
+        Returns:
+            number of leases extended; lower than len(job_ids) when a lease
+            already ran out and the job went to another worker
+        """
+        now = time.time()
+        with self.transaction() as connection:
+            before = connection.total_changes
+            connection.executemany(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? "
+                "WHERE id = ? AND worker = ? AND status = ?",
+                [
+                    (now + self.lease_seconds, now, job_id, worker_id, LEASED)
+                    for job_id in job_ids
+                ],
+            )
+            return connection.total_changes - before
+
+    def complete(self, job_ids, worker_id):
+        self._finish(job_ids, worker_id, DONE, None)
+
+    def fail(self, job_ids, worker_id, error):
+        """
+        Puts jobs back in the queue, or marks them failed once they used up
+        max_attempts.
+        """
+        self._finish(job_ids, worker_id, None, str(error))
+
+    def _finish(self, job_ids, worker_id, status, error):
+        now = time.time()
+        with self.transaction() as connection:
+            for job_id in job_ids:
+                new_status = status
+                if new_status is None:
+                    (attempts,) = connection.execute(
+                        "SELECT attempts FROM jobs WHERE id = ?", (job_id,)
+                    ).fetchone()
+                    new_status = FAILED if attempts >= self.max_attempts else PENDING
+                # A job requeued after its lease ran out belongs to the new
+                # worker now; late results of the old one are ignored
+                connection.execute(
+                    "UPDATE jobs SET status = ?, error = ?, lease_expires = NULL, "
+                    "updated_at = ? WHERE id = ? AND worker = ? AND status = ?",
+                    (new_status, error, now, job_id, worker_id, LEASED),
+                )
+
+    def requeue_expired(self):
+        """
+        Returns:
+            number of expired leases put back in the queue or marked failed
+        """
+        with self.transaction() as connection:
+            return self._requeue_expired(connection, time.time())
+
+    def _requeue_expired(self, connection, now):
+        before = connection.total_changes
+        connection.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+            "error = 'lease expired', updated_at = ? "
+            "WHERE status = ? AND lease_expires < ?",
+            (self.max_attempts, FAILED, PENDING, now, LEASED, now),
+        )
+        return connection.total_changes - before
+
+    def counts(self, kind):
+        """
+        Returns:
+            dict of status -> number of jobs of kind
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE kind = ? GROUP BY status",
+                (kind,),
+            ).fetchall()
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def outstanding(self, kind, exclude_worker=None):
+        """
+        Args:
+            kind: FEED or ARTICLE
+            exclude_worker: do not count jobs leased by this worker
+
+        Returns:
+            number of pending jobs plus jobs leased by other workers
+        """
+        with self.lock:
+            (count,) = self.connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE kind = ? AND (status = ? OR "
+                "(status = ? AND worker IS NOT ?))",
+                (kind, PENDING, LEASED, exclude_worker),
+            ).fetchone()
+        return count
+
+    def failed_jobs(self, kind):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT key, error FROM jobs WHERE kind = ? AND status = ?",
+                (kind, FAILED),
+            ).fetchall()
+        return [{"key": key, "error": error} for key, error in rows]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class _Transaction:
+    def __init__(self, job_queue) -> None:
+        self.job_queue = job_queue
+
+    def __enter__(self):
+        self.job_queue.lock.acquire()
+        connection = self.job_queue.connection
+        try:
+            # Take the write lock up front so two workers never lease the
+            # same job
+            connection.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self.job_queue.lock.release()
+            raise
+        return connection
+
+    def __exit__(self, exc_type, exc_value, tb):
+        try:
+            if exc_type is None:
+                self.job_queue.connection.execute("COMMIT")
+            else:
+                self.job_queue.connection.execute("ROLLBACK")
+        finally:
+            self.job_queue.lock.release()
+        return False
+
+
+class Heartbeat:
+    """
+    Background thread extending the leases of the jobs a worker holds every
+    interval seconds.
+    """
+
+    def __init__(self, job_queue, worker_id, interval=HEARTBEAT_INTERVAL) -> None:
+        self.job_queue = job_queue
+        self.worker_id = worker_id
+        self.interval = interval
+        self.held = set()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def hold(self, job_ids):
+        with self.lock:
+            self.held.update(job_ids)
+
+    def drop(self, job_ids):
+        with self.lock:
+            self.held.difference_update(job_ids)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.held)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            with self.lock:
+                job_ids = list(self.held)
+            if not job_ids:
+                continue
+            try:
+                self.job_queue.heartbeat(job_ids, self.worker_id)
+            except sqlite3.Error as e:
+                # The next beat tries again; the lease outlives a few misses
+                print("ERROR", f"heartbeat failed. Error: {e}")
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
@@ -1,6 +1,13 @@
-from url_fetcher import URL_FETCHER
+from url_fetcher import URL_FETCHER, GOOGLE_NEWS_RSS_URL
 from data_fetcher import DataFetcher
 from utils import TimeElapsed
+from seen_index import SeenURLIndex
+from query_state import QueryStateStore
+from http_cache import HTTPCache
+from near_duplicates import NearDuplicateIndex
+from metrics import get_metrics
+from records import DiscoveredArticle
+import argparse
 import datetime
 import os
 import json
@@ -11,6 +18,82 @@ def save_json(data, filename):
         json.dump(data, f, indent=4)
 
 
+def read_articles(filename):
+    """
+    Yields the articles of a scrapped_raw_url.jsonl file one line at a time.
+    """
+    with open(filename) as f:
+        for line in f:
+            if line.strip():
+                yield DiscoveredArticle.from_dict(json.loads(line))
+
+
+def open_state(state_dir=None, cache_dir=None):
+    """
+    Opens the state shared between runs.
+
+    Args:
+        state_dir: directory of the seen URL index and the query state
+        cache_dir: directory of the HTTP cache
+
+    Returns:
+        (seen_index, query_state, near_duplicates, cache): None for the parts
+            not enabled
+    """
+    # Cross-run state: links extracted by earlier runs are skipped, and so
+    # are syndicated copies of stories extracted before
+    seen_index = None
+    query_state = None
+    near_duplicates = None
+    if state_dir:
+        seen_index = SeenURLIndex(os.path.join(state_dir, "seen_urls.sqlite3"))
+        query_state = QueryStateStore(os.path.join(state_dir, "query_state.json"))
+        near_duplicates = NearDuplicateIndex(
+            os.path.join(state_dir, "near_duplicates.sqlite3")
+        )
+
+    # Feed and article downloads are reused from here on reruns
+    cache = HTTPCache(cache_dir) if cache_dir else None
+    return seen_index, query_state, near_duplicates, cache
+
+
+def watermark_progress(url_fetcher):
+    """
+    Returns:
+        on_progress callback moving the watermarks of url_fetcher as the
+            articles of its windows get journaled, None without query state
+    """
+    if url_fetcher is None or url_fetcher.query_state is None:
+        return None
+    return url_fetcher.articles_done
+
+
+def run_streaming(
+    url_fetcher, data_fetcher, save_path, multiprocess=False, **url_fetcher_kwargs
+):
+    """
+    Feeds every new article link straight to the extraction workers instead
+    of waiting for discovery to finish. Discovery runs ahead of extraction by
+    a bounded number of articles, and neither side keeps the full list.
+
+    Args:
+        url_fetcher: URL_FETCHER instance
+        data_fetcher: DataFetcher instance
+        save_path: run directory
+        multiprocess: extract in worker processes instead of threads
+        url_fetcher_kwargs: forwarded to URL_FETCHER.iter_articles
+    """
+    article_urls = url_fetcher.iter_articles(save_path=save_path, **url_fetcher_kwargs)
+    data_fetcher.main(
+        article_urls=article_urls,
+        save_json=True,
+        save_csv=True,
+        save_path=save_path,
+        multithreaded=True,
+        multiprocess=multiprocess,
+    )
+
+
 def main(
     keywords,
     start_date=None,
@@ -18,7 +101,17 @@ def main(
     timedelta=3,
     langauges=["en"],
     countries=["US"],
+    streaming=False,
+    state_dir=None,
+    incremental=False,
+    cache_dir=None,
+    max_per_title=None,
+    metrics_port=None,
+    rss_base_url=GOOGLE_NEWS_RSS_URL,
+    extraction_processes=None,
 ):
+    if incremental and not state_dir:
+        raise ValueError("incremental mode needs a state_dir")
     if not start_date:
         start_date = datetime.datetime.now()
         end_date = datetime.datetime.now() - datetime.timedelta(days=timedelta)
@@ -35,12 +128,65 @@ def main(
         "langauges": langauges,
         "countries": countries,
         "save_path": save_path,
+        "streaming": streaming,
+        "state_dir": state_dir,
+        "incremental": incremental,
+        "cache_dir": cache_dir,
+        "max_per_title": max_per_title,
+        "metrics_port": metrics_port,
+        "rss_base_url": rss_base_url,
+        "extraction_processes": extraction_processes,
     }
 
     save_json(metadata, f"{save_path}/metadata.json")
 
+    seen_index, query_state, near_duplicates, cache = open_state(
+        state_dir, cache_dir
+    )
+    metrics = get_metrics()
+    if metrics_port:
+        metrics.serve(metrics_port)
+
     time_elapsed = TimeElapsed()
-    url_fetcher = URL_FETCHER()
+    url_fetcher = URL_FETCHER(
+        seen_index=seen_index,
+        query_state=query_state,
+        cache=cache,
+        max_per_title=max_per_title,
+        rss_base_url=rss_base_url,
+    )
+    if streaming:
+        data_fetcher = DataFetcher(
+            number_of_threads=5,
+            seen_index=seen_index,
+            cache=cache,
+            near_duplicates=near_duplicates,
+            extraction_processes=extraction_processes,
+            on_progress=watermark_progress(url_fetcher),
+        )
+        run_streaming(
+            url_fetcher,
+            data_fetcher,
+            save_path,
+            multiprocess=bool(extraction_processes),
+            keywords=keywords,
+            start_date=start_date,
+            end_date=end_date,
+            timedelta=timedelta,
+            langauges=langauges,
+            countries=countries,
+            incremental=incremental,
+        )
+        if query_state is not None:
+            # Only windows whose articles are all journaled move a watermark
+            url_fetcher.save_watermarks()
+            query_state.save()
+        total_time = time_elapsed.get_time_elapsed()
+        metrics.set_gauge("stage_seconds", total_time.total_seconds(), stage="total")
+        metrics.save(f"{save_path}/metrics.json")
+        print("Total time taken: ", total_time)
+        return
+
     article_urls = url_fetcher.main(
         keywords=keywords,
         start_date=start_date,
@@ -50,29 +196,150 @@ def main(
         countries=countries,
         save_json=True,
         save_path=save_path,
+        incremental=incremental,
     )
     url_time = time_elapsed.get_time_elapsed()
     print("Time taken to fetch URLs: ", url_time)
 
-    data_fetcher = DataFetcher(number_of_threads=5)
+    data_fetcher = DataFetcher(
+        number_of_threads=5,
+        seen_index=seen_index,
+        cache=cache,
+        near_duplicates=near_duplicates,
+        extraction_processes=extraction_processes,
+        on_progress=watermark_progress(url_fetcher),
+    )
     data_fetcher.main(
         article_urls=article_urls,
         save_json=True,
         save_csv=True,
         save_path=save_path,
         multithreaded=True,
+        multiprocess=bool(extraction_processes),
     )
+    if query_state is not None:
+        # Only windows whose articles are all journaled move a watermark
+        url_fetcher.save_watermarks()
+        query_state.save()
     total_time = time_elapsed.get_time_elapsed()
+    metrics.set_gauge("stage_seconds", url_time.total_seconds(), stage="discovery")
+    metrics.set_gauge(
+        "stage_seconds", (total_time - url_time).total_seconds(), stage="extraction"
+    )
+    metrics.set_gauge("stage_seconds", total_time.total_seconds(), stage="total")
+    metrics.save(f"{save_path}/metrics.json")
     print("Time taken to fetch data: ", total_time - url_time)
     print("Total time taken: ", total_time)
 
 
+def resume(run_dir):
+    """
+    Continues an interrupted run in run_dir. Discovered URLs are reused when
+    discovery had finished, and articles already recorded in the progress
+    journal are skipped.
+
+    Args:
+        run_dir: directory of the interrupted run
+    """
+    with open(f"{run_dir}/metadata.json") as f:
+        metadata = json.load(f)
+
+    seen_index, query_state, near_duplicates, cache = open_state(
+        metadata.get("state_dir"), metadata.get("cache_dir")
+    )
+    metrics = get_metrics()
+    if metadata.get("metrics_port"):
+        metrics.serve(metadata["metrics_port"])
+    time_elapsed = TimeElapsed()
+    # Watermarks only move when discovery runs again below
+    url_fetcher = None
+    raw_url_file = f"{run_dir}/scrapped_raw_url.json"
+    streamed_url_file = f"{run_dir}/scrapped_raw_url.jsonl"
+    if os.path.exists(raw_url_file):
+        print(f"[INFO] Reusing discovered URLs from {raw_url_file}")
+        with open(raw_url_file) as f:
+            article_urls = [DiscoveredArticle.from_dict(data) for data in json.load(f)]
+    elif os.path.exists(streamed_url_file):
+        print(f"[INFO] Reusing discovered URLs from {streamed_url_file}")
+        article_urls = read_articles(streamed_url_file)
+    else:
+        # Discovery did not finish; run it again with the same parameters
+        url_fetcher = URL_FETCHER(
+            seen_index=seen_index,
+            query_state=query_state,
+            cache=cache,
+            max_per_title=metadata.get("max_per_title"),
+            rss_base_url=metadata.get("rss_base_url", GOOGLE_NEWS_RSS_URL),
+        )
+        article_urls = url_fetcher.main(
+            keywords=metadata["keywords"],
+            start_date=datetime.datetime.strptime(metadata["start_date"], "%Y-%m-%d"),
+            end_date=datetime.datetime.strptime(metadata["end_date"], "%Y-%m-%d"),
+            timedelta=metadata["timedelta"],
+            langauges=metadata["langauges"],
+            countries=metadata["countries"],
+            save_json=True,
+            save_path=run_dir,
+            incremental=metadata.get("incremental", False),
+        )
+
+    extraction_processes = metadata.get("extraction_processes")
+    data_fetcher = DataFetcher(
+        number_of_threads=5,
+        seen_index=seen_index,
+        cache=cache,
+        near_duplicates=near_duplicates,
+        extraction_processes=extraction_processes,
+        on_progress=watermark_progress(url_fetcher),
+    )
+    data_fetcher.main(
+        article_urls=article_urls,
+        save_json=True,
+        save_csv=True,
+        save_path=run_dir,
+        multithreaded=True,
+        multiprocess=bool(extraction_processes),
+    )
+    if query_state is not None:
+        if url_fetcher is not None:
+            url_fetcher.save_watermarks()
+        query_state.save()
+    # Counters restart with the resumed process; the snapshot covers this part
+    metrics.save(f"{run_dir}/metrics.json")
+    print("Total time taken: ", time_elapsed.get_time_elapsed())
+
+
 if __name__ == "__main__":
-    main(
-        keywords=["gaza war"],
-        # start_date=datetime.datetime(2024, 4, 20),
-        # end_date=datetime.datetime(2024, 4, 15),
-        timedelta=3,
-        langauges=["en"],
-        countries=["US"],
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--resume",
+        metavar="RUN_DIR",
+        help="continue an interrupted run from its directory",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="serve Prometheus metrics on this port while the run is going",
     )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=None,
+        help="extract articles in this many worker processes instead of threads",
+    )
+    args = parser.parse_args()
+
+    if args.resume:
+        resume(args.resume)
+    else:
+        main(
+            keywords=["gaza war"],
+            # start_date=datetime.datetime(2024, 4, 20),
+            # end_date=datetime.datetime(2024, 4, 15),
+            timedelta=3,
+            langauges=["en"],
+            countries=["US"],
+            metrics_port=args.metrics_port,
+            extraction_processes=args.processes,
+        )
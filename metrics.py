@@ -0,0 +1,363 @@
+import bisect
+import http.server
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+# Upper bounds in seconds; the last bucket (+Inf) is implicit
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRICS_PORT = 9108
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def domain_of(url):
+    return urlsplit(url).netloc.lower()
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, counts, total, count):
+        for i, bucket_count in enumerate(counts):
+            self.counts[i] += bucket_count
+        self.sum += total
+        self.count += count
+
+    def quantile(self, q):
+        """
+        Args:
+            q: quantile between 0 and 1
+
+        Returns:
+            upper bound of the bucket holding the quantile, None if empty
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters, gauges and latency histograms of a run, keyed by
+    name and labels. The registry can be written as a JSON snapshot or served
+    in the Prometheus text format.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.gauge_callbacks = {}
+        self.histograms = {}
+        self.server = None
+
+    @staticmethod
+    def key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self.lock:
+            self.gauges[self.key(name, labels)] = value
+
+    def add_gauge(self, name, delta, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            self.gauges[key] = self.gauges.get(key, 0) + delta
+
+    def register_gauge(self, name, callback, **labels):
+        """
+        Args:
+            name: gauge name
+            callback: called without arguments whenever the gauge is read,
+                e.g. the qsize of a queue
+        """
+        with self.lock:
+            self.gauge_callbacks[self.key(name, labels)] = callback
+
+    def unregister_gauge(self, name, **labels):
+        with self.lock:
+            self.gauge_callbacks.pop(self.key(name, labels), None)
+
+    def observe(self, name, value, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def collect(self):
+        """
+        Takes the counters and histograms recorded so far and resets them.
+        Worker processes send the result to the main process, which adds it
+        to its own registry with merge.
+
+        Returns:
+            state: picklable dict of counters and histograms
+        """
+        with self.lock:
+            state = {
+                "counters": list(self.counters.items()),
+                "histograms": [
+                    (key, histogram.counts, histogram.sum, histogram.count)
+                    for key, histogram in self.histograms.items()
+                ],
+            }
+            self.counters = {}
+            self.histograms = {}
+        return state
+
+    def merge(self, state):
+        with self.lock:
+            for key, value in state["counters"]:
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, counts, total, count in state["histograms"]:
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram()
+                histogram.merge(counts, total, count)
+
+    def read_gauges(self):
+        with self.lock:
+            gauges = dict(self.gauges)
+            callbacks = list(self.gauge_callbacks.items())
+        for key, callback in callbacks:
+            try:
+                gauges[key] = callback()
+            except Exception:
+                continue
+        return gauges
+
+    def snapshot(self):
+        """
+        Returns:
+            snapshot: JSON-serializable dict of every metric with its labels
+        """
+        gauges = self.read_gauges()
+        with self.lock:
+            counters = list(self.counters.items())
+            histograms = list(self.histograms.items())
+
+        def entry(key, **values):
+            return {"name": key[0], "labels": dict(key[1]), **values}
+
+        return {
+            "time": time.time(),
+            "counters": [entry(key, value=value) for key, value in counters],
+            "gauges": [entry(key, value=value) for key, value in gauges.items()],
+            "histograms": [
+                entry(
+                    key,
+                    count=histogram.count,
+                    sum=histogram.sum,
+                    p50=histogram.quantile(0.5),
+                    p99=histogram.quantile(0.99),
+                    buckets=dict(
+                        zip(
+                            [str(bound) for bound in histogram.buckets] + ["+Inf"],
+                            histogram.counts,
+                        )
+                    ),
+                )
+                for key, histogram in histograms
+            ],
+        }
+
+    def save(self, path):
+        # Write to a temporary file first so a crash never leaves half a file
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.snapshot(), f, indent=4)
+        os.replace(tmp_path, path)
+
+    def to_prometheus(self):
+        """
+        Returns:
+            text: metrics in the Prometheus text exposition format
+        """
+
+        def labels_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(
+                f'{name}="{escape_label(value)}"' for name, value in pairs
+            ) + "}"
+
+        gauges = self.read_gauges()
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(
+                (key, list(h.buckets), list(h.counts), h.sum, h.count)
+                for key, h in self.histograms.items()
+            )
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{labels_text(labels)} {value}")
+        for (name, labels), value in sorted(gauges.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} gauge")
+                typed.add(name)
+            lines.append(f"{name}{labels_text(labels)} {value}")
+        for (name, labels), buckets, counts, total, count in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + ["+Inf"], counts):
+                cumulative += bucket_count
+                le = labels_text(labels, [("le", bound)])
+                lines.append(f"{name}_bucket{le} {cumulative}")
+            lines.append(f"{name}_sum{labels_text(labels)} {total}")
+            lines.append(f"{name}_count{labels_text(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=METRICS_PORT, host="127.0.0.1"):
+        """
+        Serves the metrics at http://host:port/metrics from a daemon thread.
+
+        Args:
+            port: port to listen on
+            host: interface to listen on
+
+        Returns:
+            server: the running http.server instance
+        """
+        registry = self
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        host, port = self.server.server_address[:2]
+        print(f"[INFO] Serving metrics at http://{host}:{port}/metrics")
+        return self.server
+
+    def stop_serving(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def get_metrics():
+    """
+    Returns:
+        the MetricsRegistry of this process, created on first use
+    """
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = MetricsRegistry()
+    return _metrics
+
+
+def reset_metrics():
+    """
+    Starts an empty registry in this process. Used as the initializer of
+    worker processes, which would otherwise inherit a forked copy of the
+    parent's metrics and report them twice.
+    """
+    global _metrics
+    with _metrics_lock:
+        _metrics = MetricsRegistry()
+
+
+def trace_config(metrics, stage):
+    """
+    aiohttp tracing hooks recording the DNS, connect and time-to-first-byte
+    phases of every request into the http_phase_seconds histogram. The
+    download phase is timed by the caller once the body is read.
+
+    Args:
+        metrics: MetricsRegistry
+        stage: "feed" or "article"
+
+    Returns:
+        aiohttp.TraceConfig to pass to the ClientSession
+    """
+    import aiohttp
+
+    def timed_phase(phase, start_attribute):
+        async def on_end(session, context, params):
+            started = getattr(context, start_attribute, None)
+            if started is not None:
+                metrics.observe(
+                    "http_phase_seconds",
+                    time.perf_counter() - started,
+                    stage=stage,
+                    phase=phase,
+                )
+
+        return on_end
+
+    def mark(attribute):
+        async def on_start(session, context, params):
+            setattr(context, attribute, time.perf_counter())
+
+        return on_start
+
+    config = aiohttp.TraceConfig()
+    config.on_request_start.append(mark("request_started"))
+    config.on_dns_resolvehost_start.append(mark("dns_started"))
+    config.on_dns_resolvehost_end.append(timed_phase("dns", "dns_started"))
+    config.on_connection_create_start.append(mark("connect_started"))
+    config.on_connection_create_end.append(timed_phase("connect", "connect_started"))
+    # on_request_end fires once the response headers are in
+    config.on_request_end.append(timed_phase("ttfb", "request_started"))
+    return config
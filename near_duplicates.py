@@ -0,0 +1,227 @@
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+
+SIMHASH_BITS = 64
+SHINGLE_SIZE = 3
+# Four 16 bit bands: two signatures within 3 bits of each other always share
+# at least one band, so band lookups find every near duplicate.
+LSH_BANDS = 4
+MAX_HAMMING_DISTANCE = 3
+# Shorter texts are too generic to call duplicates
+MIN_TOKENS = 30
+TOKEN = re.compile(r"\w+")
+# Titles whose word sets overlap this much (Jaccard) are the same story
+TITLE_SIMILARITY = 0.8
+
+# SimHash needs a per-bit vote over all shingle hashes. Instead of looping
+# over 64 bits per shingle, every hash is spread into 64 lanes of LANE_BITS
+# bits with a byte lookup table, so summing the spread hashes counts the
+# votes of all bits at once.
+LANE_BITS = 24
+LANE_MASK = (1 << LANE_BITS) - 1
+MAX_SHINGLES = LANE_MASK
+SPREAD_BYTE = [
+    sum(((byte >> bit) & 1) << (bit * LANE_BITS) for bit in range(8))
+    for byte in range(256)
+]
+
+
+def spread_hash(value):
+    spread = 0
+    for byte_index in range(SIMHASH_BITS // 8):
+        byte = (value >> (8 * byte_index)) & 0xFF
+        spread |= SPREAD_BYTE[byte] << (8 * byte_index * LANE_BITS)
+    return spread
+
+
+def simhash(text):
+    """
+    Args:
+        text: normalized article text
+
+    Returns:
+        64 bit SimHash over word shingles, None for texts under MIN_TOKENS
+    """
+    tokens = TOKEN.findall(text.lower())
+    if len(tokens) < MIN_TOKENS:
+        return None
+    shingles = {
+        " ".join(tokens[i : i + SHINGLE_SIZE])
+        for i in range(len(tokens) - SHINGLE_SIZE + 1)
+    }
+    shingles = list(shingles)[:MAX_SHINGLES]
+    votes = 0
+    for shingle in shingles:
+        digest = hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest()
+        votes += spread_hash(int.from_bytes(digest, "big"))
+    signature = 0
+    for bit in range(SIMHASH_BITS):
+        if ((votes >> (bit * LANE_BITS)) & LANE_MASK) * 2 > len(shingles):
+            signature |= 1 << bit
+    return signature
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+def to_signed(value):
+    # SQLite integers are signed 64 bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+class NearDuplicateIndex:
+    """
+    Persistent SimHash index of extracted article texts. Syndicated copies of
+    a story (AP, Reuters reposts) reach the fetcher under different URLs;
+    their texts hash to signatures a few bits apart, and the index maps them
+    to the URL first stored for the story.
+    """
+
+    def __init__(self, path, max_distance=MAX_HAMMING_DISTANCE) -> None:
+        """
+        Args:
+            path: SQLite file of the index; created if missing
+            max_distance: max differing bits to call two texts duplicates;
+                must stay below LSH_BANDS
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_distance = max_distance
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        band_columns = ", ".join(
+            f"band{i} INTEGER NOT NULL" for i in range(LSH_BANDS)
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS signatures "
+            f"(url TEXT PRIMARY KEY, simhash INTEGER NOT NULL, {band_columns})"
+        )
+        for i in range(LSH_BANDS):
+            self.connection.execute(
+                f"CREATE INDEX IF NOT EXISTS signatures_band{i} "
+                f"ON signatures (band{i})"
+            )
+        self.connection.commit()
+
+    @staticmethod
+    def bands(signature):
+        band_bits = SIMHASH_BITS // LSH_BANDS
+        return [
+            (signature >> (i * band_bits)) & ((1 << band_bits) - 1)
+            for i in range(LSH_BANDS)
+        ]
+
+    def check_and_add(self, url, text):
+        """
+        Looks up the text of an article and stores it when it is new.
+
+        Args:
+            url: article URL
+            text: normalized article text
+
+        Returns:
+            canonical: URL of the stored near duplicate, None if the article
+                is new (or too short to compare)
+        """
+        signature = simhash(text)
+        if signature is None:
+            return None
+        bands = self.bands(signature)
+        condition = " OR ".join(f"band{i} = ?" for i in range(LSH_BANDS))
+        with self.lock:
+            candidates = self.connection.execute(
+                f"SELECT url, simhash FROM signatures WHERE {condition}", bands
+            ).fetchall()
+            best = None
+            for candidate_url, candidate in candidates:
+                if candidate_url == url:
+                    continue
+                distance = hamming_distance(signature, to_unsigned(candidate))
+                if distance <= self.max_distance and (
+                    best is None or distance < best[0]
+                ):
+                    best = (distance, candidate_url)
+            if best is not None:
+                return best[1]
+            self.connection.execute(
+                "INSERT OR REPLACE INTO signatures VALUES "
+                f"(?, ?, {', '.join('?' * LSH_BANDS)})",
+                [url, to_signed(signature)] + bands,
+            )
+            self.connection.commit()
+        return None
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def token_set_similarity(a, b):
+    """
+    Returns:
+        Jaccard similarity of two token sets, 1.0 for two empty sets
+    """
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class NearDuplicateTitles:
+    """
+    In-memory groups of near-identical titles, such as the copies of a wire
+    story that publishers retitle slightly. A title joins the first group
+    whose first title has a token set similarity of at least similarity
+    with it. Titles are too short for SimHash, so candidates are found by
+    prefix filtering instead: with the tokens of every title in one fixed
+    order, two sets that similar always share one of their first few
+    tokens, and each group is only indexed under those.
+    """
+
+    def __init__(self, similarity=TITLE_SIMILARITY) -> None:
+        self.similarity = similarity
+        self.groups = []
+        self.prefix_index = {}
+
+    def prefix(self, tokens):
+        length = len(tokens) - math.ceil(self.similarity * len(tokens)) + 1
+        # Any fixed order works; the index only lives as long as the process
+        return sorted(tokens, key=hash)[:length]
+
+    def group_of(self, title):
+        """
+        Args:
+            title: normalized title
+
+        Returns:
+            group: number of the group of the title, a new one when no group
+                is similar enough; None for titles without words
+        """
+        tokens = frozenset(TOKEN.findall(title.lower()))
+        if not tokens:
+            return None
+        prefix = self.prefix(tokens)
+        checked = set()
+        for token in prefix:
+            for group in self.prefix_index.get(token, ()):
+                if group in checked:
+                    continue
+                checked.add(group)
+                if token_set_similarity(tokens, self.groups[group]) >= self.similarity:
+                    return group
+        group = len(self.groups)
+        self.groups.append(tokens)
+        for token in prefix:
+            self.prefix_index.setdefault(token, []).append(group)
+        return group
@@ -0,0 +1,302 @@
+import asyncio
+import collections
+import email.utils
+import threading
+import time
+import urllib.parse
+
+REQUESTS_PER_DOMAIN = 2
+DOMAIN_RATE = 1.0
+DOMAIN_BURST = 2
+MIN_DOMAIN_RATE = 0.05
+MAX_DOMAIN_RATE = 5.0
+RATE_INCREASE = 0.1
+DOMAIN_QUEUE_SIZE = 1000
+# Statuses publishers use to tell us to slow down; retry.classify counts
+# them as THROTTLED, worth another attempt after a backoff
+THROTTLE_STATUSES = {429, 503}
+# Statuses that halve the rate of a domain. Bot protection often answers 403
+# to clients that come too fast, so a 403 slows the domain down as well; it
+# is no throttle status though, since a 403 usually refuses the page for
+# good (paywall, region block) and retrying it would only waste attempts
+SLOW_DOWN_STATUSES = THROTTLE_STATUSES | {403}
+
+
+def parse_retry_after(value):
+    """
+    Args:
+        value: Retry-After header; seconds or an HTTP date
+
+    Returns:
+        seconds to wait, None if the header is missing or malformed
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class DomainState:
+    def __init__(self, rate, burst) -> None:
+        self.rate = rate
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.pending = collections.deque()
+
+
+class DomainScheduler:
+    """
+    Politeness scheduler for article downloads. Every domain gets a cap on
+    concurrent requests and a token bucket rate. The rate halves when the
+    domain answers with a throttling status, honours Retry-After, and creeps
+    back up on successful responses.
+
+    It doubles as the task queue of the threaded WorkerPool: get hands out
+    the next item of a domain that may be requested right now, rotating over
+    domains, so a slow or throttled host never stalls the workers.
+    """
+
+    def __init__(
+        self,
+        requests_per_domain=REQUESTS_PER_DOMAIN,
+        rate=DOMAIN_RATE,
+        burst=DOMAIN_BURST,
+        maxsize=DOMAIN_QUEUE_SIZE,
+    ) -> None:
+        """
+        Args:
+            requests_per_domain: max concurrent requests per domain
+            rate: initial requests per second per domain
+            burst: requests a domain may receive back to back
+            maxsize: max pending items when used as a task queue; put blocks
+                beyond it
+        """
+        self.requests_per_domain = requests_per_domain
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        self.condition = threading.Condition()
+        self.domains = collections.OrderedDict()
+        self.pending_count = 0
+        self.sentinels = 0
+        self.local = threading.local()
+
+    @staticmethod
+    def domain_of(url):
+        return (urllib.parse.urlsplit(url).hostname or "").lower()
+
+    def _state(self, domain):
+        state = self.domains.get(domain)
+        if state is None:
+            state = DomainState(self.rate, self.burst)
+            self.domains[domain] = state
+        return state
+
+    def _try_acquire(self, state):
+        """
+        Called with the condition held.
+
+        Returns:
+            0 if a request slot was taken, else seconds until one may be free
+        """
+        now = time.monotonic()
+        state.tokens = min(
+            self.burst, state.tokens + (now - state.updated_at) * state.rate
+        )
+        state.updated_at = now
+        if now < state.blocked_until:
+            return state.blocked_until - now
+        if state.in_flight >= self.requests_per_domain:
+            # Woken up by release
+            return None
+        if state.tokens < 1:
+            return (1 - state.tokens) / state.rate
+        state.tokens -= 1
+        state.in_flight += 1
+        return 0
+
+    def try_acquire(self, url):
+        """
+        Args:
+            url: URL about to be requested
+
+        Returns:
+            0 if the request may go ahead now, else seconds to wait first
+        """
+        with self.condition:
+            wait = self._try_acquire(self._state(self.domain_of(url)))
+        return 0.1 if wait is None else wait
+
+    def acquire(self, url):
+        """
+        Blocks until a request to the domain of url may go ahead. Returns at
+        once when get already reserved the domain for the calling thread.
+        """
+        if getattr(self.local, "reserved", None) == self.domain_of(url):
+            return
+        while True:
+            wait = self.try_acquire(url)
+            if wait == 0:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, url):
+        while True:
+            wait = self.try_acquire(url)
+            if wait == 0:
+                return
+            await asyncio.sleep(wait)
+
+    def release(self, url, status=None, retry_after=None):
+        """
+        Frees the request slot of the domain and adapts its rate to the
+        response.
+
+        Args:
+            url: requested URL
+            status: HTTP status of the response, None if the request failed
+            retry_after: value of the Retry-After header
+        """
+        domain = self.domain_of(url)
+        with self.condition:
+            if getattr(self.local, "reserved", None) == domain:
+                self.local.reserved = None
+            state = self._state(domain)
+            state.in_flight = max(0, state.in_flight - 1)
+            now = time.monotonic()
+            if status in SLOW_DOWN_STATUSES:
+                state.rate = max(MIN_DOMAIN_RATE, state.rate / 2)
+                state.tokens = 0
+                delay = parse_retry_after(retry_after)
+                if delay is None:
+                    delay = 1 / state.rate
+                state.blocked_until = max(state.blocked_until, now + delay)
+                print(
+                    "INFO",
+                    f"{domain} answered {status}. Slowing down to "
+                    f"{state.rate:.2f} requests/s.",
+                )
+            elif status is not None and status < 400:
+                state.rate = min(MAX_DOMAIN_RATE, state.rate + RATE_INCREASE)
+            self.condition.notify_all()
+
+    def put(self, item):
+        """
+        Queues a WorkerPool item. The first element of an item is its URL;
+        None is the WorkerPool stop sentinel.
+        """
+        with self.condition:
+            if item is None:
+                self.sentinels += 1
+                self.condition.notify_all()
+                return
+            while self.maxsize and self.pending_count >= self.maxsize:
+                self.condition.wait()
+            domain = self.domain_of(item[0])
+            self._state(domain).pending.append(item)
+            self.pending_count += 1
+            self.condition.notify_all()
+
+    def get(self):
+        """
+        Blocks until an item of some domain may be requested and reserves a
+        request slot of that domain for the calling thread.
+        """
+        with self.condition:
+            while True:
+                wait = None
+                for domain in list(self.domains):
+                    state = self.domains[domain]
+                    if not state.pending:
+                        continue
+                    domain_wait = self._try_acquire(state)
+                    if domain_wait == 0:
+                        # Rotate so the next get starts with another domain
+                        self.domains.move_to_end(domain)
+                        item = state.pending.popleft()
+                        self.pending_count -= 1
+                        self.local.reserved = domain
+                        self.condition.notify_all()
+                        return item
+                    if domain_wait is None:
+                        continue
+                    if wait is None or domain_wait < wait:
+                        wait = domain_wait
+                if self.pending_count == 0 and self.sentinels:
+                    self.sentinels -= 1
+                    return None
+                self.condition.wait(timeout=wait)
+
+    def cancel(self, url):
+        """
+        Frees the request slot taken for url and hands its rate token back,
+        for an item that was handed out but never requested (a fresh cache
+        hit, a skipped URL), so cached reruns are not rate limited.
+        """
+        domain = self.domain_of(url)
+        if getattr(self.local, "reserved", None) == domain:
+            self.local.reserved = None
+        self._cancel(domain)
+
+    def _cancel(self, domain):
+        with self.condition:
+            state = self._state(domain)
+            state.in_flight = max(0, state.in_flight - 1)
+            state.tokens = min(self.burst, state.tokens + 1)
+            self.condition.notify_all()
+
+    def task_done(self):
+        # Frees the slot reserved by get when the task never called release,
+        # i.e. never sent a request
+        domain = getattr(self.local, "reserved", None)
+        if domain is None:
+            return
+        self.local.reserved = None
+        self._cancel(domain)
+
+    def clear(self):
+        # Drops every pending item
+        with self.condition:
+            for state in self.domains.values():
+                state.pending.clear()
+            self.pending_count = 0
+            self.condition.notify_all()
+
+
+class ReservedSlots:
+    """
+    Scheduler stand-in for extraction worker processes. The main process
+    takes the request slot of a domain before it hands a URL to a worker, so
+    acquire returns at once. release only remembers the response; the worker
+    reports it back with the result and the main process releases the slot
+    on its DomainScheduler.
+    """
+
+    def __init__(self) -> None:
+        self.responses = {}
+
+    def acquire(self, url):
+        pass
+
+    async def acquire_async(self, url):
+        pass
+
+    def release(self, url, status=None, retry_after=None):
+        self.responses[url] = (status, retry_after)
+
+    def pop_response(self, url):
+        """
+        Returns:
+            (status, retry_after) of the last request to url, None if no
+            request was made
+        """
+        return self.responses.pop(url, None)
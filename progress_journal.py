@@ -0,0 +1,90 @@
+import datetime
+import json
+import os
+import threading
+
+EXTRACTED = "extracted"
+EMPTY = "empty"
+REJECTED = "rejected"
+DUPLICATE = "duplicate"
+# Filtered out before parsing: PDFs, videos, oversized pages
+SKIPPED = "skipped"
+
+
+class ProgressJournal:
+    """
+    Append-only JSON lines file recording the outcome of every article URL
+    of a run. Extracted URLs are only recorded once the batch holding them
+    is on disk, so anything in the journal survives a crash and a resumed run
+    can skip it.
+    """
+
+    def __init__(self, path, on_record=None) -> None:
+        """
+        Args:
+            path: journal file, usually progress.jsonl in the run directory
+            on_record: called with (urls, status, reason) once entries are on
+                disk
+        """
+        self.path = path
+        self.on_record = on_record
+        self.lock = threading.Lock()
+        self.file = open(path, "a")
+
+    @staticmethod
+    def load(path):
+        """
+        Reads the journal of an earlier run. A line cut short by a crash is
+        ignored.
+
+        Args:
+            path: journal file
+
+        Returns:
+            entries: dict of url -> last journal entry of the URL
+        """
+        entries = {}
+        if not os.path.exists(path):
+            return entries
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                entries[entry["url"]] = entry
+        return entries
+
+    def record(self, url, status, keyword=None, batch=None, reason=None):
+        self.record_many([url], status, keyword=keyword, batch=batch, reason=reason)
+
+    def record_many(self, urls, status, keyword=None, batch=None, reason=None):
+        """
+        Args:
+            urls: URLs sharing the same outcome
+            status: EXTRACTED, EMPTY, REJECTED, DUPLICATE or SKIPPED
+            keyword: keyword the URLs were found with
+            batch: save batch holding the extracted articles
+            reason: failure class of REJECTED URLs
+        """
+        recorded_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        lines = []
+        for url in urls:
+            entry = {"url": url, "status": status, "time": recorded_at}
+            if keyword is not None:
+                entry["keyword"] = keyword
+            if batch is not None:
+                entry["batch"] = batch
+            if reason is not None:
+                entry["reason"] = reason
+            lines.append(json.dumps(entry) + "\n")
+        with self.lock:
+            self.file.write("".join(lines))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        if self.on_record is not None:
+            self.on_record(urls, status, reason)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
@@ -0,0 +1,206 @@
+import datetime
+import json
+import os
+import threading
+
+
+class QueryStateStore:
+    """
+    Per-query state kept between scheduled runs, stored as one JSON file.
+    A query is a (keyword, language, country) triple. For each query the
+    store keeps the publish time of the newest article seen so far (the
+    watermark) so incremental runs only request the windows after it, and
+    the date window size that suited the query in earlier runs.
+    """
+
+    def __init__(self, path) -> None:
+        """
+        Args:
+            path: JSON file of the store; created on the first save
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.queries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.queries = json.load(f)
+
+    @staticmethod
+    def query_key(keyword, language, country):
+        return f"{keyword}|{language}|{country}"
+
+    def get_watermark(self, keyword, language, country):
+        """
+        Returns:
+            watermark: timezone aware datetime of the newest article seen for
+                the query, None if the query never ran
+        """
+        key = self.query_key(keyword, language, country)
+        with self.lock:
+            watermark = self.queries.get(key, {}).get("watermark")
+        if watermark is None:
+            return None
+        return datetime.datetime.fromisoformat(watermark)
+
+    def update_watermark(self, keyword, language, country, published):
+        """
+        Moves the watermark of a query forward; older times are ignored.
+
+        Args:
+            published: timezone aware datetime of an article of the query
+        """
+        key = self.query_key(keyword, language, country)
+        with self.lock:
+            state = self.queries.setdefault(key, {})
+            watermark = state.get("watermark")
+            if (
+                watermark is None
+                or datetime.datetime.fromisoformat(watermark) < published
+            ):
+                state["watermark"] = published.isoformat()
+
+    def get_window_days(self, keyword, language, country):
+        """
+        Returns:
+            window_days: window size suggested by earlier runs, None if unknown
+        """
+        key = self.query_key(keyword, language, country)
+        with self.lock:
+            return self.queries.get(key, {}).get("window_days")
+
+    def set_window_days(self, keyword, language, country, window_days):
+        key = self.query_key(keyword, language, country)
+        with self.lock:
+            self.queries.setdefault(key, {})["window_days"] = window_days
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with self.lock:
+            with open(tmp_path, "w") as f:
+                json.dump(self.queries, f, indent=4)
+            os.replace(tmp_path, self.path)
+
+
+class WatermarkTracker:
+    """
+    Watermark candidates of the date windows requested in one run. A window
+    is the feed of one query and date range. Its newest publish time only
+    counts once every article first found in it has an outcome in the
+    progress journal. A window that is held (its feed was given up on, or
+    one of its articles was rejected for a reason worth retrying) keeps the
+    watermark of its query before the start of the window, so the next
+    incremental run requests the window again, whatever newer windows did.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        # window -> {"query", "after", "newest", "pending", "held"}
+        self.windows = {}
+        # link -> windows waiting for it, empty until its feed is registered
+        self.pending_links = {}
+        # Links rejected before the window that found them was registered
+        self.held_links = set()
+
+    def add_link(self, link):
+        """
+        Registers a link handed to extraction; call it before the link can
+        get an outcome.
+        """
+        with self.lock:
+            self.pending_links[link] = []
+
+    def add_window(self, window, query, after, newest, links):
+        """
+        Args:
+            window: RSS URL of the window
+            query: (keyword, language, country)
+            after: timezone aware start of the window
+            newest: timezone aware newest publish time of its entries, None
+                if no entry had one
+            links: links of its entries; only those registered with
+                add_link are waited for
+        """
+        with self.lock:
+            held = False
+            waiting = []
+            for link in links:
+                if link in self.held_links:
+                    self.held_links.discard(link)
+                    held = True
+                elif link in self.pending_links:
+                    waiting.append(link)
+                    self.pending_links[link].append(window)
+            self.windows[window] = {
+                "query": query,
+                "after": after,
+                "newest": newest,
+                "pending": len(waiting),
+                "held": held,
+            }
+
+    def hold_window(self, window, query, after):
+        # A window whose feed never came back
+        with self.lock:
+            state = self.windows.setdefault(
+                window,
+                {"query": query, "after": after, "newest": None, "pending": 0},
+            )
+            state["held"] = True
+
+    def links_done(self, links, held=False):
+        """
+        Args:
+            links: links that got an outcome in the progress journal
+            held: the outcome is a rejection worth retrying next run
+        """
+        with self.lock:
+            for link in links:
+                windows = self.pending_links.pop(link, None)
+                if windows is None:
+                    continue
+                if not windows and held:
+                    self.held_links.add(link)
+                for window in windows:
+                    state = self.windows[window]
+                    state["pending"] -= 1
+                    state["held"] = state["held"] or held
+
+    def watermarks(self):
+        """
+        Returns:
+            dict of query -> newest publish time of its finished windows,
+                below the start of its oldest window still pending or held;
+                queries with nothing to move are left out
+        """
+        with self.lock:
+            windows = list(self.windows.values())
+        blocked = {}
+        for state in windows:
+            if state["pending"] > 0 or state["held"]:
+                query = state["query"]
+                if query not in blocked or state["after"] < blocked[query]:
+                    blocked[query] = state["after"]
+        watermarks = {}
+        for state in windows:
+            query = state["query"]
+            newest = state["newest"]
+            if state["pending"] > 0 or state["held"] or newest is None:
+                continue
+            if query in blocked and newest >= blocked[query]:
+                continue
+            if query not in watermarks or newest > watermarks[query]:
+                watermarks[query] = newest
+        return watermarks
+
+    def save_to(self, store):
+        """
+        Moves the watermarks of store; call it once extraction is over.
+
+        Args:
+            store: QueryStateStore
+        """
+        for (keyword, language, country), newest in self.watermarks().items():
+            store.update_watermark(keyword, language, country, newest)
@@ -0,0 +1,109 @@
+import sys
+
+
+def intern_text(value):
+    # Keywords, publishers and languages repeat across millions of records;
+    # interning keeps one copy of each
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Record:
+    """
+    Base of the compact records passed between discovery and extraction.
+    Fields live in __slots__ instead of a per-record dict, while item access
+    (record["link"], record.get("title")) keeps working for code written
+    against the former dict records.
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def get(self, key, default=None):
+        if key not in self.__slots__:
+            return default
+        return getattr(self, key)
+
+    def keys(self):
+        return self.__slots__
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.__slots__}
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        fields = ", ".join(f"{key}={getattr(self, key)!r}" for key in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class DiscoveredArticle(Record):
+    """
+    Article link found in a feed, with the feed metadata of its entry.
+    """
+
+    __slots__ = ("link", "keyword", "keywords", "title", "source", "published")
+
+    def __init__(
+        self, link, keyword, title=None, source=None, published=None, keywords=None
+    ) -> None:
+        keyword = intern_text(keyword)
+        self.link = link
+        self.keyword = keyword
+        self.keywords = keywords if keywords is not None else [keyword]
+        self.title = title
+        self.source = intern_text(source)
+        self.published = published
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data["link"],
+            data["keyword"],
+            title=data.get("title"),
+            source=data.get("source"),
+            published=data.get("published"),
+            keywords=[intern_text(k) for k in data.get("keywords", [])] or None,
+        )
+
+
+class RejectedURL(Record):
+    """
+    URL given up on, with the failure class (see retry.classify) and the last
+    error of its final attempt.
+    """
+
+    __slots__ = ("url", "keyword", "reason", "status", "error", "attempts")
+
+    def __init__(
+        self, url, keyword, reason=None, status=None, error=None, attempts=None
+    ) -> None:
+        self.url = url
+        self.keyword = intern_text(keyword)
+        self.reason = intern_text(reason)
+        self.status = status
+        self.error = error
+        self.attempts = attempts
+
+
+def to_dict(record):
+    """
+    json.dump default for lists holding records.
+    """
+    if isinstance(record, Record):
+        return record.to_dict()
+    raise TypeError(f"{type(record).__name__} is not JSON serializable")
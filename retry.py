@@ -0,0 +1,259 @@
+import asyncio
+import heapq
+import random
+import threading
+import time
+import urllib.parse
+
+from politeness import THROTTLE_STATUSES, parse_retry_after
+from progress_journal import SKIPPED
+
+# Failure classes; only the first two are worth another attempt
+TRANSIENT = "transient"
+THROTTLED = "throttled"
+PERMANENT = "permanent"
+PARSE = "parse"
+# SKIPPED is no failure: the page was filtered out before it was parsed, and
+# is journaled under its own status
+RETRYABLE = {TRANSIENT, THROTTLED}
+
+RETRY_LIMIT = 3
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+# Longest Retry-After honoured; a publisher asking for more is given up on
+MAX_RETRY_AFTER = 300.0
+TRANSIENT_STATUSES = {408, 425, 500, 502, 504}
+
+
+class RequestFailed(Exception):
+    """
+    Raised for an HTTP error status, with the Retry-After header if any.
+    """
+
+    def __init__(self, status, retry_after=None) -> None:
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class ParseError(Exception):
+    """
+    Raised when a downloaded page or feed could not be parsed.
+    """
+
+
+class Skipped(Exception):
+    """
+    Raised for a URL or response not worth downloading or parsing: PDFs,
+    videos, oversized bodies.
+    """
+
+
+def status_of(error):
+    """
+    Returns:
+        HTTP status carried by a requests, aiohttp or RequestFailed error,
+        None if the request failed before a response came back
+    """
+    status = getattr(error, "status", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def retry_after_of(error):
+    """
+    Returns:
+        seconds the server asked to wait before the next request, or None
+    """
+    value = getattr(error, "retry_after", None)
+    if value is None:
+        headers = getattr(error, "headers", None) or getattr(
+            getattr(error, "response", None), "headers", None
+        )
+        value = headers.get("Retry-After") if headers else None
+    return parse_retry_after(value)
+
+
+def classify(error, status=None):
+    """
+    Args:
+        error: exception raised by a download or a parse
+        status: HTTP status when it is known apart from the error
+
+    Returns:
+        TRANSIENT, THROTTLED, PERMANENT, PARSE or SKIPPED
+    """
+    if isinstance(error, Skipped):
+        return SKIPPED
+    if isinstance(error, ParseError):
+        return PARSE
+    if status is None:
+        status = status_of(error)
+    if status is not None:
+        if status in THROTTLE_STATUSES:
+            return THROTTLED
+        if status in TRANSIENT_STATUSES or status >= 500:
+            return TRANSIENT
+        return PERMANENT
+    if isinstance(error, ValueError):
+        # Malformed URLs, unsupported schemes, undecodable bodies
+        return PERMANENT
+    names = {cls.__name__ for cls in type(error).__mro__}
+    if isinstance(error, (OSError, asyncio.TimeoutError, TimeoutError)) or (
+        # aiohttp and requests errors not derived from OSError
+        names & {"ClientError", "RequestException"}
+    ):
+        return TRANSIENT
+    return PERMANENT
+
+
+def backoff_delay(attempt, retry_after=None, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """
+    Full-jitter exponential backoff: a random delay up to base * 2**attempt,
+    so that failures of many URLs at once are not retried in lockstep.
+
+    Args:
+        attempt: number of attempts that failed so far, minus one
+        retry_after: seconds the server asked to wait, if any
+
+    Returns:
+        seconds to wait before the next attempt
+    """
+    delay = random.uniform(0, min(cap, base * 2**attempt))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, MAX_RETRY_AFTER))
+    return delay
+
+
+def should_retry(reason, attempts, retry_after=None, retry_limit=RETRY_LIMIT):
+    """
+    Args:
+        reason: failure class of the last attempt
+        attempts: attempts made so far
+        retry_after: seconds the server asked to wait, if any
+
+    Returns:
+        True when another attempt is worth making
+    """
+    if reason not in RETRYABLE or attempts > retry_limit:
+        return False
+    return retry_after is None or retry_after <= MAX_RETRY_AFTER
+
+
+class RetryQueue:
+    """
+    Deferred retries of failed items. A failed item waits here for its
+    backoff delay instead of holding a worker, and feed() hands it back to
+    the workers between fresh items once it is due. Attempts are counted per
+    key, so only the items that failed take memory here.
+    """
+
+    def __init__(self, retry_limit=RETRY_LIMIT) -> None:
+        self.retry_limit = retry_limit
+        self.condition = threading.Condition()
+        self.deferred = []
+        self.sequence = 0
+        self.attempts = {}
+        self.in_flight = 0
+
+    def __len__(self):
+        with self.condition:
+            return len(self.deferred)
+
+    def failed(self, key, reason, retry_after=None):
+        """
+        Counts a failed attempt of key.
+
+        Returns:
+            (retry, attempts): whether key should be retried, and the
+                attempts made so far
+        """
+        with self.condition:
+            attempts = self.attempts.get(key, 0) + 1
+            retry = should_retry(reason, attempts, retry_after, self.retry_limit)
+            if retry:
+                self.attempts[key] = attempts
+            else:
+                self.attempts.pop(key, None)
+            return retry, attempts
+
+    def succeeded(self, key):
+        with self.condition:
+            self.attempts.pop(key, None)
+
+    def push(self, item, delay):
+        with self.condition:
+            heapq.heappush(
+                self.deferred, (time.monotonic() + delay, self.sequence, item)
+            )
+            self.sequence += 1
+            self.condition.notify_all()
+
+    def task_done(self):
+        # An item handed out by feed got its outcome, retry or not
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def pop_due(self):
+        with self.condition:
+            now = time.monotonic()
+            due = []
+            while self.deferred and self.deferred[0][0] <= now:
+                due.append(heapq.heappop(self.deferred)[2])
+            self.in_flight += len(due)
+            return due
+
+    def feed(self, items):
+        """
+        Yields the items, with due retries slipped in between, then the
+        remaining retries until no item is in flight. Every item yielded
+        needs a matching task_done once its outcome is known.
+        """
+        for item in items:
+            yield from self.pop_due()
+            with self.condition:
+                self.in_flight += 1
+            yield item
+        while True:
+            yield from self.pop_due()
+            with self.condition:
+                if not self.deferred and self.in_flight <= 0:
+                    return
+                timeout = None
+                if self.deferred:
+                    timeout = max(0.0, self.deferred[0][0] - time.monotonic())
+                self.condition.wait(timeout)
+
+
+def rejection_report(rejected):
+    """
+    Args:
+        rejected: list of RejectedURL
+
+    Returns:
+        dict with the number of rejections per reason, status and domain,
+        followed by every rejection
+    """
+    by_reason = {}
+    by_status = {}
+    by_domain = {}
+    for record in rejected:
+        reason = record.reason or PERMANENT
+        by_reason[reason] = by_reason.get(reason, 0) + 1
+        if record.status is not None:
+            status = str(record.status)
+            by_status[status] = by_status.get(status, 0) + 1
+        domain = (urllib.parse.urlsplit(record.url).hostname or "").lower()
+        by_domain[domain] = by_domain.get(domain, 0) + 1
+    return {
+        "total": len(rejected),
+        "by_reason": by_reason,
+        "by_status": by_status,
+        "by_domain": dict(
+            sorted(by_domain.items(), key=lambda item: item[1], reverse=True)
+        ),
+        "rejected": [record.to_dict() for record in rejected],
+    }
@@ -0,0 +1,86 @@
+import datetime
+import os
+import sqlite3
+import threading
+
+# Host parameters per IN (...) query; older SQLite builds allow 999
+SEEN_QUERY_BATCH = 500
+
+
+class SeenURLIndex:
+    """
+    On-disk index of article URLs that were already extracted, shared across
+    runs so that later runs can skip them. Backed by SQLite and safe to use
+    from several threads.
+    """
+
+    def __init__(self, path) -> None:
+        """
+        Args:
+            path: SQLite file of the index; created if missing
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS seen_urls "
+            "(url TEXT PRIMARY KEY, seen_at TEXT NOT NULL)"
+        )
+        self.connection.commit()
+
+    def __contains__(self, url):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT 1 FROM seen_urls WHERE url = ?", (url,)
+            ).fetchone()
+        return row is not None
+
+    def seen_many(self, urls):
+        """
+        Looks up many URLs with one query per SEEN_QUERY_BATCH of them.
+
+        Args:
+            urls: iterable of URLs
+
+        Returns:
+            set of the URLs present in the index
+        """
+        urls = list(dict.fromkeys(urls))
+        seen = set()
+        with self.lock:
+            for start in range(0, len(urls), SEEN_QUERY_BATCH):
+                batch = urls[start : start + SEEN_QUERY_BATCH]
+                placeholders = ", ".join("?" * len(batch))
+                rows = self.connection.execute(
+                    f"SELECT url FROM seen_urls WHERE url IN ({placeholders})", batch
+                ).fetchall()
+                seen.update(url for (url,) in rows)
+        return seen
+
+    def __len__(self):
+        with self.lock:
+            (count,) = self.connection.execute(
+                "SELECT COUNT(*) FROM seen_urls"
+            ).fetchone()
+        return count
+
+    def add(self, url):
+        self.add_many([url])
+
+    def add_many(self, urls):
+        seen_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO seen_urls (url, seen_at) VALUES (?, ?)",
+                [(url, seen_at) for url in urls],
+            )
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
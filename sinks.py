@@ -0,0 +1,206 @@
+import csv
+import gzip
+import json
+import os
+
+ARTICLE_FIELDS = ["URL", "Title", "Time", "keyword", "Content", "duplicate_of"]
+PARQUET_ROW_GROUP_SIZE = 10000
+COMPRESSION_EXTENSIONS = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+
+class JSONLSink:
+    """
+    Appends articles as JSON lines, optionally gzip or zstd compressed. Each
+    flush of a compressed file appends one complete gzip member or zstd
+    frame, which both formats read back as one stream, so a resumed run
+    keeps writing to the same file. Flushes are synced to disk.
+    """
+
+    # The writer journals a batch as soon as it is flushed
+    durable_flush = True
+
+    def __init__(self, path, compression=None) -> None:
+        """
+        Args:
+            path: output file
+            compression: None, "gzip" or "zstd"
+        """
+        self.path = path
+        self.compression = compression
+        if compression == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                raise ImportError("zstd compression needs the zstandard package")
+            self.compressor = zstandard.ZstdCompressor()
+        elif compression not in (None, "gzip"):
+            raise ValueError(f"unknown compression: {compression}")
+        self.file = open(path, "ab")
+        # Lines of the current member or frame, compressed on flush
+        self.lines = []
+
+    def write(self, record):
+        self.lines.append(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def flush(self):
+        if self.lines:
+            data = "".join(self.lines).encode("utf-8")
+            self.lines = []
+            if self.compression == "gzip":
+                data = gzip.compress(data)
+            elif self.compression == "zstd":
+                data = self.compressor.compress(data)
+            self.file.write(data)
+        sync(self.file)
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class CSVSink:
+    durable_flush = True
+
+    def __init__(self, path, fields=ARTICLE_FIELDS) -> None:
+        """
+        Args:
+            path: output file; the header is written when it is new
+            fields: columns, other keys of the records are ignored
+        """
+        self.path = path
+        write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "a", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.file, fieldnames=fields, extrasaction="ignore")
+        if write_header:
+            self.writer.writeheader()
+
+    def write(self, record):
+        self.writer.writerow(record)
+
+    def flush(self):
+        sync(self.file)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetSink:
+    """
+    Writes articles to a Parquet file one row group at a time, so only a row
+    group worth of records is held in memory. The file can only be read once
+    its footer is written on close, so the writer journals the records of a
+    part only after closing it.
+    """
+
+    durable_flush = False
+
+    def __init__(
+        self, path, fields=ARTICLE_FIELDS, row_group_size=PARQUET_ROW_GROUP_SIZE
+    ) -> None:
+        """
+        Args:
+            path: output file; Parquet files cannot be appended to, so a
+                resumed run has to write a new part
+            fields: columns, other keys of the records are ignored
+            row_group_size: records per row group
+        """
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Parquet output needs the pyarrow package")
+        self.pyarrow = pyarrow
+        self.path = path
+        self.fields = fields
+        self.row_group_size = row_group_size
+        self.schema = pyarrow.schema([(field, pyarrow.string()) for field in fields])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        self.rows = []
+
+    def write(self, record):
+        self.rows.append(record)
+        if len(self.rows) >= self.row_group_size:
+            self.write_row_group()
+
+    def write_row_group(self):
+        if not self.rows:
+            return
+        columns = {
+            field: [row.get(field) for row in self.rows] for field in self.fields
+        }
+        self.writer.write_table(
+            self.pyarrow.Table.from_pydict(columns, schema=self.schema)
+        )
+        self.rows = []
+
+    def flush(self):
+        # Row groups are written when full; nothing is readable before close
+        pass
+
+    def close(self):
+        self.write_row_group()
+        self.writer.close()
+
+
+def sync(file):
+    file.flush()
+    os.fsync(file.fileno())
+
+
+def create_sinks(
+    save_path,
+    save_json=True,
+    save_csv=True,
+    save_parquet=False,
+    compression=None,
+    part=0,
+):
+    """
+    Opens the article sinks of a run.
+
+    Args:
+        save_path: run directory
+        save_json: write articles.jsonl
+        save_csv: write articles.csv
+        save_parquet: write parquet/part-<part>.parquet
+        compression: None, "gzip" or "zstd" for the JSON lines file
+        part: number of the Parquet part
+
+    Returns:
+        sinks: list of opened sinks
+    """
+    sinks = []
+    if save_json:
+        sinks.append(
+            JSONLSink(
+                jsonl_path(save_path, compression),
+                compression=compression,
+            )
+        )
+    if save_csv:
+        sinks.append(CSVSink(f"{save_path}/articles.csv"))
+    if save_parquet:
+        os.makedirs(f"{save_path}/parquet", exist_ok=True)
+        sinks.append(ParquetSink(f"{save_path}/parquet/part-{part}.parquet"))
+    return sinks
+
+
+def jsonl_path(save_path, compression=None):
+    return f"{save_path}/articles.jsonl" + COMPRESSION_EXTENSIONS[compression]
+
+
+def export_excel(jsonl_file, xlsx_file):
+    """
+    Optional post-processing export of the articles of a run to Excel.
+
+    Args:
+        jsonl_file: articles.jsonl of the run, possibly compressed
+        xlsx_file: Excel file to write
+    """
+    import pandas as pd
+
+    compression = "infer"
+    if jsonl_file.endswith(".zst"):
+        compression = "zstd"
+    df = pd.read_json(jsonl_file, lines=True, compression=compression)
+    df.to_excel(xlsx_file, index=False)
@@ -0,0 +1,109 @@
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import time
+
+from job_queue import DONE, FAILED, FEED, LEASED, PENDING, JobQueue
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LEASE_SECONDS = 2
+JOB_COUNT = 20
+
+COORDINATOR = """
+import sys
+from distributed import wait_for_jobs
+from job_queue import JobQueue
+
+wait_for_jobs(JobQueue(sys.argv[1], lease_seconds={lease}), interval=0.2)
+"""
+
+# Leases jobs, keeps them alive with heartbeats and never finishes them
+HUNG_WORKER = """
+import sys, time
+from job_queue import FEED, Heartbeat, JobQueue
+
+job_queue = JobQueue(sys.argv[1], lease_seconds={lease})
+jobs = job_queue.lease(FEED, "hung", limit=5)
+Heartbeat(job_queue, "hung", interval=0.3).start().hold(i for i, _ in jobs)
+print(" ".join(str(i) for i, _ in jobs), flush=True)
+time.sleep(600)
+"""
+
+WORKER = """
+import sys, time
+from job_queue import FEED, JobQueue
+
+job_queue = JobQueue(sys.argv[1], lease_seconds={lease})
+worker_id = sys.argv[2]
+while True:
+    jobs = job_queue.lease(FEED, worker_id, limit=2)
+    if not jobs:
+        if not job_queue.outstanding(FEED, worker_id):
+            break
+        time.sleep(0.1)
+        continue
+    time.sleep(0.05)
+    job_queue.complete([i for i, _ in jobs], worker_id)
+"""
+
+
+def start(script, *args):
+    return subprocess.Popen(
+        [sys.executable, "-c", script.format(lease=LEASE_SECONDS), *args],
+        cwd=REPO_ROOT,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+
+
+def jobs_of(path, job_ids):
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute(
+            "SELECT status, worker, attempts FROM jobs WHERE id IN "
+            f"({', '.join('?' * len(job_ids))})",
+            job_ids,
+        ).fetchall()
+    finally:
+        connection.close()
+
+
+def test_lease_of_killed_worker_is_requeued(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    job_queue = JobQueue(path, lease_seconds=LEASE_SECONDS)
+    job_queue.put_many(FEED, [(f"feed-{i}", {"n": i}) for i in range(JOB_COUNT)])
+
+    hung = start(HUNG_WORKER, path)
+    processes = [hung]
+    try:
+        held = [int(job_id) for job_id in hung.stdout.readline().split()]
+        assert len(held) == 5
+        # Heartbeats keep the leases past lease_seconds while the worker lives
+        time.sleep(LEASE_SECONDS * 1.5)
+        job_queue.requeue_expired()
+        assert {status for status, _, _ in jobs_of(path, held)} == {LEASED}
+
+        hung.send_signal(signal.SIGKILL)
+        hung.wait()
+        coordinator = start(COORDINATOR, path)
+        processes.append(coordinator)
+        processes += [start(WORKER, path, f"worker-{n}") for n in range(2)]
+        coordinator.wait(timeout=60)
+        for process in processes[2:]:
+            process.wait(timeout=60)
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+
+    assert coordinator.returncode == 0
+    counts = job_queue.counts(FEED)
+    assert counts == {PENDING: 0, LEASED: 0, DONE: JOB_COUNT, FAILED: 0}
+    for status, worker, attempts in jobs_of(path, held):
+        assert (status, attempts) == (DONE, 2)
+        assert worker.startswith("worker-")
+    job_queue.close()
@@ -0,0 +1,94 @@
+import base64
+
+from gnews_decoder import GoogleNewsDecoder, LRUCache
+
+LINK = "https://news.google.com/rss/articles/x?oc=5"
+URL = "https://www.reuters.com/markets/us/fed-raises-rates-2024-05-01/"
+AMP_URL = URL + "amp/"
+
+
+def encode_id(url, amp_url=None):
+    # Legacy protobuf id: field 4 holds the URL, field 26 the AMP URL
+    payload = b"\x08\x13\x22" + bytes([len(url)]) + url.encode() + b"\xd2\x01"
+    if amp_url is None:
+        payload += b"\x00"
+    else:
+        payload += bytes([len(amp_url)]) + amp_url.encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def opaque_id(token="AU_yqLPx3abc"):
+    return encode_id(token)
+
+
+def test_decodes_legacy_ids():
+    # Same links as the former URL_FETCHER.base64url_decoder
+    decoder = GoogleNewsDecoder()
+    assert decoder.decode(encode_id(URL), LINK) == URL
+    assert decoder.decode(encode_id("http://example.org/a?id=42"), LINK) == (
+        "http://example.org/a?id=42"
+    )
+
+
+def test_amp_ids_keep_the_second_url():
+    assert GoogleNewsDecoder().decode(encode_id(URL, AMP_URL), LINK) == AMP_URL
+
+
+def test_undecodable_ids_keep_the_link():
+    decoder = GoogleNewsDecoder()
+    assert decoder.decode("not base64 at all!", LINK) == LINK
+    assert decoder.decode(base64.urlsafe_b64encode(b"\x08\x13").decode(), LINK) == LINK
+
+
+def test_opaque_ids_go_to_the_resolver_once():
+    calls = []
+
+    def resolver(entry_id, link):
+        calls.append(entry_id)
+        return URL
+
+    assert GoogleNewsDecoder().decode(opaque_id(), LINK) == LINK
+    decoder = GoogleNewsDecoder(resolver=resolver)
+    assert decoder.decode(opaque_id(), LINK) == URL
+    assert decoder.decode(opaque_id(), LINK) == URL
+    assert calls == [opaque_id()]
+
+
+def test_failed_resolutions_keep_the_link_and_are_retried():
+    calls = []
+
+    def resolver(entry_id, link):
+        calls.append(entry_id)
+        if len(calls) == 1:
+            raise ConnectionError("batchexecute unavailable")
+        if len(calls) == 2:
+            return None
+        return URL
+
+    decoder = GoogleNewsDecoder(resolver=resolver)
+    entries = [{"id": opaque_id(), "link": LINK}]
+    assert decoder.decode(opaque_id(), LINK) == LINK
+    assert decoder.decode_batch(entries) == [LINK]
+    assert decoder.decode_batch(entries) == [URL]
+    assert decoder.decode(opaque_id(), LINK) == URL
+    assert len(calls) == 3
+
+
+def test_decode_batch_keeps_the_order():
+    entries = [
+        {"id": encode_id(URL), "link": LINK},
+        {"id": "not base64 at all!", "link": LINK},
+        {"id": encode_id(URL, AMP_URL), "link": LINK},
+    ]
+    assert GoogleNewsDecoder().decode_batch(entries) == [URL, LINK, AMP_URL]
+
+
+def test_lru_cache_evicts_the_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert len(cache) == 2
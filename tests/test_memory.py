@@ -0,0 +1,17 @@
+import pytest
+
+from benchmarks import memory
+
+
+def test_discovery_memory_per_record():
+    pytest.importorskip("aiohttp")
+    results = memory.run(memory.DISCOVERY, {"retained": 100_000, "streaming": 100_000})
+    assert not memory.over_budget(results), results
+
+
+@pytest.mark.parametrize("scenario", memory.EXTRACTION)
+def test_extraction_memory_does_not_grow_with_articles(scenario):
+    for module in ("aiohttp", "requests", "goose3", "nltk"):
+        pytest.importorskip(module)
+    results = memory.run([scenario])
+    assert not memory.over_budget(results), results
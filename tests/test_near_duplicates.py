@@ -0,0 +1,126 @@
+import hashlib
+import random
+
+from near_duplicates import (
+    LSH_BANDS,
+    MIN_TOKENS,
+    SHINGLE_SIZE,
+    SIMHASH_BITS,
+    TOKEN,
+    NearDuplicateIndex,
+    NearDuplicateTitles,
+    hamming_distance,
+    simhash,
+    to_signed,
+    to_unsigned,
+    token_set_similarity,
+)
+
+WORDS = (
+    "market shares investors growth quarter report company government minister "
+    "election policy court ruling city council officials statement according "
+    "analysts economy inflation prices energy climate research university study"
+).split()
+
+
+def article(seed, words=800):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def reference_simhash(text):
+    # One vote per bit and shingle, without the lane packing of simhash
+    tokens = TOKEN.findall(text.lower())
+    shingles = {
+        " ".join(tokens[i : i + SHINGLE_SIZE])
+        for i in range(len(tokens) - SHINGLE_SIZE + 1)
+    }
+    votes = [0] * SIMHASH_BITS
+    for shingle in shingles:
+        digest = hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "big")
+        for bit in range(SIMHASH_BITS):
+            votes[bit] += (value >> bit) & 1
+    return sum(
+        1 << bit for bit in range(SIMHASH_BITS) if votes[bit] * 2 > len(shingles)
+    )
+
+
+def test_simhash_matches_the_bitwise_definition():
+    for seed in range(20):
+        text = article(seed)
+        assert simhash(text) == reference_simhash(text)
+
+
+def test_simhash_skips_short_texts():
+    assert simhash(" ".join(["word"] * (MIN_TOKENS - 1))) is None
+    assert simhash(article(0, words=MIN_TOKENS)) is not None
+
+
+def test_simhash_of_an_edited_copy_is_close():
+    text = article(1)
+    edited = text.replace("market", "markets", 1) + " Reuters"
+    assert hamming_distance(simhash(text), simhash(edited)) <= 3
+    assert hamming_distance(simhash(text), simhash(article(2))) > 3
+
+
+def test_signed_round_trip():
+    for value in (0, 1, (1 << 63) - 1, 1 << 63, (1 << 64) - 1):
+        signed = to_signed(value)
+        assert -(1 << 63) <= signed < 1 << 63
+        assert to_unsigned(signed) == value
+
+
+def test_close_signatures_share_a_band():
+    rng = random.Random(0)
+    for _ in range(200):
+        signature = rng.getrandbits(SIMHASH_BITS)
+        other = signature
+        for bit in rng.sample(range(SIMHASH_BITS), LSH_BANDS - 1):
+            other ^= 1 << bit
+        bands = NearDuplicateIndex.bands(signature)
+        assert set(enumerate(bands)) & set(enumerate(NearDuplicateIndex.bands(other)))
+
+
+def test_index_maps_copies_to_the_first_url(tmp_path):
+    path = str(tmp_path / "near_duplicates.sqlite3")
+    text = article(1)
+    index = NearDuplicateIndex(path)
+    assert index.check_and_add("https://a.example.com/story", text) is None
+    assert index.check_and_add("https://b.example.com/copy", text + " AP") == (
+        "https://a.example.com/story"
+    )
+    assert index.check_and_add("https://c.example.com/other", article(2)) is None
+    # Extracting the same URL again does not make it its own duplicate
+    assert index.check_and_add("https://a.example.com/story", text) is None
+    assert index.check_and_add("https://d.example.com/brief", "too short") is None
+    index.close()
+
+    # Signatures outlive the run
+    index = NearDuplicateIndex(path)
+    assert index.check_and_add("https://e.example.com/copy", text) == (
+        "https://a.example.com/story"
+    )
+    index.close()
+
+
+def test_token_set_similarity():
+    assert token_set_similarity({"a", "b"}, {"a", "b"}) == 1.0
+    assert token_set_similarity({"a", "b"}, {"b", "c"}) == 1 / 3
+    assert token_set_similarity(set(), set()) == 1.0
+
+
+def test_near_identical_titles_share_a_group():
+    titles = NearDuplicateTitles()
+    title = "fed raises interest rates by a quarter point amid fears"
+    first = titles.group_of(title)
+    assert titles.group_of(title.replace(" a ", " ")) == first
+    assert titles.group_of("the " + title) == first
+    assert titles.group_of("stocks fall as fed raises interest rates") != first
+
+
+def test_short_titles_need_the_same_words():
+    titles = NearDuplicateTitles()
+    assert titles.group_of("gaza war") == titles.group_of("war gaza")
+    assert titles.group_of("gaza war") != titles.group_of("gaza war live")
+    assert titles.group_of("") is None
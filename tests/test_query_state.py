@@ -0,0 +1,61 @@
+import datetime
+
+from query_state import QueryStateStore, WatermarkTracker
+
+QUERY = ("markets", "en", "US")
+UTC = datetime.timezone.utc
+
+
+def day(n, hour=0):
+    return datetime.datetime(2024, 5, n, hour, tzinfo=UTC)
+
+
+def saved(tracker, tmp_path):
+    store = QueryStateStore(str(tmp_path / "query_state.json"))
+    tracker.save_to(store)
+    return store.get_watermark(*QUERY)
+
+
+def test_finished_windows_move_the_watermark(tmp_path):
+    tracker = WatermarkTracker()
+    tracker.add_link("a")
+    tracker.add_link("b")
+    tracker.add_window("old", QUERY, day(1), day(2, 9), ["a"])
+    tracker.add_window("new", QUERY, day(3), day(4, 9), ["b", "seen"])
+    tracker.links_done(["a", "b"])
+    assert saved(tracker, tmp_path) == day(4, 9)
+
+
+def test_a_held_older_window_keeps_newer_windows_back(tmp_path):
+    tracker = WatermarkTracker()
+    tracker.add_link("a")
+    tracker.add_link("b")
+    tracker.add_link("c")
+    tracker.add_window("first", QUERY, day(1), day(1, 9), ["a"])
+    tracker.add_window("held", QUERY, day(3), day(4, 9), ["b"])
+    tracker.add_window("newer", QUERY, day(5), day(6, 9), ["c"])
+    tracker.links_done(["a", "c"])
+    tracker.links_done(["b"], held=True)
+    # The next run starts before the held window, not after the newer one
+    assert saved(tracker, tmp_path) == day(1, 9)
+
+
+def test_pending_and_given_up_windows_keep_the_watermark(tmp_path):
+    tracker = WatermarkTracker()
+    tracker.add_link("a")
+    tracker.add_window("pending", QUERY, day(1), day(2, 9), ["a"])
+    tracker.add_window("done", QUERY, day(3), day(4, 9), [])
+    assert saved(tracker, tmp_path) is None
+
+    tracker.links_done(["a"])
+    tracker.hold_window("failed", QUERY, day(3))
+    assert saved(tracker, tmp_path) == day(2, 9)
+
+
+def test_a_link_rejected_before_its_window_is_registered_holds_it(tmp_path):
+    tracker = WatermarkTracker()
+    tracker.add_link("a")
+    # Streaming extraction journals the link before its feed is registered
+    tracker.links_done(["a"], held=True)
+    tracker.add_window("window", QUERY, day(1), day(2, 9), ["a"])
+    assert saved(tracker, tmp_path) is None
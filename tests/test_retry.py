@@ -0,0 +1,184 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from progress_journal import SKIPPED
+from records import RejectedURL
+from retry import (
+    MAX_RETRY_AFTER,
+    PARSE,
+    PERMANENT,
+    RETRY_LIMIT,
+    THROTTLED,
+    TRANSIENT,
+    ParseError,
+    RequestFailed,
+    RetryQueue,
+    Skipped,
+    backoff_delay,
+    classify,
+    rejection_report,
+    retry_after_of,
+    should_retry,
+)
+
+
+class ClientError(Exception):
+    # Stands in for aiohttp.ClientError, matched by name
+    pass
+
+
+class ServerDisconnectedError(ClientError):
+    pass
+
+
+class HTTPError(Exception):
+    # Like requests.HTTPError: the status is on the response
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.response = type(
+            "Response", (), {"status_code": status_code, "headers": headers or {}}
+        )()
+
+
+@pytest.mark.parametrize(
+    "error, expected",
+    [
+        (Skipped("video page"), SKIPPED),
+        (ParseError("no article"), PARSE),
+        (RequestFailed(429), THROTTLED),
+        (RequestFailed(503), THROTTLED),
+        (RequestFailed(408), TRANSIENT),
+        (RequestFailed(425), TRANSIENT),
+        (RequestFailed(500), TRANSIENT),
+        (RequestFailed(502), TRANSIENT),
+        (RequestFailed(504), TRANSIENT),
+        (RequestFailed(599), TRANSIENT),
+        (RequestFailed(400), PERMANENT),
+        (RequestFailed(403), PERMANENT),
+        (RequestFailed(404), PERMANENT),
+        (RequestFailed(410), PERMANENT),
+        (HTTPError(503), THROTTLED),
+        (HTTPError(404), PERMANENT),
+        (ValueError("unsupported scheme"), PERMANENT),
+        (UnicodeDecodeError("utf-8", b"\xff", 0, 1, "invalid"), PERMANENT),
+        (ConnectionResetError(), TRANSIENT),
+        (TimeoutError(), TRANSIENT),
+        (asyncio.TimeoutError(), TRANSIENT),
+        (ClientError(), TRANSIENT),
+        (ServerDisconnectedError(), TRANSIENT),
+        (RuntimeError("bug"), PERMANENT),
+    ],
+    ids=lambda value: value if isinstance(value, str) else type(value).__name__,
+)
+def test_classify(error, expected):
+    assert classify(error) == expected
+
+
+def test_classify_uses_a_known_status():
+    assert classify(ConnectionResetError(), status=429) == THROTTLED
+    assert classify(RuntimeError(), status=404) == PERMANENT
+    # Parse failures stay parse failures whatever the status
+    assert classify(ParseError(), status=500) == PARSE
+
+
+def test_retry_after_of():
+    assert retry_after_of(RequestFailed(429, "7")) == 7.0
+    assert retry_after_of(HTTPError(503, {"Retry-After": "12"})) == 12.0
+    assert retry_after_of(RequestFailed(429, "soon")) is None
+    assert retry_after_of(ConnectionResetError()) is None
+
+
+@pytest.mark.parametrize("reason", [TRANSIENT, THROTTLED])
+def test_should_retry_until_the_limit(reason):
+    assert should_retry(reason, 1)
+    assert should_retry(reason, RETRY_LIMIT)
+    assert not should_retry(reason, RETRY_LIMIT + 1)
+    assert should_retry(reason, 2, retry_limit=2)
+    assert not should_retry(reason, 3, retry_limit=2)
+
+
+@pytest.mark.parametrize("reason", [PERMANENT, PARSE, SKIPPED])
+def test_should_not_retry_other_failures(reason):
+    assert not should_retry(reason, 1)
+
+
+def test_should_retry_caps_retry_after():
+    assert should_retry(THROTTLED, 1, retry_after=MAX_RETRY_AFTER)
+    assert not should_retry(THROTTLED, 1, retry_after=MAX_RETRY_AFTER + 1)
+
+
+def test_backoff_delay():
+    for attempt in range(8):
+        delay = backoff_delay(attempt, base=1.0, cap=10.0)
+        assert 0 <= delay <= min(10.0, 2**attempt)
+    assert backoff_delay(0, retry_after=5.0) >= 5.0
+    # A Retry-After over the cap is waited for up to the cap only
+    assert backoff_delay(0, retry_after=MAX_RETRY_AFTER * 10) == MAX_RETRY_AFTER
+
+
+def test_failed_counts_attempts_per_key():
+    retries = RetryQueue(retry_limit=2)
+    assert retries.failed("a", TRANSIENT) == (True, 1)
+    assert retries.failed("b", TRANSIENT) == (True, 1)
+    assert retries.failed("a", TRANSIENT) == (True, 2)
+    assert retries.failed("a", TRANSIENT) == (False, 3)
+    # Given up keys are forgotten
+    assert "a" not in retries.attempts
+    assert retries.failed("b", PERMANENT) == (False, 2)
+    retries.failed("c", THROTTLED)
+    retries.succeeded("c")
+    assert retries.attempts == {}
+
+
+def test_feed_hands_out_due_retries():
+    retries = RetryQueue()
+    retries.push("retry", 0)
+    fed = []
+    for item in retries.feed(["a", "b"]):
+        fed.append(item)
+        retries.task_done()
+    assert fed == ["retry", "a", "b"]
+
+
+def test_feed_ends_only_when_nothing_is_in_flight():
+    retries = RetryQueue()
+    failed_once = set()
+
+    def finish(item):
+        # The outcome comes in after every fresh item was handed out
+        time.sleep(0.1)
+        if item not in failed_once:
+            failed_once.add(item)
+            retries.push(item, 0.05)
+        retries.task_done()
+
+    fed = []
+    threads = []
+    for item in retries.feed(["a", "b"]):
+        fed.append(item)
+        thread = threading.Thread(target=finish, args=(item,))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    assert sorted(fed) == ["a", "a", "b", "b"]
+    assert retries.in_flight == 0
+    assert len(retries) == 0
+
+
+def test_rejection_report():
+    rejected = [
+        RejectedURL("https://a.example.com/1", "k", reason=TRANSIENT, status=503),
+        RejectedURL("https://a.example.com/2", "k", reason=PERMANENT, status=404),
+        RejectedURL("https://b.example.com/1", "k", reason=TRANSIENT),
+        RejectedURL("https://b.example.com/2", "k"),
+    ]
+    report = rejection_report(rejected)
+    assert report["total"] == 4
+    assert report["by_reason"] == {TRANSIENT: 2, PERMANENT: 2}
+    assert report["by_status"] == {"503": 1, "404": 1}
+    assert report["by_domain"] == {"a.example.com": 2, "b.example.com": 2}
+    assert len(report["rejected"]) == 4
@@ -0,0 +1,85 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from rss_parser import CHUNK_SIZE, parse_feed, parse_google_news_feed
+
+ITEM = (
+    "<item>"
+    "<title>{title} - Reuters</title>"
+    "<link>https://news.google.com/rss/articles/CBMi{n}?oc=5</link>"
+    '<guid isPermaLink="false">CBMi{n}</guid>'
+    "<pubDate>Mon, 06 May 2024 08:{n:02d}:00 GMT</pubDate>"
+    "<description>&lt;a href=&quot;x&quot;&gt;{title}&lt;/a&gt;</description>"
+    '<source url="https://www.reuters.com">Reuters</source>'
+    "</item>"
+)
+
+
+def feed(*items):
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<rss version="2.0" xmlns:media="http://search.yahoo.com/mrss/">'
+        "<channel><title>\"gaza war\" - Google News</title>"
+        "<link>https://news.google.com/search?q=gaza</link>"
+        + "".join(items)
+        + "</channel></rss>"
+    )
+
+
+def test_parses_entry_fields():
+    text = feed(
+        ITEM.format(title="Markets &amp; rates", n=1),
+        "<item><title><![CDATA[Talks <resume>]]></title>"
+        "<link>https://news.google.com/rss/articles/CBMi2</link>"
+        "<guid>CBMi2</guid></item>",
+    )
+    first, second = parse_google_news_feed(text)["entries"]
+    assert first == {
+        "id": "CBMi1",
+        "link": "https://news.google.com/rss/articles/CBMi1?oc=5",
+        "title": "Markets & rates - Reuters",
+        "published": "Mon, 06 May 2024 08:01:00 GMT",
+        "source": {"href": "https://www.reuters.com", "title": "Reuters"},
+    }
+    assert second["title"] == "Talks <resume>"
+    assert second["published"] is None
+    assert second["source"] == {"href": None, "title": None}
+
+
+def test_parses_feeds_larger_than_a_chunk():
+    items = [ITEM.format(title=f"Story {n}", n=n) for n in range(300)]
+    text = feed(*items)
+    assert len(text) > 3 * CHUNK_SIZE
+    entries = parse_google_news_feed(text)["entries"]
+    assert [entry["id"] for entry in entries] == [f"CBMi{n}" for n in range(300)]
+
+
+def test_empty_feed():
+    assert parse_google_news_feed(feed()) == {"entries": []}
+
+
+def test_malformed_feed_raises():
+    with pytest.raises(ET.ParseError):
+        parse_google_news_feed(feed(ITEM.format(title="Cut", n=1))[:-30])
+
+
+def test_same_fields_as_feedparser():
+    feedparser = pytest.importorskip("feedparser")
+    text = feed(*[ITEM.format(title=f"Story {n}", n=n) for n in range(5)])
+    expected = feedparser.parse(text)["entries"]
+    entries = parse_google_news_feed(text)["entries"]
+    assert len(entries) == len(expected)
+    for entry, reference in zip(entries, expected):
+        for field in ("id", "link", "title", "published"):
+            assert entry[field] == reference[field]
+        assert entry["source"]["title"] == reference["source"]["title"]
+        assert entry["source"]["href"] == reference["source"]["href"]
+
+
+def test_parse_feed_falls_back_to_feedparser():
+    pytest.importorskip("feedparser")
+    # An unescaped ampersand, as some feeds carry, is no well-formed XML
+    text = feed(ITEM.format(title="Markets & rates", n=1))
+    entries = parse_feed(text)["entries"]
+    assert [entry["title"] for entry in entries] == ["Markets & rates - Reuters"]
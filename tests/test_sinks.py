@@ -0,0 +1,67 @@
+import gzip
+import json
+import time
+
+from progress_journal import ProgressJournal
+from sinks import JSONLSink
+from writer import BackgroundWriter
+
+
+def record(n):
+    return {"URL": f"https://example.com/{n}", "Title": f"Story {n}"}
+
+
+def test_gzip_file_stays_readable_across_flushes_and_resumes(tmp_path):
+    path = str(tmp_path / "articles.jsonl.gz")
+    sink = JSONLSink(path, compression="gzip")
+    sink.write(record(0))
+    sink.flush()
+    sink.write(record(1))
+    sink.flush()
+    # A crash here leaves no open member behind; a resume appends new ones
+    resumed = JSONLSink(path, compression="gzip")
+    resumed.write(record(2))
+    resumed.close()
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        assert [json.loads(line) for line in f] == [record(n) for n in range(3)]
+
+
+class UnreadableUntilClosedSink:
+    durable_flush = False
+
+    def __init__(self) -> None:
+        self.closed = False
+
+    def write(self, record):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def journaled(path):
+    with open(path) as f:
+        return [json.loads(line)["url"] for line in f]
+
+
+def test_batches_of_unreadable_sinks_are_journaled_on_close(tmp_path):
+    journal_path = str(tmp_path / "progress.jsonl")
+    sink = UnreadableUntilClosedSink()
+    writer = BackgroundWriter(
+        [JSONLSink(str(tmp_path / "articles.jsonl")), sink],
+        journal=ProgressJournal(journal_path),
+        max_batch_size=1,
+    )
+    writer.start()
+    writer.put(record(0))
+    writer.put(record(1))
+    # Both batches are flushed, but not journaled while the part is open
+    while writer.records_written < 2:
+        time.sleep(0.01)
+    assert journaled(journal_path) == []
+    writer.close()
+    assert sink.closed
+    assert journaled(journal_path) == [record(n)["URL"] for n in range(2)]
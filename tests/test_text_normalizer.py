@@ -0,0 +1,33 @@
+import json
+import os
+
+import pytest
+
+from text_normalizer import NormalizationEngine
+
+# Texts and the output of DataFetcher.add_punctuation_whitespace before it
+# moved to NormalizationEngine
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+GOLDEN_PATH = os.path.join(FIXTURES, "text_normalizer_golden.json")
+
+with open(GOLDEN_PATH) as f:
+    GOLDEN = json.load(f)
+
+
+@pytest.fixture(scope="module")
+def engine():
+    pytest.importorskip("nltk")
+    try:
+        return NormalizationEngine()
+    except LookupError:
+        pytest.skip("the nltk Punkt model is not installed")
+
+
+@pytest.mark.parametrize("case", GOLDEN, ids=lambda case: case["text"][:30])
+def test_normalize_matches_the_former_output(engine, case):
+    assert engine.normalize(case["text"]) == case["expected"]
+
+
+def test_normalize_many_keeps_the_order(engine):
+    texts = [case["text"] for case in GOLDEN]
+    assert engine.normalize_many(texts) == [case["expected"] for case in GOLDEN]
@@ -0,0 +1,92 @@
+import re
+import threading
+
+# Punctuation glued to the next word: "end.Next" -> "end. Next"
+PUNCTUATION_SPACING = re.compile(r"(?<=[^\s\d])([.!?,;:])(?=[^\s\d])")
+# Fix edge case with numbers and currency: "1 000" -> "1,000"
+THOUSANDS_SEPARATOR = re.compile(r"(\d) (?=\d{3}([^\d]|$))")
+# Fix edge case with hyphenated words: "well - known" -> "well-known"
+HYPHENATED_WORD = re.compile(r"(\w) - (?=\w)")
+# Add whitespace after numbers followed by punctuation marks
+NUMBER_PUNCTUATION = re.compile(r"(?<=\d)([./-])(?=\D)")
+
+_normalizer = None
+_normalizer_lock = threading.Lock()
+
+
+def load_sentence_tokenizer(language="english"):
+    """
+    Loads the Punkt sentence tokenizer used by nltk.sent_tokenize once, so
+    tokenizing does not go through nltk's model lookup for every article.
+
+    Args:
+        language: Punkt model language
+
+    Returns:
+        tokenizer with a tokenize(text) method
+    """
+    try:
+        # nltk >= 3.8.2
+        from nltk.tokenize import PunktTokenizer
+
+        return PunktTokenizer(language)
+    except ImportError:
+        import nltk
+
+        return nltk.data.load(f"tokenizers/punkt/{language}.pickle")
+
+
+class NormalizationEngine:
+    """
+    Text normalization applied to every extracted article: sentences are
+    closed with a full stop and whitespace around punctuation and numbers is
+    fixed. Output is identical to the former per-call implementation of
+    DataFetcher.add_punctuation_whitespace.
+    """
+
+    def __init__(self, language="english") -> None:
+        self.tokenizer = load_sentence_tokenizer(language)
+
+    def normalize(self, text: str) -> str:
+        """
+        Args:
+            text: text to be processed
+
+        Returns:
+            text: processed text
+        """
+        sentences = self.tokenizer.tokenize(text)
+        text = " ".join(
+            sentence if sentence[-1] in ".!?" else sentence + "."
+            for sentence in sentences
+        )
+        # The substitutions feed into each other, so they stay separate passes
+        text = PUNCTUATION_SPACING.sub(r"\1 ", text)
+        text = THOUSANDS_SEPARATOR.sub(r"\1,", text)
+        text = HYPHENATED_WORD.sub(r"\1-", text)
+        text = NUMBER_PUNCTUATION.sub(r"\1 ", text)
+        return text
+
+    def normalize_many(self, texts):
+        """
+        Args:
+            texts: iterable of texts
+
+        Returns:
+            list of processed texts, in order
+        """
+        normalize = self.normalize
+        return [normalize(text) for text in texts]
+
+
+def get_normalizer():
+    """
+    Returns:
+        the NormalizationEngine of this process, created on first use
+    """
+    global _normalizer
+    if _normalizer is None:
+        with _normalizer_lock:
+            if _normalizer is None:
+                _normalizer = NormalizationEngine()
+    return _normalizer
@@ -1,22 +1,157 @@
 import urllib.parse
 import datetime
-import asyncio
-import feedparser
 import re
-import base64
+import asyncio
 import aiohttp
 import json
-import tqdm
 import os
-
-RETRY_LIMIT = 3
+import queue
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from gnews_decoder import GoogleNewsDecoder
+from rss_parser import EXECUTOR_THRESHOLD, parse_feed
+from metrics import domain_of, get_metrics, trace_config
+from query_state import WatermarkTracker
+from near_duplicates import NearDuplicateTitles
+from records import DiscoveredArticle, RejectedURL, to_dict
+from progress_journal import REJECTED
+from retry import (
+    RETRYABLE,
+    RETRY_LIMIT,
+    ParseError,
+    RequestFailed,
+    backoff_delay,
+    classify,
+    rejection_report,
+    retry_after_of,
+    should_retry,
+    status_of,
+)
+
+GOOGLE_NEWS_RSS_URL = "https://news.google.com/rss"
 SIMULTANEOUS_REQUESTS = 50
+REQUESTS_PER_HOST = 20
+ARTICLE_QUEUE_SIZE = 1000
+REQUEST_TIMEOUT = 30
+CONNECT_TIMEOUT = 10
+DNS_CACHE_TTL = 300
+KEEPALIVE_TIMEOUT = 30
+# Feeds change quickly; cached feeds older than this are revalidated
+FEED_CACHE_TTL = 3600
+# Google News RSS returns at most about this many entries per feed
+FEED_RESULT_CAP = 100
+SPARSE_WINDOW_ENTRIES = 10
+MIN_WINDOW_DAYS = 1
+MAX_WINDOW_DAYS = 30
+# Incremental runs start this far before the watermark; the query syntax only
+# has day granularity and overlapping articles are dropped by the seen index.
+INCREMENTAL_OVERLAP = datetime.timedelta(days=1)
+# Google News appends the publisher to every title: "Headline - Publisher"
+TITLE_SOURCE_SUFFIX = re.compile(r"\s+-\s+[^-]+$")
+TITLE_PUNCTUATION = re.compile(r"[^\w\s]+")
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_title(title, source=None):
+    """
+    Key under which syndicated copies of a story are grouped before download.
+
+    Args:
+        title: feed title of the entry
+        source: publisher name of the entry, if known
+
+    Returns:
+        key: lowercase title without publisher suffix and punctuation, "" when
+            there is no title
+    """
+    if not title:
+        return ""
+    if source and title.endswith(f" - {source}"):
+        title = title[: -len(source) - 3]
+    else:
+        title = TITLE_SOURCE_SUFFIX.sub("", title)
+    title = TITLE_PUNCTUATION.sub(" ", title.lower())
+    return WHITESPACE.sub(" ", title).strip()
 
 
 class URL_FETCHER:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        simultaneous_requests=SIMULTANEOUS_REQUESTS,
+        requests_per_host=REQUESTS_PER_HOST,
+        request_timeout=REQUEST_TIMEOUT,
+        connect_timeout=CONNECT_TIMEOUT,
+        seen_index=None,
+        query_state=None,
+        adaptive_windows=True,
+        cache=None,
+        decoder=None,
+        max_per_title=None,
+        metrics=None,
+        rss_base_url=GOOGLE_NEWS_RSS_URL,
+    ) -> None:
         self.scrapped_article_details = []
+        self.unique_links = {}
+        self.total_links_found = 0
+        self.new_articles = 0
+        self.skipped_seen_links = 0
+        # Feeds given up on after their retries, as RejectedURL
+        self.rejected_feeds = []
+        # Articles downloaded per group of near-identical titles; None
+        # downloads them all
+        self.max_per_title = max_per_title
+        self.near_titles = NearDuplicateTitles()
+        self.title_groups = {}
+        self.skipped_title_duplicates = 0
+        self.seen_index = seen_index
+        self.query_state = query_state
+        self.url_queries = {}
+        # A watermark only moves once every new article of its window has
+        # an outcome in the progress journal (see articles_done)
+        self.watermarks = WatermarkTracker()
+        self.adaptive_windows = adaptive_windows
+        self.cache = cache
+        self.decoder = decoder or GoogleNewsDecoder()
+        self.window_stats = {}
         self.request_success_counter = 0
+        self.simultaneous_requests = simultaneous_requests
+        self.requests_per_host = requests_per_host
+        self.request_timeout = request_timeout
+        self.connect_timeout = connect_timeout
+        self.session = None
+        self.semaphore = None
+        self.on_article = None
+        # iter_articles keeps only the links of emitted articles, not the
+        # records, so memory does not grow with the size of the run
+        self.retain_articles = True
+        self.metrics = metrics or get_metrics()
+        # Points at a local stand-in server in the benchmarks
+        self.rss_base_url = rss_base_url
+
+    def create_session(self):
+        """
+        Creates the shared aiohttp session used for every RSS request of a run.
+        The connector keeps connections alive and caches DNS lookups so that
+        repeated queries to news.google.com reuse the same TLS connections.
+
+        Returns:
+            session: aiohttp.ClientSession
+        """
+        connector = aiohttp.TCPConnector(
+            limit=self.simultaneous_requests,
+            limit_per_host=self.requests_per_host,
+            ttl_dns_cache=DNS_CACHE_TTL,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=self.request_timeout, sock_connect=self.connect_timeout
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            trace_configs=[trace_config(self.metrics, "feed")],
+        )
 
     def generate_keyword_dicts(self, keywords, language="en", country="US"):
         """_summary_
@@ -44,21 +179,7 @@ class URL_FETCHER:
             link: article redirecting link; starts with https://news.google.com
         Returns: if the link is decoded successfully then returns the decoded link else returns the input link
         """
-        padding_factor = (4 - len(inp) % 4) % 4
-        inp += "=" * padding_factor
-        decoded_url = base64.urlsafe_b64decode(inp).decode("ISO-8859-1")
-        final_link = re.sub(
-            r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\xff]",
-            "",
-            decoded_url[decoded_url.find("http") :],
-        )
-        tag = final_link.split(":")[0]
-        repeaters = [m.start() for m in re.finditer(tag, final_link)]
-        if len(repeaters) > 1:
-            final_link = final_link[repeaters[1] :]
-        if final_link == "":
-            return link
-        return final_link
+        return self.decoder.decode(inp, link)
 
     def generate_google_news_url(self, query, when=None, lang="en", country="US"):
         """
@@ -73,7 +194,7 @@ class URL_FETCHER:
         Returns:
             final_url: URL to make request
         """
-        base_url = "https://news.google.com/rss"
+        base_url = self.rss_base_url
         keyword = query
         if when:
             query += when
@@ -82,113 +203,488 @@ class URL_FETCHER:
         final_url = base_url + "/search?q={}".format(query) + search_ceid
         return final_url, keyword
 
+    def generate_window_urls(self, data, after_datetime, before_datetime):
+        """
+        Generates the RSS URLs of one date window for every keyword of a
+        keyword dict and remembers which query and window each URL belongs to.
+
+        Args:
+            data: keyword dict from generate_keyword_dicts
+            after_datetime: start of the window
+            before_datetime: end of the window
+
+        Returns:
+            result: list of (url, keyword) tuples
+        """
+        after_date = "{:%Y-%m-%d}".format(after_datetime)
+        before_date = "{:%Y-%m-%d}".format(before_datetime)
+        query_when = " after:" + after_date + " before:" + before_date
+        result = [
+            self.generate_google_news_url(
+                query=k,
+                lang=data["language"],
+                country=data["country"],
+                when=query_when,
+            )
+            for k in data["keywords"]
+        ]
+        for url, keyword in result:
+            self.url_queries[url] = {
+                "keyword": keyword,
+                "language": data["language"],
+                "country": data["country"],
+                "after": after_datetime,
+                "before": before_datetime,
+            }
+        return result
+
     def transform_keywords_to_urls(
         self, scraper_keys, start_date=None, end_date=None, timedelta=3
     ):
         final_url_list = []
-        query_list = []
         for data in scraper_keys:
             today_date_datetime = start_date
+            query_end_date = data.get("end_date", end_date)
+            query_timedelta = data.get("timedelta", timedelta)
             for _ in range(10000):
-                if today_date_datetime < end_date:
+                if today_date_datetime < query_end_date:
                     break
 
-                today_date = "{:%Y-%m-%d}".format(today_date_datetime)
                 prior_date_3_datetime = today_date_datetime - datetime.timedelta(
-                    days=timedelta
+                    days=query_timedelta
                 )
-                prior_date_3 = "{:%Y-%m-%d}".format(prior_date_3_datetime)
-                query_when = " after:" + prior_date_3 + " before:" + today_date
-
-                # print(query_when)
-                result = [
-                    self.generate_google_news_url(
-                        query=k,
-                        lang=data["language"],
-                        country=data["country"],
-                        when=query_when,
+                final_url_list.extend(
+                    self.generate_window_urls(
+                        data, prior_date_3_datetime, today_date_datetime
                     )
-                    for k in data["keywords"]
-                ]
-                final_url_list.extend(result)
-                query_list.extend([query_when * len(result)])
+                )
 
                 today_date_datetime = prior_date_3_datetime
 
         return final_url_list
 
-    async def make_request_basic(self, url, keyword, retry_counter=RETRY_LIMIT):
-        # Hit the URL and get the response without session
+    async def make_request_basic(self, url, keyword, retry_limit=RETRY_LIMIT):
+        """
+        Requests a feed and adds its articles. Network errors, 5xx and 429
+        answers are retried after a jittered exponential backoff; the wait
+        happens outside the request semaphore, so other feeds go ahead in the
+        meantime. Feeds given up on are added to rejected_feeds.
+
+        Args:
+            url: RSS URL
+            keyword: keyword of the query
+            retry_limit: retries after the first attempt
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                await self.request_feed(url, keyword)
+                return
+            except Exception as e:
+                reason = classify(e)
+                status = status_of(e)
+                print(
+                    "ERROR",
+                    f"error in fetching data ({reason}). Error: {e}",
+                    keyword,
+                    url,
+                )
+                if status is not None:
+                    self.count_request(url, status)
+                retry_after = retry_after_of(e)
+                if should_retry(reason, attempt, retry_after, retry_limit):
+                    self.count_request(url, "retry")
+                    await asyncio.sleep(backoff_delay(attempt - 1, retry_after))
+                    continue
+                self.count_request(url, "rejected")
+                if self.query_state is not None and url in self.url_queries:
+                    self.watermarks.hold_window(url, *self.window_of(url))
+                self.rejected_feeds.append(
+                    RejectedURL(
+                        url,
+                        keyword,
+                        reason=reason,
+                        status=status,
+                        error=f"{type(e).__name__}: {e}",
+                        attempts=attempt,
+                    )
+                )
+                return
+
+    async def request_feed(self, url, keyword):
+        text, status = await self.fetch_feed(url)
+        started = time.perf_counter()
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as resp:
-                    text = await resp.text()
-                    feed = feedparser.parse(text)
-                    if resp.status == 200:
-                        self.request_success_counter += 1
-                    if len(feed["entries"]) > 0:
-                        print(
-                            "SUCCESS",
-                            f"successfully found: {len(feed['entries'])}. ",
-                            f"response status code-> {resp.status}",
-                            keyword,
-                            url,
-                        )
-                        self.scrapped_article_details.extend(
-                            [
-                                {
-                                    "link": self.base64url_decoder(
-                                        data["id"], data["link"]
-                                    ),
-                                    "keyword": keyword,
-                                }
-                                for data in feed["entries"]
-                            ]
-                        )
-                await session.close()
-
-        except aiohttp.ClientError as e:
-            print(
-                "ERROR",
-                f"error in fetching data. Error: {e}",
-                keyword,
-                url,
-            )
-            if retry_counter > 0:
-                await self.make_request_basic(url, keyword, retry_counter - 1)
+            if len(text) > EXECUTOR_THRESHOLD:
+                # Keep the event loop free for the other feeds in flight
+                loop = asyncio.get_running_loop()
+                feed = await loop.run_in_executor(None, parse_feed, text)
+            else:
+                feed = parse_feed(text)
         except Exception as e:
+            raise ParseError(f"{type(e).__name__}: {e}") from e
+        self.metrics.observe("feed_parse_seconds", time.perf_counter() - started)
+        self.count_request(url, status)
+        if status == 200:
+            self.request_success_counter += 1
+        if len(feed["entries"]) > 0:
             print(
-                "ERROR",
-                f"error in fetching data. Error: {e}",
+                "SUCCESS",
+                f"successfully found: {len(feed['entries'])}. ",
+                f"response status code-> {status}",
                 keyword,
                 url,
             )
+            links = self.decoder.decode_batch(feed["entries"])
+            articles = [
+                DiscoveredArticle(
+                    link,
+                    keyword,
+                    title=entry.get("title"),
+                    source=(entry.get("source") or {}).get("title"),
+                    published=entry.get("published"),
+                )
+                for link, entry in zip(links, feed["entries"])
+            ]
+            seen_links = None
+            if self.seen_index is not None:
+                # One query per feed, off the event loop
+                loop = asyncio.get_running_loop()
+                seen_links = await loop.run_in_executor(
+                    None,
+                    self.seen_index.seen_many,
+                    [link for link in links if link not in self.unique_links],
+                )
+            self.add_articles(articles, seen_links)
+            if self.query_state is not None:
+                self.hold_watermark(url, feed["entries"], links)
+        if status == 200 and self.adaptive_windows:
+            await self.split_saturated_window(url, len(feed["entries"]))
+
+    def count_request(self, url, status):
+        self.metrics.inc(
+            "requests_total", stage="feed", domain=domain_of(url), status=status
+        )
 
-    async def create_requests(self, url_list):
-        # Create couroutine for each URL
-        asyncio.Semaphore(SIMULTANEOUS_REQUESTS)
-        tasks = []
-        for url, keyword in url_list:
-            tasks.append(self.make_request_basic(url, keyword))
+    async def fetch_feed(self, url):
+        """
+        Downloads a feed through the HTTP cache when one is set. Fresh cached
+        feeds are used without a request, stale ones are revalidated with a
+        conditional request.
 
-        return await asyncio.gather(*tasks)
+        Args:
+            url: RSS URL
 
-    def keep_only_unique_links(self):
-        # Keep only unique links in self.scrapped_article_details
-        unique_links = []
-        for data in tqdm.tqdm(self.scrapped_article_details):
-            if data["link"] not in unique_links:
-                unique_links.append(data["link"])
+        Returns:
+            (text, status): feed body and HTTP status
+
+        Raises:
+            RequestFailed: for an HTTP error status
+        """
+        cached = None
+        if self.cache is not None:
+            cached = await self.cache.get_async(url)
+        if cached is not None and cached.is_fresh(FEED_CACHE_TTL):
+            self.metrics.inc("cache_hits_total", stage="feed", result="fresh")
+            return cached.text(), 200
+
+        request_headers = cached.conditional_headers() if cached is not None else {}
+        async with self.semaphore:
+            async with self.session.get(url, headers=request_headers) as resp:
+                if resp.status == 304 and cached is not None:
+                    self.metrics.inc(
+                        "cache_hits_total", stage="feed", result="revalidated"
+                    )
+                    await self.cache.revalidated_async(url)
+                    return cached.text(), 200
+                if resp.status >= 400:
+                    raise RequestFailed(resp.status, resp.headers.get("Retry-After"))
+                started = time.perf_counter()
+                text = await resp.text()
+                self.metrics.observe(
+                    "http_phase_seconds",
+                    time.perf_counter() - started,
+                    stage="feed",
+                    phase="download",
+                )
+                if resp.status == 200 and self.cache is not None:
+                    await self.cache.store_async(url, await resp.read(), resp.headers)
+                return text, resp.status
+
+    def add_articles(self, articles, seen_links=None):
+        """
+        Dedups newly discovered articles by link as soon as their feed is
+        decoded. The first occurrence of a link is kept and the keywords of
+        later duplicates are merged into its "keywords" list. Links already
+        present in the seen index are dropped, and so are articles over
+        max_per_title for their group of near-identical titles. New articles
+        are handed to the on_article callback when one is set.
+
+        Args:
+            articles: list of DiscoveredArticle
+            seen_links: links of articles present in the seen index, looked
+                up here in one query when not given
+        """
+        if seen_links is None and self.seen_index is not None:
+            seen_links = self.seen_index.seen_many(
+                article["link"]
+                for article in articles
+                if article["link"] not in self.unique_links
+            )
+        for article in articles:
+            self.total_links_found += 1
+            link = article["link"]
+            if link in self.unique_links:
+                existing = self.unique_links[link]
+                if (
+                    existing is not None
+                    and article["keyword"] not in existing["keywords"]
+                ):
+                    existing["keywords"].append(article["keyword"])
+                continue
+            if seen_links and link in seen_links:
+                self.skipped_seen_links += 1
+                # Remember it so the index is queried once per link
+                self.unique_links[link] = None
+                continue
+            if self.max_per_title is not None and self.title_limit_reached(article):
+                self.unique_links[link] = None
+                continue
+            self.unique_links[link] = article if self.retain_articles else None
+            self.new_articles += 1
+            if self.query_state is not None:
+                # Before on_article, which may get it extracted right away
+                self.watermarks.add_link(link)
+            if self.on_article is not None:
+                self.on_article(article)
+
+    def title_limit_reached(self, article):
+        """
+        Counts the article in the group of near-identical titles it belongs
+        to: normalized titles whose word sets overlap by TITLE_SIMILARITY or
+        more, so a copy with a word changed or added still counts. Once the
+        group is full, the keyword of the article is merged into the first
+        article of the group and the article is skipped before any download.
+
+        Args:
+            article: newly discovered DiscoveredArticle
 
+        Returns:
+            True when the article should be skipped
+        """
+        key = normalize_title(article.get("title"), article.get("source"))
+        if not key:
+            return False
+        group_key = self.near_titles.group_of(key)
+        if group_key is None:
+            return False
+        group = self.title_groups.get(group_key)
+        if group is None:
+            self.title_groups[group_key] = [
+                1,
+                article if self.retain_articles else None,
+            ]
+            return False
+        if group[0] < self.max_per_title:
+            group[0] += 1
+            return False
+        first = group[1]
+        if first is not None and article["keyword"] not in first["keywords"]:
+            first["keywords"].append(article["keyword"])
+        self.skipped_title_duplicates += 1
+        return True
+
+    def window_of(self, url):
+        """
+        Returns:
+            (query, after): (keyword, language, country) of the window behind
+                url and its timezone aware start
+        """
+        query = self.url_queries[url]
+        after = query["after"]
+        if after.tzinfo is None:
+            after = after.astimezone()
+        return (query["keyword"], query["language"], query["country"]), after
+
+    def hold_watermark(self, url, entries, links):
+        """
+        Registers the window behind url with the newest publish time found in
+        its feed entries. Its query's watermark moves there in
+        save_watermarks, once every article of the feed found new in this run
+        has reached an outcome in the progress journal. A crash or a
+        rejection worth retrying keeps the watermark before the window, so
+        the next incremental run requests the window again.
+
+        Args:
+            url: RSS URL the entries were fetched from
+            entries: feed entries
+            links: decoded links of the entries
+        """
+        if url not in self.url_queries:
+            return
+        newest = None
+        for entry in entries:
+            try:
+                published = parsedate_to_datetime(entry.get("published"))
+            except (TypeError, ValueError):
+                continue
+            if published.tzinfo is None:
+                published = published.replace(tzinfo=datetime.timezone.utc)
+            if newest is None or published > newest:
+                newest = published
+        query, after = self.window_of(url)
+        self.watermarks.add_window(url, query, after, newest, links)
+
+    def articles_done(self, urls, status, reason=None):
+        """
+        on_progress callback of the DataFetcher extracting the discovered
+        articles. Rejections of a retryable class hold their windows back.
+
+        Args:
+            urls: article links journaled with the same outcome
+            status: journal status
+            reason: failure class of REJECTED links
+        """
+        self.watermarks.links_done(
+            urls, held=status == REJECTED and reason in RETRYABLE
+        )
+
+    def save_watermarks(self):
+        """
+        Moves the watermark of every query of this run as far as its
+        journaled windows allow; call it once extraction is over.
+        """
+        if self.query_state is not None:
+            self.watermarks.save_to(self.query_state)
+
+    async def split_saturated_window(self, url, number_of_entries):
+        """
+        Google News caps every feed at about FEED_RESULT_CAP entries, so a
+        window that comes back full has probably lost articles. Such windows
+        are bisected and both halves requested, recursively, until windows
+        reach MIN_WINDOW_DAYS. Every window outcome is also counted per query
+        to suggest a window size for later runs.
+
+        Args:
+            url: RSS URL of the window
+            number_of_entries: number of entries the feed returned
+        """
+        query = self.url_queries.get(url)
+        if query is None:
+            return
+        key = (query["keyword"], query["language"], query["country"])
+        stats = self.window_stats.setdefault(
+            key, {"window_days": None, "windows": 0, "saturated": 0, "sparse": 0}
+        )
+        window_days = (query["before"] - query["after"]).days
+        stats["windows"] += 1
+        if stats["window_days"] is None or window_days > stats["window_days"]:
+            stats["window_days"] = window_days
+        if number_of_entries < FEED_RESULT_CAP:
+            if number_of_entries < SPARSE_WINDOW_ENTRIES:
+                stats["sparse"] += 1
+            return
+
+        stats["saturated"] += 1
+        if window_days <= MIN_WINDOW_DAYS:
+            return
+        middle = query["after"] + datetime.timedelta(days=window_days // 2)
+        data = {
+            "keywords": [query["keyword"]],
+            "language": query["language"],
+            "country": query["country"],
+        }
+        print(
+            "INFO",
+            f"window of {window_days} days is saturated. Splitting.",
+            query["keyword"],
+        )
+        halves = self.generate_window_urls(data, query["after"], middle)
+        halves += self.generate_window_urls(data, middle, query["before"])
+        for half_url, _ in halves:
+            # A failed half is a failure of the window requested at first
+            self.url_queries[half_url]["window_url"] = query.get("window_url", url)
+        await asyncio.gather(
+            *[
+                self.make_request_basic(half_url, half_keyword)
+                for half_url, half_keyword in halves
+            ]
+        )
+
+    def save_window_hints(self):
+        """
+        Stores the suggested window size of every query of this run in the
+        query state: halved when a window was saturated, doubled when every
+        window came back sparse.
+        """
+        for (keyword, language, country), stats in self.window_stats.items():
+            if not stats["window_days"]:
+                continue
+            if stats["saturated"]:
+                window_days = max(MIN_WINDOW_DAYS, stats["window_days"] // 2)
+            elif stats["sparse"] == stats["windows"]:
+                window_days = min(MAX_WINDOW_DAYS, stats["window_days"] * 2)
+            else:
+                window_days = stats["window_days"]
+            self.query_state.set_window_days(keyword, language, country, window_days)
+
+    def apply_window_hints(self, keyword_dicts):
+        """
+        Uses the window size suggested by earlier runs for every keyword dict.
+
+        Args:
+            keyword_dicts: output of generate_keyword_dicts
+        """
+        for data in keyword_dicts:
+            window_days = self.query_state.get_window_days(
+                data["keywords"][0], data["language"], data["country"]
+            )
+            if window_days is not None:
+                data["timedelta"] = window_days
+
+    def apply_watermarks(self, keyword_dicts):
+        """
+        Narrows every keyword dict to the window after its watermark, or
+        extends it back to the watermark when the last run is older than the
+        requested window, so nothing between two runs is missed.
+
+        Args:
+            keyword_dicts: output of generate_keyword_dicts
+        """
+        for data in keyword_dicts:
+            watermark = self.query_state.get_watermark(
+                data["keywords"][0], data["language"], data["country"]
+            )
+            if watermark is None:
+                continue
+            # transform_keywords_to_urls works on naive local datetimes
+            watermark = watermark.astimezone().replace(tzinfo=None)
+            data["end_date"] = watermark - INCREMENTAL_OVERLAP
+
+    async def create_requests(self, url_list):
+        # Create couroutine for each URL, all sharing one session
+        self.semaphore = asyncio.Semaphore(self.simultaneous_requests)
+        async with self.create_session() as session:
+            self.session = session
+            tasks = []
+            for url, keyword in url_list:
+                tasks.append(self.make_request_basic(url, keyword))
+
+            try:
+                return await asyncio.gather(*tasks)
+            finally:
+                self.session = None
+
+    def keep_only_unique_links(self):
+        # Dedup already happened in add_articles; keep discovery order
         self.scrapped_article_details = [
-            data
-            for data in self.scrapped_article_details
-            if data["link"] in unique_links
+            data for data in self.unique_links.values() if data is not None
         ]
 
     def save_to_json(self, data, filename):
         with open(filename, "w") as f:
-            json.dump(data, f, indent=4)
+            json.dump(data, f, indent=4, default=to_dict)
 
     def main(
         self,
@@ -200,6 +696,8 @@ class URL_FETCHER:
         langauges=["en"],
         countries=["US"],
         save_json=False,
+        on_article=None,
+        incremental=False,
     ):
         """_summary_
 
@@ -210,6 +708,10 @@ class URL_FETCHER:
             timedelta (int, optional): _description_. Defaults to 3.
             langauges (list, optional): _description_. Defaults to ['en'].
             countries (list, optional): _description_. Defaults to ['US'].
+            on_article (callable, optional): called with each unique article
+                dict as soon as it is discovered. Defaults to None.
+            incremental (bool, optional): only request the windows after the
+                watermark of each query. Needs query_state. Defaults to False.
 
         Returns:
             _type_: _description_
@@ -219,6 +721,7 @@ class URL_FETCHER:
             start_date = datetime.datetime.now()
             end_date = datetime.datetime.now() - datetime.timedelta(days=timedelta)
 
+        self.on_article = on_article
         keyword_dicts = []
 
         for langauge, country in zip(langauges, countries):
@@ -227,14 +730,37 @@ class URL_FETCHER:
                     keywords, language=langauge, country=country
                 )
             )
+        if incremental:
+            if self.query_state is None:
+                raise ValueError("incremental mode needs a query_state store")
+            self.apply_watermarks(keyword_dicts)
+        if self.adaptive_windows and self.query_state is not None:
+            self.apply_window_hints(keyword_dicts)
         final_url_list = self.transform_keywords_to_urls(
             keyword_dicts, start_date, end_date, timedelta
         )
+        print(f"Total feed requests to make: {len(final_url_list)}")
 
         asyncio.run(self.create_requests(final_url_list))
-        print(f"Total requests made: {len(self.scrapped_article_details)}")
+        if self.adaptive_windows and self.query_state is not None:
+            self.save_window_hints()
+        print(f"Total requests made: {self.total_links_found}")
         self.keep_only_unique_links()
-        print(f"Total unique links found: {len(self.scrapped_article_details)}")
+        print(f"Total unique links found: {self.new_articles}")
+        if self.seen_index is not None:
+            print(f"Links skipped as already extracted: {self.skipped_seen_links}")
+        if self.max_per_title is not None:
+            print(
+                "Links skipped as copies of the same title: "
+                f"{self.skipped_title_duplicates}"
+            )
+        if self.rejected_feeds:
+            print(f"Feeds given up on after retries: {len(self.rejected_feeds)}")
+            if save_path:
+                self.save_to_json(
+                    rejection_report(self.rejected_feeds),
+                    f"{save_path}/rejected_feeds.json",
+                )
 
         if save_json:
             save_filename = f"{save_path}/scrapped_raw_url.json"
@@ -243,6 +769,74 @@ class URL_FETCHER:
 
         return self.scrapped_article_details
 
+    def iter_articles(self, save_path=None, queue_size=ARTICLE_QUEUE_SIZE, **kwargs):
+        """
+        Generator version of main: yields every new article as soon as its feed
+        is decoded. Discovery runs in a background thread that pauses once
+        queue_size articles wait to be consumed, and only the links of yielded
+        articles are kept for dedup, so memory depends on the articles in
+        flight instead of the size of the run. Keywords of later duplicates
+        are not merged into articles already yielded.
+
+        Args:
+            save_path: run directory; articles are appended to
+                scrapped_raw_url.jsonl as they are yielded, and the file is
+                only put in place once discovery finished. Defaults to None.
+            queue_size: articles discovered ahead of the consumer
+            kwargs: forwarded to main
+
+        Yields:
+            DiscoveredArticle
+        """
+        article_queue = queue.Queue(maxsize=queue_size)
+        stopped = threading.Event()
+        errors = []
+
+        def on_article(article):
+            # Blocks the event loop of discovery while the consumer catches
+            # up; articles found after the consumer stopped are dropped
+            while not stopped.is_set():
+                try:
+                    article_queue.put(article, timeout=1)
+                    return
+                except queue.Full:
+                    continue
+
+        def discover():
+            try:
+                self.main(save_path=save_path, on_article=on_article, **kwargs)
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                on_article(None)
+
+        self.retain_articles = False
+        raw_url_file = None
+        if save_path is not None:
+            raw_url_file = open(f"{save_path}/scrapped_raw_url.jsonl.part", "w")
+        discovery_thread = threading.Thread(target=discover)
+        discovery_thread.start()
+        exhausted = False
+        try:
+            for article in iter(article_queue.get, None):
+                if raw_url_file is not None:
+                    raw_url_file.write(json.dumps(article.to_dict()) + "\n")
+                yield article
+            exhausted = True
+        finally:
+            stopped.set()
+            discovery_thread.join()
+            self.retain_articles = True
+            if raw_url_file is not None:
+                raw_url_file.close()
+                if exhausted and not errors:
+                    # A complete list is reused by main.resume
+                    os.replace(
+                        raw_url_file.name, f"{save_path}/scrapped_raw_url.jsonl"
+                    )
+        if errors:
+            raise errors[0]
+
 
 if __name__ == "__main__":
     url_fetcher = URL_FETCHER()
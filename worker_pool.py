@@ -0,0 +1,133 @@
+import queue
+import threading
+import time
+
+
+class WorkerStats:
+    def __init__(self, worker_id) -> None:
+        self.worker_id = worker_id
+        self.processed = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.busy_time = 0.0
+
+    def throughput(self, elapsed):
+        """
+        Args:
+            elapsed: seconds the pool has been running
+
+        Returns:
+            items processed per second
+        """
+        if elapsed <= 0:
+            return 0.0
+        return self.processed / elapsed
+
+    def __str__(self):
+        return (
+            f"worker {self.worker_id}: processed={self.processed} "
+            f"succeeded={self.succeeded} failed={self.failed} "
+            f"busy={self.busy_time:.1f}s"
+        )
+
+
+class WorkerPool:
+    """
+    Fixed number of worker threads fed from a bounded queue. submit blocks
+    while the queue is full, which pushes back on whatever produces the work,
+    so memory stays flat no matter how many items are submitted.
+    """
+
+    def __init__(
+        self, worker_function, number_of_workers=5, queue_size=None, task_queue=None
+    ):
+        """
+        Args:
+            worker_function: called with the submitted args; a truthy return
+                value counts as a success in the worker stats
+            number_of_workers: number of worker threads
+            queue_size: max pending items. Defaults to 2 * number_of_workers
+            task_queue: queue-like object with put, get and task_done (and
+                optionally clear) to use instead of a FIFO queue, e.g. a
+                politeness.DomainScheduler
+        """
+        self.worker_function = worker_function
+        self.number_of_workers = number_of_workers
+        if task_queue is None:
+            task_queue = queue.Queue(maxsize=queue_size or 2 * number_of_workers)
+        self.queue = task_queue
+        self.stop_event = threading.Event()
+        self.worker_stats = [WorkerStats(i) for i in range(number_of_workers)]
+        self.threads = []
+        self.start_time = None
+
+    def start(self):
+        self.start_time = time.monotonic()
+        for worker_id in range(self.number_of_workers):
+            t = threading.Thread(
+                target=self._worker, args=(worker_id,), daemon=True
+            )
+            self.threads.append(t)
+            t.start()
+
+    def _worker(self, worker_id):
+        stats = self.worker_stats[worker_id]
+        while True:
+            args = self.queue.get()
+            try:
+                if args is None:
+                    return
+                if self.stop_event.is_set():
+                    # Shutting down: drain the queue without doing the work
+                    continue
+                started = time.monotonic()
+                try:
+                    ok = self.worker_function(*args)
+                except Exception as e:
+                    print("ERROR", f"worker {worker_id} failed. Error: {e}")
+                    ok = False
+                stats.busy_time += time.monotonic() - started
+                stats.processed += 1
+                if ok:
+                    stats.succeeded += 1
+                else:
+                    stats.failed += 1
+            finally:
+                self.queue.task_done()
+
+    def submit(self, *args):
+        # Blocks while the queue is full
+        self.queue.put(args)
+
+    def shutdown(self, cancel_pending=False):
+        """
+        Stops the workers once the queue is drained.
+
+        Args:
+            cancel_pending: skip items that are still queued instead of
+                processing them
+        """
+        if cancel_pending:
+            self.stop_event.set()
+            clear = getattr(self.queue, "clear", None)
+            if clear is not None:
+                clear()
+        for _ in self.threads:
+            self.queue.put(None)
+        for t in self.threads:
+            t.join()
+
+    def print_stats(self):
+        elapsed = time.monotonic() - self.start_time if self.start_time else 0
+        total = sum(stats.processed for stats in self.worker_stats)
+        print(f"[INFO] Worker pool processed {total} items in {elapsed:.1f}s")
+        for stats in self.worker_stats:
+            print(f"[INFO] {stats} ({stats.throughput(elapsed):.2f}/s)")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.shutdown(cancel_pending=exc_type is not None)
+        return False
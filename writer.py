@@ -0,0 +1,145 @@
+import queue
+import threading
+import time
+import traceback
+
+from progress_journal import EXTRACTED
+
+FLUSH_INTERVAL = 30
+
+
+class WriterError(Exception):
+    """
+    Raised by BackgroundWriter.put and check once a flush failed, so the run
+    stops instead of piling up records that are never written.
+    """
+
+
+class BackgroundWriter:
+    """
+    Single writer thread between the extraction workers and the sinks.
+    Workers only put finished records on a queue; the writer appends them to
+    the sinks and flushes a batch once it holds max_batch_size records or
+    flush_interval seconds have passed. Because one thread owns the batch,
+    every record is written exactly once no matter how many workers run.
+
+    A batch is journaled as extracted once every sink holds it on disk:
+    right after the flush, or on close for sinks whose flushes leave nothing
+    readable (durable_flush False, like Parquet parts).
+    """
+
+    def __init__(
+        self,
+        sinks,
+        journal=None,
+        seen_index=None,
+        max_batch_size=500,
+        flush_interval=FLUSH_INTERVAL,
+        first_batch=0,
+    ) -> None:
+        """
+        Args:
+            sinks: opened sinks, see sinks.create_sinks
+            journal: progress journal; URLs are marked extracted after their
+                batch is flushed
+            seen_index: seen URL index updated after each flush
+            max_batch_size: records per batch
+            flush_interval: max seconds a record waits before being flushed
+            first_batch: number of the first batch
+        """
+        self.sinks = sinks
+        self.journal = journal
+        self.seen_index = seen_index
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.current_batch = first_batch
+        self.records_written = 0
+        self.queue = queue.Queue()
+        self.batch = []
+        # (batch, URLs) flushed to sinks that are only readable once closed
+        self.unjournaled = []
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def put(self, record):
+        # Never blocks, so workers do not wait on disk I/O
+        self.check()
+        self.queue.put(record)
+
+    def check(self):
+        """
+        Raises:
+            WriterError: once a flush to the sinks failed
+        """
+        if self.error is not None:
+            raise WriterError(
+                f"writing to the sinks failed: {self.error}"
+            ) from self.error
+
+    def qsize(self):
+        return self.queue.qsize()
+
+    def _run(self):
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                record = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                record = False
+            if record is None:
+                self._flush()
+                return
+            if record and self.error is None:
+                # Records queued before a failed flush was noticed are
+                # dropped; they are not journaled, so a resume redoes them
+                self.batch.append(record)
+            if len(self.batch) >= self.max_batch_size or time.monotonic() >= deadline:
+                self._flush()
+                deadline = time.monotonic() + self.flush_interval
+
+    def _flush(self):
+        if not self.batch or self.error is not None:
+            return
+        try:
+            for sink in self.sinks:
+                for record in self.batch:
+                    sink.write(record)
+                sink.flush()
+            urls = [record["URL"] for record in self.batch]
+            if all(sink.durable_flush for sink in self.sinks):
+                self._journal(urls, self.current_batch)
+            else:
+                self.unjournaled.append((self.current_batch, urls))
+        except Exception as e:
+            # Keep the batch; put and check raise from now on, and close
+            # re-raises, so the run does not go on without writing
+            traceback.print_exc()
+            self.error = e
+            return
+        self.records_written += len(self.batch)
+        self.current_batch += 1
+        self.batch = []
+
+    def _journal(self, urls, batch):
+        # The batch is on disk, so its URLs never need extracting again
+        if self.journal is not None:
+            self.journal.record_many(urls, EXTRACTED, batch=batch)
+        if self.seen_index is not None:
+            self.seen_index.add_many(urls)
+
+    def close(self):
+        """
+        Flushes what is left, stops the writer and closes the sinks.
+        """
+        self.queue.put(None)
+        self.thread.join()
+        for sink in self.sinks:
+            sink.close()
+        for batch, urls in self.unjournaled:
+            self._journal(urls, batch)
+        self.unjournaled = []
+        if self.error is not None:
+            raise self.error